@@ -1,39 +1,86 @@
-from openai import AsyncClient
-from openai.types import ImagesResponse
-from openai.types.chat import ChatCompletion
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional
 
 from config_data import config
+from utils.metrics import track_upstream
 
-client = AsyncClient(
-    api_key=config.PROXY_API_KEY,
-    base_url=config.PROXY_API_BASE_URL,
-)
+if TYPE_CHECKING:
+    from openai import AsyncClient
+    from openai.types import ImagesResponse
+    from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
 
 
-async def gpt_text(req: str) -> ChatCompletion:
+@lru_cache(maxsize=None)
+def get_client() -> "AsyncClient":
+    """
+    Возвращает клиент OpenAI-совместимого API. Библиотека openai загружается при первом запросе к модели.
+    """
+    from openai import AsyncClient
+
+    return AsyncClient(
+        api_key=config.PROXY_API_KEY,
+        base_url=config.PROXY_API_BASE_URL,
+    )
+
+
+async def gpt_text(req: str, history: Optional[List["ChatCompletionMessageParam"]] = None) -> "ChatCompletion":
     """
     Асинхронная функция для получения текстового ответа от модели GPT-3.5.
     Args:
         req (str): Входной запрос пользователя.
+        history (Optional[List[ChatCompletionMessageParam]]): Контекст диалога (сообщения перед запросом).
     Returns:
         dict: Ответ модели в формате словаря.
     """
-    chat_completion = await client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": req,
-            }
-        ],
-        model="gpt-3.5-turbo",
-    )
+    async with track_upstream("openai", "chat_completion"):
+        chat_completion = await get_client().chat.completions.create(
+            messages=[
+                *(history or []),
+                {
+                    "role": "user",
+                    "content": req,
+                }
+            ],
+            model="gpt-3.5-turbo",
+        )
 
     return chat_completion
     # return {"choices": [choice["message"]["content"] for choice in chat_completion["choices"]]}
 
 
+async def gpt_summarize(summary: str, dialogue: str, max_tokens: int) -> "ChatCompletion":
+    """
+    Асинхронная функция для обновления краткого содержания диалога с учетом новых реплик.
+    Args:
+        summary (str): Текущее краткое содержание (может быть пустым).
+        dialogue (str): Новые реплики диалога.
+        max_tokens (int): Максимальная длина краткого содержания в токенах.
+    Returns:
+        ChatCompletion: Ответ модели с обновленным кратким содержанием.
+    """
+    async with track_upstream("openai", "summary"):
+        chat_completion = await get_client().chat.completions.create(
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Обнови краткое содержание диалога пользователя с ассистентом с учетом новых реплик. "
+                               "Сохрани факты, имена, решения и открытые вопросы, нужные для продолжения диалога. "
+                               "Ответь только кратким содержанием.",
+                },
+                {
+                    "role": "user",
+                    "content": f"Краткое содержание:\n{summary or '(пусто)'}\n\nНовые реплики:\n{dialogue}",
+                },
+            ],
+            model="gpt-3.5-turbo",
+            max_tokens=max_tokens,
+        )
+
+    return chat_completion
+
+
 # This function is workable but API it uses is not free, so we use free Kandinsky API instead
-async def gpt_image(req: str) -> ImagesResponse:
+async def gpt_image(req: str) -> "ImagesResponse":
     """
     Асинхронная функция для генерации изображения с использованием модели DALL-E-3.
     Args:
@@ -41,12 +88,13 @@ async def gpt_image(req: str) -> ImagesResponse:
     Returns:
         ImagesResponse: Ответ модели с изображением.
     """
-    response = await client.images.generate(
-        model="dall-e-3",
-        prompt=req,
-        size="1024x1024",
-        quality="standard",
-        n=1,
-    )
+    async with track_upstream("openai", "image"):
+        response = await get_client().images.generate(
+            model="dall-e-3",
+            prompt=req,
+            size="1024x1024",
+            quality="standard",
+            n=1,
+        )
 
     return response
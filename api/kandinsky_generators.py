@@ -1,12 +1,16 @@
+import asyncio
 import json
-import time
-import requests
+import aiohttp
 from typing import Any
 
+from utils.loguru_logger import log
+from utils.metrics import UPSTREAM_ERRORS, track_upstream
+
 
 class Text2ImageAPI:
     """
     Класс для взаимодействия с API генерации изображений на основе текста.
+    Все запросы выполняются асинхронно (aiohttp) и не блокируют цикл событий.
 
     :param url: URL API.
     :param api_key: Ключ API.
@@ -18,6 +22,20 @@ class Text2ImageAPI:
             'X-Key': f'Key {api_key}',
             'X-Secret': f'Secret {secret_key}',
         }
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers=self.AUTH_HEADERS,
+                                                  timeout=aiohttp.ClientTimeout(total=60))
+        return self._session
+
+    async def close(self) -> None:
+        """
+        Закрывает HTTP-сессию клиента.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
 
     async def get_model(self) -> int:
         """
@@ -25,10 +43,10 @@ class Text2ImageAPI:
 
         :return: ID модели.
         """
-        response = requests.get(self.URL + 'key/api/v1/models', headers=self.AUTH_HEADERS)
-        data = response.json()
-        # for debugging
-        print(data)
+        async with track_upstream("fusionbrain", "get_model"):
+            async with self._get_session().get(self.URL + 'key/api/v1/models') as response:
+                data = await response.json(content_type=None)
+        log.debug("Kandinsky models: {}", data)
         if isinstance(data, list) and len(data) > 0 and 'id' in data[0] and isinstance(data[0]['id'], int):
             # returns id of model Kandinsky 3.1 (the only one which currently supports connection via API)
             return data[0]['id']
@@ -36,7 +54,7 @@ class Text2ImageAPI:
 
     async def generate(self, prompt: str, model: int, images: int = 1,
                        width: int = 1024, height: int = 1024,
-                       attempts: int = 10, delay: int = 10) -> tuple[str | None, ...] | None:
+                       attempts: int = 10, delay: int = 10) -> str | None:
         """
         Генерирует изображение на основе текстового запроса.
 
@@ -59,26 +77,22 @@ class Text2ImageAPI:
             }
         }
 
-        # data = {
-        #     'model_id': (None, model),
-        #     'params': (None, json.dumps(params), 'application/json')
-        # }
-        
-        data = {
-            'model_id': (None, str(model)),
-            'params': (None, json.dumps(params), 'application/json')
-        }
-        
-        # for debugging
-        while data.get('uuid') is None and attempts > 0:
-            # response = requests.post(self.URL + 'key/api/v1/text2image/run', headers=self.AUTH_HEADERS, files=data)
-            response = requests.post(self.URL + 'key/api/v1/text2image/run', headers=self.AUTH_HEADERS, files=data)
-            data = response.json()
-            print('Response from generate() function (data):', data)
+        while attempts > 0:
+            form = aiohttp.FormData()
+            form.add_field('model_id', str(model))
+            form.add_field('params', json.dumps(params), content_type='application/json')
+            async with track_upstream("fusionbrain", "generate"):
+                async with self._get_session().post(self.URL + 'key/api/v1/text2image/run', data=form) as response:
+                    data = await response.json(content_type=None)
+            log.debug("Response from generate(): {}", data)
+            if isinstance(data, dict) and data.get('uuid') is not None:
+                return data['uuid']
+            UPSTREAM_ERRORS.inc(api="fusionbrain", operation="generate", error="no_uuid")
             attempts -= 1
-            time.sleep(delay)
-        
-        return data.get('uuid')
+            if attempts:
+                await asyncio.sleep(delay)
+
+        return None
 
     async def check_generation(self, request_id: str, attempts: int = 15, delay: int = 10) -> Any:
         """
@@ -90,13 +104,14 @@ class Text2ImageAPI:
         :return: Данные изображения или None, если генерация не завершена.
         """
         while attempts > 0:
-            response = requests.get(self.URL + 'key/api/v1/text2image/status/' + request_id, headers=self.AUTH_HEADERS)
-            data = response.json()
+            async with track_upstream("fusionbrain", "check_generation"):
+                async with self._get_session().get(self.URL + 'key/api/v1/text2image/status/' + request_id) as response:
+                    data = await response.json(content_type=None)
             if data.get('status') == 'DONE':
                 return data.get('images')
-            
+
             attempts -= 1
-            time.sleep(delay)
+            await asyncio.sleep(delay)
             delay += 2
         # Если генерация не завершена, возвращаем None
         return None
@@ -0,0 +1,151 @@
+# benchmarks/e2e.py
+"""
+Сквозной бенчмарк бота против локальных заглушек Bot API, OpenAI и FusionBrain.
+
+Каждый синтетический пользователь проходит сценарий: /start, генерация текста, генерация изображения
+(с ожиданием отправки фото обработчиком очереди), /history с выбором последних 5 запросов.
+Апдейты подаются напрямую в Dispatcher (без polling/webhook), время шага - время обработки апдейта;
+для изображения дополнительно измеряется время до отправки фото (шаг image_e2e).
+
+Пример:
+    python -m benchmarks.e2e --users 2000 --concurrency 200 --openai-latency 300:100:0.01
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from benchmarks.environment import configure_environment, load_bot, sqlite_url, unload_bot
+from benchmarks.fakes import FakeFusionBrain, FakeOpenAI, FakeTelegram, LatencyProfile
+from benchmarks.stats import LatencyRecorder, peak_rss_mb
+from benchmarks.synthetic import callback_update, message_update
+
+TEXT_BUTTON = "Сгенерировать \nтекст 📄"
+IMAGE_BUTTON = "Сгенерировать \nизображение 🖼"
+
+
+class E2EBenchmark:
+    """
+    Драйвер сквозного бенчмарка.
+
+    :param bot: Экземпляр бота.
+    :param dp: Диспетчер бота.
+    :param telegram: Заглушка Bot API.
+    :param args: Параметры запуска.
+    """
+    def __init__(self, bot: Any, dp: Any, telegram: FakeTelegram, args: argparse.Namespace):
+        self.bot = bot
+        self.dp = dp
+        self.telegram = telegram
+        self.args = args
+        self.recorder = LatencyRecorder()
+        self.updates = 0
+
+    async def feed(self, step: str, update: Dict[str, Any]) -> None:
+        self.updates += 1
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception:
+            self.recorder.error(step)
+            return
+        self.recorder.add(step, time.perf_counter() - start)
+
+    async def user_session(self, user_id: int) -> None:
+        await self.feed("start", message_update(user_id, "/start"))
+
+        await self.feed("text_button", message_update(user_id, TEXT_BUTTON))
+        await self.feed("text_prompt", message_update(user_id, f"Напиши короткий рассказ номер {user_id}"))
+
+        if not self.args.skip_images:
+            await self.feed("image_button", message_update(user_id, IMAGE_BUTTON))
+            photo_sent = self.telegram.wait_for(user_id, "sendPhoto")
+            start = time.perf_counter()
+            await self.feed("image_prompt", message_update(user_id, f"Кот в космосе {user_id}"))
+            try:
+                sent_at = await asyncio.wait_for(photo_sent, self.args.image_timeout)
+                self.recorder.add("image_e2e", sent_at - start)
+            except asyncio.TimeoutError:
+                self.recorder.error("image_e2e")
+
+        await self.feed("history", message_update(user_id, "/history"))
+        await self.feed("history_report", callback_update(user_id, "history_last5"))
+
+    async def run(self) -> float:
+        """
+        Прогоняет всех пользователей с ограничением одновременных сессий.
+
+        :return: Общее время прогона в секундах.
+        """
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def limited(user_id: int) -> None:
+            async with semaphore:
+                await self.user_session(user_id)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited(self.args.first_user_id + index) for index in range(self.args.users)))
+        return time.perf_counter() - start
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local fake APIs")
+    parser.add_argument("--users", type=int, default=1000, help="number of synthetic users")
+    parser.add_argument("--concurrency", type=int, default=100, help="users served at the same time")
+    parser.add_argument("--first-user-id", type=int, default=10_000_000)
+    parser.add_argument("--telegram-latency", type=LatencyProfile.parse, default=LatencyProfile.parse("20:5"),
+                        help="Bot API profile 'ms[:jitter_ms[:error_rate]]'")
+    parser.add_argument("--openai-latency", type=LatencyProfile.parse, default=LatencyProfile.parse("300:100"),
+                        help="OpenAI profile 'ms[:jitter_ms[:error_rate]]'")
+    parser.add_argument("--fusionbrain-latency", type=LatencyProfile.parse, default=LatencyProfile.parse("100:20"),
+                        help="FusionBrain profile 'ms[:jitter_ms[:error_rate]]'")
+    parser.add_argument("--generation-time", type=float, default=0.0,
+                        help="seconds until a fake image is ready (the bot polls the status every 10+ s)")
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--skip-images", action="store_true", help="do not run the image generation step")
+    parser.add_argument("--image-timeout", type=float, default=300.0)
+    parser.add_argument("--job-workers", type=int, default=8, help="job queue workers (JOB_WORKERS)")
+    parser.add_argument("--database-url", default=None,
+                        help="database for the run (default: a fresh SQLite file in a temp directory; "
+                             "use PostgreSQL for production-like job queue contention)")
+    parser.add_argument("--keep-antiflood", action="store_true",
+                        help="keep production anti-flood limits instead of disabling them")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    telegram = FakeTelegram(args.telegram_latency)
+    openai = FakeOpenAI(args.openai_latency, completion_tokens=args.completion_tokens)
+    fusionbrain = FakeFusionBrain(args.fusionbrain_latency, generation_time=args.generation_time)
+    for service in (telegram, openai, fusionbrain):
+        await service.start()
+
+    overrides = {"JOB_WORKERS": str(args.job_workers)}
+    if not args.keep_antiflood:
+        overrides.update(ANTIFLOOD_CHEAP_BURST="1000000", ANTIFLOOD_EXPENSIVE_BURST="1000000")
+    database_url = args.database_url or sqlite_url(Path(tempfile.gettempdir()) / "bot_benchmark.db")
+    configure_environment(telegram.url, openai.url, fusionbrain.url, database_url, **overrides)
+
+    bot, dp = await load_bot()
+    benchmark = E2EBenchmark(bot, dp, telegram, args)
+    try:
+        elapsed = await benchmark.run()
+    finally:
+        await unload_bot(bot, dp)
+        for service in (telegram, openai, fusionbrain):
+            await service.stop()
+
+    print(f"Users: {args.users}, concurrency: {args.concurrency}")
+    print(f"Profiles: telegram {args.telegram_latency}, openai {args.openai_latency}, "
+          f"fusionbrain {args.fusionbrain_latency}")
+    print(f"Updates: {benchmark.updates} in {elapsed:.2f}s, {benchmark.updates / elapsed:.1f} updates/sec")
+    print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+    print(benchmark.recorder.table())
+    print("Bot API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(telegram.requests.items())))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
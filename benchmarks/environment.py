@@ -0,0 +1,69 @@
+# benchmarks/environment.py
+# Настройка окружения бота для запуска против локальных заглушек. Вызывается до импорта модулей бота,
+# так как config_data.config читает переменные окружения при импорте.
+import os
+from pathlib import Path
+from typing import Any, Tuple
+
+BENCH_TOKEN = "123456:BENCHMARK"
+
+
+def configure_environment(telegram_url: str, openai_url: str, fusionbrain_url: str, database_url: str,
+                          **overrides: str) -> None:
+    """
+    Задает переменные окружения бота: адреса заглушек, тестовый токен и БД бенчмарка.
+    Переменные окружения имеют приоритет над файлом .env.
+
+    :param telegram_url: Адрес заглушки Bot API.
+    :param openai_url: Адрес заглушки OpenAI-совместимого API.
+    :param fusionbrain_url: Адрес заглушки FusionBrain.
+    :param database_url: Адрес БД бенчмарка.
+    :param overrides: Дополнительные переменные окружения (например, ANTIFLOOD_CHEAP_BURST="1000").
+    """
+    os.environ.update({
+        "ENV": "dev",
+        "BOT_TOKEN_DEV": BENCH_TOKEN,
+        "TELEGRAM_API_URL": telegram_url,
+        "PROXY_API_BASE_URL": openai_url + "/v1",
+        "PROXY_API_KEY": "benchmark",
+        "FUSIONBRAIN_URL": fusionbrain_url + "/",
+        "FUSIONBRAIN_API_KEY": "benchmark",
+        "FUSIONBRAIN_SECRET_KEY": "benchmark",
+        "DATABASE_URL": database_url,
+        "STORAGE_BACKEND": "memory",
+        "METRICS_ENABLED": "false",
+    })
+    os.environ.update(overrides)
+
+
+def sqlite_url(path: Path) -> str:
+    """
+    Возвращает адрес новой БД SQLite для бенчмарка (существующий файл удаляется).
+    """
+    path.unlink(missing_ok=True)
+    return f"sqlite+aiosqlite:///{path}"
+
+
+async def load_bot() -> Tuple[Any, Any]:
+    """
+    Импортирует бота и диспетчер (после configure_environment), создает схему БД
+    и запускает фоновые службы диспетчера.
+
+    :return: Экземпляр бота и диспетчер.
+    """
+    from bot_app import bot, dp
+    from database.models import async_create_all
+    from utils.loguru_logger import setup_logger
+
+    setup_logger()
+    await async_create_all()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    return bot, dp
+
+
+async def unload_bot(bot: Any, dp: Any) -> None:
+    """
+    Останавливает фоновые службы диспетчера (с дорабатыванием задач) и закрывает сессию бота.
+    """
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    await bot.session.close()
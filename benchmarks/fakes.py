@@ -0,0 +1,217 @@
+# benchmarks/fakes.py
+# Локальные заглушки внешних сервисов бота: Bot API, OpenAI-совместимый прокси и FusionBrain.
+import asyncio
+import base64
+import itertools
+import random
+import time
+import uuid
+from collections import defaultdict
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from PIL import Image
+
+
+class LatencyProfile:
+    """
+    Профиль задержек и ошибок заглушки.
+
+    :param latency: Средняя задержка ответа в секундах.
+    :param jitter: Разброс задержки в секундах (равномерно в пределах ±jitter).
+    :param error_rate: Доля ответов с ошибкой 500 (от 0 до 1).
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, value: str) -> "LatencyProfile":
+        """
+        Создает профиль из строки "задержка[:разброс[:доля ошибок]]" (задержки - в миллисекундах),
+        например "200:50:0.01".
+        """
+        parts = [float(part) for part in value.split(":")] + [0.0, 0.0]
+        return cls(latency=parts[0] / 1000, jitter=parts[1] / 1000, error_rate=parts[2])
+
+    async def apply(self) -> bool:
+        """
+        Выдерживает задержку ответа.
+
+        :return: True, если ответ должен завершиться ошибкой.
+        """
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return random.random() < self.error_rate
+
+    def __repr__(self) -> str:
+        return f"{self.latency * 1000:.0f}±{self.jitter * 1000:.0f}ms, errors {self.error_rate:.1%}"
+
+
+class FakeService:
+    """
+    Базовый класс заглушки: aiohttp-приложение на случайном локальном порту.
+
+    :param profile: Профиль задержек и ошибок.
+    """
+    def __init__(self, profile: Optional[LatencyProfile] = None):
+        self.profile = profile or LatencyProfile()
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Запускает заглушку.
+
+        :return: Базовый адрес заглушки.
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+        sockets = site._server.sockets  # type: ignore[union-attr]
+        self.url = f"http://{host}:{sockets[0].getsockname()[1]}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeTelegram(FakeService):
+    """
+    Заглушка Bot API: принимает запросы /bot<token>/<method>, отвечает минимально корректными объектами
+    и запоминает отправленные в каждый чат сообщения, чтобы драйвер мог дождаться результата фоновой задачи.
+    """
+    def __init__(self, profile: Optional[LatencyProfile] = None):
+        super().__init__(profile)
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self._message_ids = itertools.count(1)
+        self._waiters: Dict[Tuple[int, str], List[asyncio.Future[float]]] = defaultdict(list)
+
+    def wait_for(self, chat_id: int, method: str) -> "asyncio.Future[float]":
+        """
+        Возвращает future, которое завершится временем (time.perf_counter) следующего вызова method для чата.
+        """
+        future: asyncio.Future[float] = asyncio.get_running_loop().create_future()
+        self._waiters[(chat_id, method)].append(future)
+        return future
+
+    def _message(self, chat_id: int, **fields: Any) -> Dict[str, Any]:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, **fields}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.requests[method] += 1
+        data = await request.post()
+        if await self.profile.apply():
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"},
+                                     status=500)
+
+        chat_id = int(str(data.get("chat_id", 0)) or 0)
+        for future in self._waiters.pop((chat_id, method), []):
+            if not future.done():
+                future.set_result(time.perf_counter())
+
+        result: Any = True
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, text=str(data.get("text", "")))
+        elif method == "sendPhoto":
+            result = self._message(chat_id, photo=[{"file_id": "photo", "file_unique_id": "photo",
+                                                    "width": 64, "height": 64}])
+        elif method == "sendDocument":
+            result = self._message(chat_id, document={"file_id": "document", "file_unique_id": "document"})
+        elif method == "getChat":
+            result = {"id": chat_id, "type": "private", "username": f"user{chat_id}"}
+        elif method == "getMyCommands":
+            result = []
+        elif method == "getUpdates":
+            result = []
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeOpenAI(FakeService):
+    """
+    Заглушка OpenAI-совместимого API (POST /v1/chat/completions).
+
+    :param completion_tokens: Количество токенов (слов) в ответе.
+    """
+    def __init__(self, profile: Optional[LatencyProfile] = None, completion_tokens: int = 100):
+        super().__init__(profile)
+        self.completion_tokens = completion_tokens
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.requests["chat_completions"] += 1
+        body = await request.json()
+        if await self.profile.apply():
+            return web.json_response({"error": {"message": "Internal error", "type": "server_error"}}, status=500)
+
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(["lorem"] * self.completion_tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": self.completion_tokens,
+                      "total_tokens": prompt_tokens + self.completion_tokens},
+        })
+
+
+def _png_base64(size: int = 64) -> str:
+    buffer = BytesIO()
+    Image.new("RGB", (size, size), (120, 80, 200)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class FakeFusionBrain(FakeService):
+    """
+    Заглушка FusionBrain (Kandinsky): список моделей, запуск генерации и проверка статуса.
+
+    :param generation_time: Время "генерации" изображения в секундах (до него статус - PROCESSING).
+    """
+    def __init__(self, profile: Optional[LatencyProfile] = None, generation_time: float = 0.0):
+        super().__init__(profile)
+        self.generation_time = generation_time
+        self._started: Dict[str, float] = {}
+        self._image = _png_base64()
+        self.app.router.add_get("/key/api/v1/models", self.models)
+        self.app.router.add_post("/key/api/v1/text2image/run", self.run)
+        self.app.router.add_get("/key/api/v1/text2image/status/{uuid}", self.status)
+
+    async def models(self, request: web.Request) -> web.Response:
+        self.requests["models"] += 1
+        await self.profile.apply()
+        return web.json_response([{"id": 4, "name": "Kandinsky", "version": 3.1, "type": "TEXT2IMAGE"}])
+
+    async def run(self, request: web.Request) -> web.Response:
+        self.requests["run"] += 1
+        await request.post()
+        if await self.profile.apply():
+            return web.json_response({"error": "Service is temporarily unavailable"})
+        request_id = str(uuid.uuid4())
+        self._started[request_id] = time.monotonic()
+        return web.json_response({"uuid": request_id, "status": "INITIAL"})
+
+    async def status(self, request: web.Request) -> web.Response:
+        self.requests["status"] += 1
+        await self.profile.apply()
+        request_id = request.match_info["uuid"]
+        started = self._started.get(request_id)
+        if started is None or time.monotonic() - started < self.generation_time:
+            return web.json_response({"uuid": request_id, "status": "PROCESSING"})
+        del self._started[request_id]
+        return web.json_response({"uuid": request_id, "status": "DONE", "images": [self._image]})
@@ -0,0 +1,182 @@
+# benchmarks/replay.py
+"""
+Воспроизведение записанного трафика (RECORD_UPDATES_PATH, middlewares/update_recorder.py) против локальных
+заглушек Bot API, OpenAI и FusionBrain с замером времени каждого обработчика.
+
+Апдейты подаются в Dispatcher с исходными интервалами (--speed 1), ускоренно (--speed 10) или без пауз
+(--speed 0); апдейты одного чата обрабатываются строго по очереди, как в рабочем режиме.
+Даты сообщений сдвигаются к текущему времени, чтобы апдейты не отбрасывались как устаревшие.
+
+Пример:
+    python -m benchmarks.replay updates.jsonl --speed 0 --openai-latency 300:100
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from benchmarks.environment import configure_environment, load_bot, sqlite_url, unload_bot
+from benchmarks.fakes import FakeFusionBrain, FakeOpenAI, FakeTelegram, LatencyProfile
+from benchmarks.stats import LatencyRecorder, peak_rss_mb
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """
+    Внутреннее промежуточное ПО, замеряющее время каждого обработчика (роутер и имя функции).
+
+    :param recorder: Накопитель замеров.
+    """
+    def __init__(self, recorder: LatencyRecorder):
+        self.recorder = recorder
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        router = data.get("event_router")
+        step = f"{router.name.rsplit('.', 1)[-1] if router else '?'}.{name}"
+        start = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            self.recorder.error(step)
+            raise
+        self.recorder.add(step, time.perf_counter() - start)
+        return result
+
+
+def read_log(path: Path) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """
+    Читает журнал апдейтов: пары (время получения, апдейт).
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                yield record["ts"], record["update"]
+
+
+def _chat_key(update: Dict[str, Any]) -> int:
+    for event in update.values():
+        if isinstance(event, dict):
+            chat = event.get("chat") or (event.get("message") or {}).get("chat")
+            if chat:
+                return chat["id"]
+            if "from" in event:
+                return event["from"]["id"]
+    return update.get("update_id", 0)
+
+
+def _refresh_dates(data: Any, now: int) -> None:
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in ("date", "edit_date") and isinstance(value, int):
+                data[key] = now
+            else:
+                _refresh_dates(value, now)
+    elif isinstance(data, list):
+        for item in data:
+            _refresh_dates(item, now)
+
+
+async def replay(bot: Any, dp: Any, records: List[Tuple[float, Dict[str, Any]]], speed: float,
+                 recorder: LatencyRecorder, max_in_flight: int) -> float:
+    """
+    Подает апдейты в диспетчер с сохранением порядка внутри чата.
+
+    :param speed: Множитель скорости (1 - исходная, 0 - без пауз).
+    :param max_in_flight: Максимальное количество одновременно обрабатываемых апдейтов.
+    :return: Время воспроизведения в секундах.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    chat_tails: Dict[int, asyncio.Task[None]] = {}
+
+    async def process(key: int, update: Dict[str, Any], previous: Optional[asyncio.Task[None]]) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        async with semaphore:
+            _refresh_dates(update, int(time.time()))
+            start = time.perf_counter()
+            try:
+                await dp.feed_raw_update(bot, update)
+                recorder.add("update", time.perf_counter() - start)
+            except Exception:
+                recorder.error("update")
+        if chat_tails.get(key) is asyncio.current_task():
+            del chat_tails[key]
+
+    start = time.perf_counter()
+    first_ts = records[0][0] if records else 0.0
+    for ts, update in records:
+        if speed > 0:
+            delay = (ts - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        key = _chat_key(update)
+        chat_tails[key] = asyncio.create_task(process(key, update, chat_tails.get(key)))
+    if chat_tails:
+        await asyncio.gather(*chat_tails.values(), return_exceptions=True)
+    return time.perf_counter() - start
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay recorded updates against local fake APIs")
+    parser.add_argument("log", type=Path, help="JSONL log written by UpdateRecorderMiddleware")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback speed: 1 - original pace, 10 - ten times faster, 0 - as fast as possible")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--telegram-latency", type=LatencyProfile.parse, default=LatencyProfile.parse("20:5"))
+    parser.add_argument("--openai-latency", type=LatencyProfile.parse, default=LatencyProfile.parse("300:100"))
+    parser.add_argument("--fusionbrain-latency", type=LatencyProfile.parse, default=LatencyProfile.parse("100:20"))
+    parser.add_argument("--job-workers", type=int, default=8)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--drain-timeout", type=float, default=120.0,
+                        help="seconds to let queued jobs finish after the last update")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    records = sorted(read_log(args.log), key=lambda record: record[0])
+
+    telegram = FakeTelegram(args.telegram_latency)
+    openai = FakeOpenAI(args.openai_latency)
+    fusionbrain = FakeFusionBrain(args.fusionbrain_latency)
+    for service in (telegram, openai, fusionbrain):
+        await service.start()
+
+    database_url = args.database_url or sqlite_url(Path(tempfile.gettempdir()) / "bot_replay.db")
+    configure_environment(telegram.url, openai.url, fusionbrain.url, database_url,
+                          JOB_WORKERS=str(args.job_workers), SHUTDOWN_TIMEOUT=str(args.drain_timeout))
+
+    bot, dp = await load_bot()
+    recorder = LatencyRecorder()
+    timing = HandlerTimingMiddleware(recorder)
+    dp.message.middleware(timing)
+    dp.callback_query.middleware(timing)
+    try:
+        elapsed = await replay(bot, dp, records, args.speed, recorder, args.max_in_flight)
+    finally:
+        # остановка диспетчера дожидается фоновых задач (в пределах --drain-timeout)
+        await unload_bot(bot, dp)
+        for service in (telegram, openai, fusionbrain):
+            await service.stop()
+
+    recorded_span = records[-1][0] - records[0][0] if records else 0.0
+    print(f"Replayed {len(records)} updates (recorded over {recorded_span:.1f}s) in {elapsed:.2f}s, "
+          f"{len(records) / elapsed if elapsed else 0:.1f} updates/sec, speed x{args.speed or 'max'}")
+    print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+    print(recorder.table())
+    print("Bot API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(telegram.requests.items())))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+# benchmarks/smoke.py
+"""
+Проверка запуска бота против локальных заглушек: все обработчики запуска и остановки диспетчера
+асинхронные (синхронные aiogram выполняет в пуле потоков, где asyncio.create_task завершается ошибкой),
+фоновые службы запускаются, апдейт /start обрабатывается, остановка проходит без ошибок.
+Включены все необязательные службы (трассировка, контроль цикла событий).
+
+Пример:
+    python -m benchmarks.smoke
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, List
+
+from benchmarks.environment import configure_environment, load_bot, sqlite_url, unload_bot
+from benchmarks.fakes import FakeFusionBrain, FakeOpenAI, FakeTelegram
+from benchmarks.synthetic import message_update
+
+SMOKE_USER_ID = 1
+
+
+def sync_lifecycle_handlers(dp: Any) -> List[str]:
+    """
+    Возвращает синхронные обработчики запуска и остановки диспетчера.
+    """
+    return [f"{observer}: {handler.callback!r}"
+            for observer in ("startup", "shutdown")
+            for handler in getattr(dp, observer).handlers
+            if not handler.awaitable]
+
+
+async def main() -> int:
+    telegram, openai, fusionbrain = FakeTelegram(), FakeOpenAI(), FakeFusionBrain()
+    for service in (telegram, openai, fusionbrain):
+        await service.start()
+    tmp = Path(tempfile.gettempdir())
+    configure_environment(telegram.url, openai.url, fusionbrain.url, sqlite_url(tmp / "bot_smoke.db"),
+                          TRACING_PATH=str(tmp / "bot_smoke_traces.jsonl"), LOOP_LAG_THRESHOLD="0.25")
+
+    failures: List[str] = []
+    try:
+        from bot_app import dp
+        failures += [f"synchronous {handler}" for handler in sync_lifecycle_handlers(dp)]
+        bot, dp = await load_bot()
+        try:
+            await dp.feed_raw_update(bot, message_update(SMOKE_USER_ID, "/start"))
+            if not telegram.requests.get("sendMessage"):
+                failures.append("/start did not send a message")
+        finally:
+            await unload_bot(bot, dp)
+    except Exception as e:
+        failures.append(f"startup failed: {e!r}")
+    finally:
+        for service in (telegram, openai, fusionbrain):
+            await service.stop()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("Smoke check " + ("failed" if failures else "passed"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,94 @@
+# benchmarks/startup.py
+"""
+Бенчмарк холодного старта: время импорта точки входа (main), диспетчера со всеми обработчиками (bot_app)
+и рабочего процесса супервизора в новых процессах интерпретатора, а также вклад пакетов во время
+импорта диспетчера (по данным python -X importtime).
+
+Пример:
+    python -m benchmarks.startup --runs 10 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from benchmarks.environment import configure_environment, sqlite_url
+
+ROOT = Path(__file__).resolve().parent.parent
+# (название, импортируемые модули)
+TARGETS = [
+    ("interpreter", ""),
+    ("main", "main"),
+    ("supervisor", "utils.supervisor"),
+    ("bot_app", "bot_app"),
+]
+
+
+def measure(modules: str, env: Dict[str, str]) -> Tuple[float, float]:
+    """
+    Импортирует модули в новом процессе.
+
+    :return: Время импорта внутри процесса и полное время процесса (с запуском интерпретатора) в секундах.
+    """
+    code = ("import time; start = time.perf_counter()\n"
+            + (f"import {modules}\n" if modules else "")
+            + "print(time.perf_counter() - start)")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    return float(result.stdout.strip()), time.perf_counter() - start
+
+
+def import_profile(module: str, env: Dict[str, str]) -> Dict[str, float]:
+    """
+    Суммирует собственное время импорта модулей по пакетам верхнего уровня.
+
+    :return: Время импорта в секундах по пакетам.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    packages: Dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        packages[name.strip().split(".")[0]] += int(self_us) / 1_000_000
+    return packages
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreter runs per target")
+    parser.add_argument("--top", type=int, default=10, help="packages to show in the bot_app import profile")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    # адреса не используются: при импорте бот никуда не подключается
+    configure_environment("http://127.0.0.1:9", "http://127.0.0.1:9", "http://127.0.0.1:9",
+                          sqlite_url(Path(tempfile.gettempdir()) / "bot_startup.db"))
+    env = dict(os.environ)
+
+    print(f"{'target':<12} {'import p50':>11} {'import max':>11} {'process p50':>12}")
+    for name, modules in TARGETS:
+        samples: List[Tuple[float, float]] = [measure(modules, env) for _ in range(args.runs)]
+        imports = [sample[0] for sample in samples]
+        processes = [sample[1] for sample in samples]
+        print(f"{name:<12} {statistics.median(imports) * 1000:>9.1f}ms {max(imports) * 1000:>9.1f}ms "
+              f"{statistics.median(processes) * 1000:>10.1f}ms")
+
+    packages = import_profile("bot_app", env)
+    print(f"\nbot_app import time by package (total {sum(packages.values()) * 1000:.1f}ms):")
+    for package, seconds in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {package:<24} {seconds * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
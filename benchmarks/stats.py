@@ -0,0 +1,52 @@
+# benchmarks/stats.py
+import resource
+import sys
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Перцентиль q (от 0 до 100) методом ближайшего ранга.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """
+    Пиковое потребление памяти процессом (RSS) в мегабайтах.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class LatencyRecorder:
+    """
+    Накопитель длительностей и ошибок по именованным шагам.
+    """
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.samples[name].append(seconds)
+
+    def error(self, name: str) -> None:
+        self.errors[name] += 1
+
+    def table(self) -> str:
+        """
+        Таблица: количество, ошибки и p50/p95/p99/max в миллисекундах по каждому шагу.
+        """
+        lines = [f"{'step':<28}{'count':>8}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"]
+        for name in sorted(set(self.samples) | set(self.errors)):
+            values = self.samples.get(name, [])
+            row = [percentile(values, q) * 1000 for q in (50, 95, 99)] + [max(values, default=0.0) * 1000]
+            lines.append(f"{name:<28}{len(values):>8}{self.errors.get(name, 0):>8}"
+                         + "".join(f"{value:>10.1f}" for value in row))
+        return "\n".join(lines)
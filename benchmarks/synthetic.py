@@ -0,0 +1,51 @@
+# benchmarks/synthetic.py
+# Синтетические апдейты Telegram для бенчмарков.
+import itertools
+import time
+from typing import Any, Dict
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}",
+            "language_code": "ru"}
+
+
+def message_update(user_id: int, text: str) -> Dict[str, Any]:
+    """
+    Апдейт с текстовым сообщением пользователя в личном чате (команды размечаются как bot_command).
+    """
+    message: Dict[str, Any] = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id: int, data: str) -> Dict[str, Any]:
+    """
+    Апдейт с нажатием inline-кнопки под сообщением бота.
+    """
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_message_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Benchmark"},
+                "text": "...",
+            },
+        },
+    }
@@ -0,0 +1,109 @@
+# bot_app.py
+# Диспетчер бота со всеми промежуточным ПО, роутерами и фоновыми службами.
+# Загружается при запуске (main.py, рабочие процессы BOT_WORKERS, бенчмарки), а не при импорте main.py.
+import asyncio
+from aiogram import Dispatcher
+
+from utils import bot_loader
+from handlers.custom_handlers import (gpt_generators, kandinsky_generators, history_command,
+                                      high_low_commands, usage_command, admin_commands)
+from handlers.default_handlers import start, help, echo
+from middlewares.antiflood import AntiFloodMiddleware
+from middlewares.check_old_requests import UpdateTimeValidationMiddleware
+from middlewares.in_flight import InFlightMiddleware, in_flight_registry
+from middlewares.token_quota import TokenQuotaMiddleware
+from middlewares.metrics import HandlerMetricsMiddleware
+from middlewares.update_recorder import UpdateRecorderMiddleware
+from middlewares.tracing import TracingMiddleware
+from config_data import config
+from utils.workers import report_executor
+from utils.storage_factory import create_fsm_storage
+from utils.scheduler import scheduler
+from utils.metrics import QUEUE_DEPTH, registry
+from jobs import executors  # noqa: F401  регистрирует исполнителей фоновых задач
+from jobs.queue import job_queue
+from keyboards.reply.main_kb import main_kb
+from utils.lifecycle import GracefulShutdown, UpdateTracker
+from utils.token_quotas import token_quotas
+from utils.tracing import tracer
+from utils.profiler import loop_lag_monitor
+from utils.conversations import conversation_store
+
+# Инициализируем бота
+bot = bot_loader.bot
+dp = Dispatcher(storage=create_fsm_storage())
+
+# Отслеживание обрабатываемых апдейтов для корректной остановки
+update_tracker = UpdateTracker()
+graceful_shutdown = GracefulShutdown(update_tracker, timeout=config.SHUTDOWN_TIMEOUT,
+                                     persist_offset=config.DELIVERY_MODE != "webhook")
+
+# Подключаем мидлвейры
+# трасса апдейта начинается первой, чтобы ее ID был во всех последующих записях журнала
+tracing_middleware = TracingMiddleware()
+dp.update.outer_middleware(tracing_middleware)
+dp.update.outer_middleware(update_tracker)
+if config.RECORD_UPDATES_PATH:
+    # запись трафика для нагрузочного тестирования (тексты кнопок сохраняются, чтобы сценарии воспроизводились)
+    update_recorder = UpdateRecorderMiddleware(
+        config.RECORD_UPDATES_PATH,
+        scrub=config.RECORD_UPDATES_SCRUB,
+        salt=config.RECORD_UPDATES_SALT,
+        sample_rate=config.RECORD_UPDATES_SAMPLE,
+        keep_texts=frozenset(button.text for row in main_kb.keyboard for button in row),
+    )
+    dp.update.outer_middleware(update_recorder)
+    graceful_shutdown.add_hook("update recorder", lambda remaining: update_recorder.flush())
+dp.update.outer_middleware(UpdateTimeValidationMiddleware())
+dp.message.middleware(AntiFloodMiddleware())
+dp.message.middleware(InFlightMiddleware())
+dp.message.middleware(TokenQuotaMiddleware())
+# время выполнения обработчиков по роутерам (последним, чтобы не учитывать проверки выше)
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+dp.message.middleware(tracing_middleware)
+dp.callback_query.middleware(tracing_middleware)
+
+# Очередь фоновых задач запускается вместе с диспетчером; при остановке диспетчера сначала дорабатывают
+# обработчики апдейтов, затем фоновые задачи, отложенные действия и пул отчетов
+dp.startup.register(job_queue.start)
+dp.startup.register(token_quotas.start)
+dp.startup.register(tracer.start)
+if config.LOOP_LAG_THRESHOLD > 0:
+    dp.startup.register(loop_lag_monitor.start)
+dp.shutdown.register(graceful_shutdown.drain)
+graceful_shutdown.add_hook("job queue", job_queue.stop)
+# после остановки очереди и обновления кратких содержаний диалогов учтен расход всех завершенных генераций
+graceful_shutdown.add_hook("conversations", lambda remaining: conversation_store.stop())
+graceful_shutdown.add_hook("token usage", lambda remaining: token_quotas.stop())
+graceful_shutdown.add_hook("scheduler", lambda remaining: scheduler.stop())
+graceful_shutdown.add_hook("report pool", lambda remaining: asyncio.to_thread(report_executor.shutdown))
+graceful_shutdown.add_hook("traces", lambda remaining: tracer.stop())
+if config.LOOP_LAG_THRESHOLD > 0:
+    graceful_shutdown.add_hook("loop lag monitor", lambda remaining: loop_lag_monitor.stop())
+
+
+async def collect_runtime_metrics() -> None:
+    """
+    Обновляет метрики очередей процесса перед выводом метрик.
+    """
+    QUEUE_DEPTH.set(len(update_tracker.active), queue="updates", status="active")
+    QUEUE_DEPTH.set(report_executor.pending, queue="report_pool", status="pending")
+    QUEUE_DEPTH.set(len(scheduler), queue="scheduler", status="pending")
+    QUEUE_DEPTH.set(len(in_flight_registry), queue="in_flight", status="active")
+
+
+registry.add_collector(collect_runtime_metrics)
+
+# Регистрируем роутеры обработчиков
+dp.include_routers(
+    gpt_generators.router,
+    kandinsky_generators.router,
+    history_command.router,
+    high_low_commands.router,
+    usage_command.router,
+    admin_commands.router,
+    start.router,
+    help.router,
+    echo.router,
+)
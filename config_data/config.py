@@ -2,18 +2,30 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv, find_dotenv
 
-if not find_dotenv():
-    exit("Переменные окружения не загружены т.к отсутствует файл .env")
-else:
-    load_dotenv()
+# переменные из .env не перекрывают уже заданные в окружении (контейнер, бенчмарки);
+# наличие окружения проверяется при запуске бота (check_environment), а не при импорте
+load_dotenv()
 
 ENV = os.getenv("ENV")
 
+
+def check_environment() -> None:
+    """
+    Завершает процесс, если переменные окружения не загружены: нет файла .env и не задана переменная ENV.
+    """
+    if not find_dotenv() and ENV is None:
+        exit("Переменные окружения не загружены т.к отсутствует файл .env")
+
+
+BOT_TOKEN = None
 if ENV == "dev":
     BOT_TOKEN = os.getenv("BOT_TOKEN_DEV")
 elif ENV == "feat":
     BOT_TOKEN = os.getenv("BOT_TOKEN_FEATURE")
 
+# адрес Bot API (локальный сервер Bot API или заглушка бенчмарков); по умолчанию - api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
 PROXY_API_BASE_URL = os.getenv("PROXY_API_BASE_URL")
 PROXY_API_KEY = os.getenv("PROXY_API_KEY")
 
@@ -49,6 +61,153 @@ HIGH_LOW_BUTTONS = {"Вывести 5 запросов": ("high_5", "low_5"),
                     "Укажите сколько вывести запросов": "custom"
                     }
 
+# report rendering worker pool configs
+REPORT_POOL_WORKERS = int(os.getenv("REPORT_POOL_WORKERS", 2))
+REPORT_POOL_MAX_PENDING = int(os.getenv("REPORT_POOL_MAX_PENDING", 20))  # сверх этого числа отчеты отклоняются
+REPORT_POOL_USE_PROCESSES = os.getenv("REPORT_POOL_USE_PROCESSES", "1") == "1"
+REPORT_COMPRESS_THRESHOLD = int(os.getenv("REPORT_COMPRESS_THRESHOLD", 1024 * 1024))  # байт, 0 - не сжимать
+WAIT_MESSAGE_POOL_OVERLOADED = 'Сервер сейчас загружен формированием отчетов, попробуйте повторить запрос позже.'
+
+# antiflood (token bucket) configs: rate - токенов в секунду, burst - емкость ведра
+ANTIFLOOD_CHEAP_RATE = float(os.getenv("ANTIFLOOD_CHEAP_RATE", 1))
+ANTIFLOOD_CHEAP_BURST = int(os.getenv("ANTIFLOOD_CHEAP_BURST", 5))
+ANTIFLOOD_EXPENSIVE_RATE = float(os.getenv("ANTIFLOOD_EXPENSIVE_RATE", 0.1))  # одна генерация в 10 секунд
+ANTIFLOOD_EXPENSIVE_BURST = int(os.getenv("ANTIFLOOD_EXPENSIVE_BURST", 2))
+ANTIFLOOD_MAX_TRACKED_USERS = int(os.getenv("ANTIFLOOD_MAX_TRACKED_USERS", 100000))
+ANTIFLOOD_NOTICE_TTL = float(os.getenv("ANTIFLOOD_NOTICE_TTL", 3))
+
+# shared storage configs: "memory" (один процесс), "database" (основная БД) или "redis"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# stale updates configs
+STALE_UPDATE_MAX_AGE = float(os.getenv("STALE_UPDATE_MAX_AGE", 30))  # секунд
+STALE_UPDATE_NOTIFY = os.getenv("STALE_UPDATE_NOTIFY", "0") == "1"
+STALE_UPDATE_NOTIFY_INTERVAL = float(os.getenv("STALE_UPDATE_NOTIFY_INTERVAL", 5))
+STALE_UPDATE_NOTICE = 'Извините, ваш запрос устарел и не был обработан. Пожалуйста, отправьте его еще раз.'
+
+# максимальная длительность операции пользователя, после которой он снова может отправлять запросы
+IN_FLIGHT_TIMEOUT = float(os.getenv("IN_FLIGHT_TIMEOUT", 300))  # секунд
+
+# chat actions ("печатает...", "загружает фото...") configs
+CHAT_ACTION_INTERVAL = float(os.getenv("CHAT_ACTION_INTERVAL", 4.5))  # секунд, Telegram показывает статус ~5 сек
+CHAT_ACTION_INITIAL_DELAY = float(os.getenv("CHAT_ACTION_INITIAL_DELAY", 0.3))  # быстрые ответы - без статуса
+
+# время, через которое сбрасывается состояние ожидания ввода, если пользователь так и не отправил запрос
+PENDING_STATE_TTL = float(os.getenv("PENDING_STATE_TTL", 600))  # секунд
+
+# update delivery configs: "polling" или "webhook"
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # публичный https-адрес, TLS завершается на обратном прокси
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8000))
+
+# multi-process configs: при BOT_WORKERS > 1 (только в режиме вебхука) процесс-супервизор
+# принимает вебхук и распределяет апдейты по рабочим процессам по chat id
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 1))
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", 1))  # секунд, удваивается при частых падениях
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", 30))  # секунд
+
+# background job queue configs (генерация изображений и длинных текстов)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))  # обработчиков очереди в каждом процессе
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))  # секунд
+JOB_LEASE = float(os.getenv("JOB_LEASE", 90))  # секунд, продлевается во время выполнения
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_TEXT_MIN_CHARS = int(os.getenv("JOB_TEXT_MIN_CHARS", 2000))
+# текстовые запросы длиннее (по оценке) - в очередь; по умолчанию - около JOB_TEXT_MIN_CHARS символов
+JOB_TEXT_MIN_TOKENS = int(os.getenv("JOB_TEXT_MIN_TOKENS", JOB_TEXT_MIN_CHARS // 3))
+JOB_ALREADY_QUEUED_MESSAGE = 'Ваш предыдущий запрос еще выполняется. Пожалуйста, дождитесь результата.'
+JOB_FAILED_MESSAGE = 'Ошибка: не удалось выполнить ваш запрос. Попробуйте еще раз позже.'
+
+# крайний срок корректной остановки (обработчики, фоновые задачи, запись в БД)
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", 25))  # секунд, меньше stop_grace_period docker (30)
+
+# проверка меню команд бота (обновляется только при расхождении с bot_commands.json)
+COMMAND_SYNC_INTERVAL = float(os.getenv("COMMAND_SYNC_INTERVAL", 300))  # секунд
+
+# фоновая сверка имен пользователей с Telegram
+USERNAME_REFRESH_MAX_AGE = float(os.getenv("USERNAME_REFRESH_MAX_AGE", 86400))  # секунд между сверками пользователя
+USERNAME_REFRESH_BATCH = int(os.getenv("USERNAME_REFRESH_BATCH", 100))  # пользователей в пакете
+USERNAME_REFRESH_IDLE = float(os.getenv("USERNAME_REFRESH_IDLE", 600))  # пауза, когда сверять некого
+TELEGRAM_API_RATE = float(os.getenv("TELEGRAM_API_RATE", 5))  # фоновых запросов к Bot API в секунду
+TELEGRAM_API_BURST = int(os.getenv("TELEGRAM_API_BURST", 5))
+
+# метрики в текстовом формате Prometheus (на порту WEBHOOK_PORT; в режиме BOT_WORKERS рабочий процесс N
+# отдает свои метрики на порту METRICS_WORKER_BASE_PORT + N)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_WORKER_BASE_PORT = int(os.getenv("METRICS_WORKER_BASE_PORT", WEBHOOK_PORT + 1))
+
+# запись входящих апдейтов в JSONL для воспроизведения (benchmarks/replay.py); пустой путь - запись отключена
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH")
+RECORD_UPDATES_SCRUB = os.getenv("RECORD_UPDATES_SCRUB", "1") == "1"  # удалять персональные данные
+RECORD_UPDATES_SALT = os.getenv("RECORD_UPDATES_SALT", "")  # соль псевдонимов id; пустая - случайная на процесс
+RECORD_UPDATES_SAMPLE = float(os.getenv("RECORD_UPDATES_SAMPLE", 1))  # доля записываемых апдейтов
+
+# бюджеты токенов LLM (0 - без ограничения); расход копится в памяти и выгружается в БД раз в интервал
+TOKEN_QUOTA_USER_DAILY = int(os.getenv("TOKEN_QUOTA_USER_DAILY", 50_000))
+TOKEN_QUOTA_USER_MONTHLY = int(os.getenv("TOKEN_QUOTA_USER_MONTHLY", 500_000))
+TOKEN_QUOTA_GLOBAL_DAILY = int(os.getenv("TOKEN_QUOTA_GLOBAL_DAILY", 2_000_000))
+TOKEN_QUOTA_GLOBAL_MONTHLY = int(os.getenv("TOKEN_QUOTA_GLOBAL_MONTHLY", 30_000_000))
+TOKEN_QUOTA_FLUSH_INTERVAL = float(os.getenv("TOKEN_QUOTA_FLUSH_INTERVAL", 30))  # секунд
+TOKEN_QUOTA_USER_MESSAGE = 'Вы израсходовали лимит токенов на {period}. Попробуйте позже или посмотрите /usage.'
+TOKEN_QUOTA_GLOBAL_MESSAGE = 'Бот исчерпал общий лимит запросов к модели на {period}. Попробуйте позже.'
+
+# максимальная длина текстов запросов и ответов моделей в журнале
+LOG_PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", 200))
+
+# трассировка апдейтов: отрезки пишутся в JSONL-файл ("" - только ID трасс в журнале; "{pid}" - PID процесса)
+TRACING_PATH = os.getenv("TRACING_PATH", "")
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))  # доля выгружаемых трасс
+TRACING_FLUSH_INTERVAL = float(os.getenv("TRACING_FLUSH_INTERVAL", 2))  # секунд
+
+# Telegram ID администраторов через запятую (команда /profile)
+ADMIN_IDS = frozenset(int(tg_id) for tg_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if tg_id)
+# семплирующий профилировщик
+PROFILE_DEFAULT_SECONDS = int(os.getenv("PROFILE_DEFAULT_SECONDS", 30))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 300))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.01))  # секунд между снимками стеков
+# контроль блокировок цикла событий (0 - отключен)
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", 0.25))  # секунд
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.1))  # секунд
+
+# журнал медленных SQL-запросов (0 - отключен) и ограничение количества отслеживаемых форм запросов
+DB_SLOW_QUERY_THRESHOLD = float(os.getenv("DB_SLOW_QUERY_THRESHOLD", 0.5))  # секунд
+DB_QUERY_SHAPES_LIMIT = int(os.getenv("DB_QUERY_SHAPES_LIMIT", 500))
+
+# многошаговые диалоги: бюджет токенов контекста на запрос (0 - каждый запрос без контекста),
+# из него до CONVERSATION_SUMMARY_TOKENS - краткое содержание ранних реплик, остальное - последние реплики
+CONVERSATION_CONTEXT_TOKENS = int(os.getenv("CONVERSATION_CONTEXT_TOKENS", 1500))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", 300))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", 20))
+CONVERSATION_TURN_MAX_CHARS = int(os.getenv("CONVERSATION_TURN_MAX_CHARS", 4000))
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", 6 * 3600))  # секунд
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", 10_000))
+
+# оценка токенов запроса до обращения к модели: запросы длиннее PROMPT_MAX_TOKENS отклоняются,
+# не укладывающиеся в контекстное окно модели (за вычетом резерва на ответ) - сокращаются
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", 30_000))
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", 16_385))  # gpt-3.5-turbo
+COMPLETION_RESERVE_TOKENS = int(os.getenv("COMPLETION_RESERVE_TOKENS", 1024))
+TOKEN_ESTIMATE_CACHE_SIZE = int(os.getenv("TOKEN_ESTIMATE_CACHE_SIZE", 4096))
+# цены модели в долларах за миллион токенов (прогноз стоимости запроса)
+LLM_PROMPT_PRICE = float(os.getenv("LLM_PROMPT_PRICE", 0.5))
+LLM_COMPLETION_PRICE = float(os.getenv("LLM_COMPLETION_PRICE", 1.5))
+PROMPT_TOO_LONG_MESSAGE = 'Запрос слишком длинный (около {tokens} токенов, допустимо {limit}). Сократите его, пожалуйста.'
+PROMPT_TRIMMED_MESSAGE = 'Запрос не помещается в контекст модели: середина запроса будет пропущена.'
+
+# очередь исходящих сообщений: ограничения Telegram - около 30 сообщений в секунду на бота, 1 в секунду
+# на личный чат и 20 в минуту на группу (в режиме BOT_WORKERS общий лимит делится между рабочими процессами)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", 20 / 60))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", 3))
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", 3))  # повторов после ответа 429
+TELEGRAM_SEND_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_SEND_MAX_RETRY_AFTER", 60))  # секунд
+
 # CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_DIR = Path(__file__).parent
 BASE_DIR = Path(__file__).parent.parent
@@ -0,0 +1,171 @@
+# database/instrumentation.py
+import hashlib
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config_data import config
+from utils.loguru_logger import log
+from utils.metrics import (DB_QUERY_SECONDS, DB_SHAPE_CALLS, DB_SHAPE_INFO, DB_SHAPE_MAX_SECONDS, DB_SHAPE_SECONDS,
+                           DB_SLOW_QUERIES)
+from utils.tracing import tracer
+
+_START_KEY = "query_start_time"
+OTHER_SHAPE = "other"
+
+# значения в тексте запроса: плейсхолдеры драйверов ($1, %(name)s, %s, :name), строки и числа
+_VALUES = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_VALUE_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")  # IN (?, ?, ?) -> IN (?)
+_ROW_LISTS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")  # VALUES (?), (?) -> VALUES (?)
+_SPACES = re.compile(r"\s+")
+
+
+def _statement_type(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+@lru_cache(maxsize=2048)
+def query_shape(statement: str) -> Tuple[str, str]:
+    """
+    Приводит запрос к форме без значений: запросы, различающиеся только параметрами или длиной списков
+    значений, имеют одну форму.
+
+    :param statement: Текст SQL-запроса.
+    :return: Короткий ID формы и нормализованный текст запроса.
+    """
+    shape = _SPACES.sub(" ", statement).strip()
+    shape = _ROW_LISTS.sub("(?)", _VALUE_LISTS.sub("?", _VALUES.sub("?", shape)))
+    return hashlib.sha1(shape.encode()).hexdigest()[:10], shape
+
+
+def _redact(value: Any) -> Any:
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_parameters(parameters: Any, executemany: bool) -> Any:
+    """
+    Заменяет значения параметров запроса их типами (и длинами для строк), чтобы в журнал
+    не попадали тексты запросов пользователей и другие персональные данные.
+
+    :param parameters: Параметры запроса в формате драйвера.
+    :param executemany: Выполняется ли запрос для нескольких наборов параметров.
+    """
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = redact_parameters(parameters[0], False) if parameters else None
+        return {"rows": len(parameters), "first": first}
+    if isinstance(parameters, dict):
+        return {key: _redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact(value) for value in parameters]
+    return _redact(parameters)
+
+
+class ShapeStats:
+    """
+    Накопленная статистика формы запроса.
+    """
+    __slots__ = ("statement", "calls", "total", "max", "slow")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+
+
+class QueryStats:
+    """
+    Статистика SQL-запросов по формам (метрики bot_db_query_shape_*) и журнал медленных запросов.
+
+    :param slow_threshold: Длительность в секундах, начиная с которой запрос записывается в журнал (0 - не писать).
+    :param max_shapes: Максимальное количество отслеживаемых форм; остальные учитываются как "other".
+    """
+    def __init__(self, slow_threshold: float, max_shapes: int):
+        self.slow_threshold = slow_threshold
+        self.max_shapes = max_shapes
+        self.shapes: Dict[str, ShapeStats] = {}
+
+    def observe(self, statement: str, parameters: Any, executemany: bool, duration: float) -> None:
+        shape_id, shape = query_shape(statement)
+        stats = self.shapes.get(shape_id)
+        if stats is None:
+            if len(self.shapes) >= self.max_shapes:
+                shape_id, shape = OTHER_SHAPE, OTHER_SHAPE
+                stats = self.shapes.get(shape_id)
+            if stats is None:
+                stats = self.shapes[shape_id] = ShapeStats(shape)
+                DB_SHAPE_INFO.set(1, shape=shape_id, statement=shape[:300])
+
+        stats.calls += 1
+        stats.total += duration
+        DB_SHAPE_CALLS.inc(shape=shape_id)
+        DB_SHAPE_SECONDS.inc(duration, shape=shape_id)
+        if duration > stats.max:
+            stats.max = duration
+            DB_SHAPE_MAX_SECONDS.set(duration, shape=shape_id)
+
+        if self.slow_threshold and duration >= self.slow_threshold:
+            stats.slow += 1
+            DB_SLOW_QUERIES.inc(shape=shape_id)
+            log.warning("Slow query {:.3f}s [{}]: {} parameters={}", duration, shape_id,
+                        shape, redact_parameters(parameters, executemany))
+
+    def top(self, count: int) -> List[Tuple[str, ShapeStats]]:
+        """
+        Возвращает формы запросов с наибольшим суммарным временем выполнения.
+
+        :param count: Количество форм.
+        """
+        return sorted(self.shapes.items(), key=lambda item: item[1].total, reverse=True)[:count]
+
+
+query_stats = QueryStats(slow_threshold=config.DB_SLOW_QUERY_THRESHOLD, max_shapes=config.DB_QUERY_SHAPES_LIMIT)
+
+
+def _before_cursor_execute(conn: Connection, cursor: Any, statement: str, parameters: Any,
+                           context: Any, executemany: bool) -> None:
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Connection, cursor: Any, statement: str, parameters: Any,
+                          context: Any, executemany: bool) -> None:
+    started = conn.info.get(_START_KEY)
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    statement_type = _statement_type(statement)
+    DB_QUERY_SECONDS.observe(duration, statement=statement_type)
+    query_stats.observe(statement, parameters, executemany, duration)
+    # контекст трассы доступен и здесь: SQLAlchemy выполняет запросы в гринлете с контекстом вызывающей задачи
+    tracer.record(f"db {statement_type}", duration, statement=statement[:200])
+
+
+def _handle_error(exception_context: Any) -> None:
+    # при ошибке after_cursor_execute не вызывается: снимаем отметку времени, чтобы стек не рос
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(_START_KEY):
+        conn.info[_START_KEY].pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Подключает к движку измерение времени выполнения SQL-запросов (метрика bot_db_query_duration_seconds),
+    статистику по формам запросов, журнал медленных запросов и запись запросов отрезками трассы текущего апдейта.
+
+    :param engine: Асинхронный движок SQLAlchemy.
+    """
+    sync_engine: Engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
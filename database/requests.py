@@ -1,13 +1,80 @@
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update, delete, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.engine import Result
+from sqlalchemy.sql.base import ReadOnlyColumnCollection
+from sqlalchemy.sql.elements import KeyedColumnElement
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.selectable import Select
-from database.models import User, RequestAndResponse, AIModel, async_session
+from database.models import (User, RequestAndResponse, AIModel, Job, BotState, UserRefresh, TokenUsage,
+                             Conversation, Base, async_session)
 from datetime import timedelta, datetime
-from typing import Optional, Tuple, Sequence
+from typing import Any, Callable, Dict, List, Optional, Tuple, Sequence, Union
 
-from utils.loguru_logger import log
+from utils.loguru_logger import log, truncate
+from utils.tracing import tracer
 
 
+Excluded = ReadOnlyColumnCollection[str, KeyedColumnElement[Any]]
+
+
+def upsert_statement(dialect: str, model: type[Base], rows: List[Dict[str, Any]], index_elements: List[str],
+                     updates: Callable[[Excluded], Dict[str, Any]]
+                     ) -> Optional[Union[postgresql.Insert, sqlite.Insert]]:
+    """
+    Формирует запрос INSERT ... ON CONFLICT DO UPDATE для PostgreSQL и SQLite.
+
+    :param dialect: Имя диалекта СУБД.
+    :param model: Модель таблицы.
+    :param rows: Значения столбцов для каждой строки.
+    :param index_elements: Столбцы ограничения уникальности.
+    :param updates: Функция, возвращающая значения столбцов при конфликте по вставляемым значениям (excluded).
+    :return: Запрос или None, если СУБД не поддерживает ON CONFLICT.
+    """
+    if dialect == "postgresql":
+        pg_stmt = postgresql.insert(model).values(rows)
+        return pg_stmt.on_conflict_do_update(index_elements=index_elements, set_=updates(pg_stmt.excluded))
+    if dialect == "sqlite":
+        sqlite_stmt = sqlite.insert(model).values(rows)
+        return sqlite_stmt.on_conflict_do_update(index_elements=index_elements, set_=updates(sqlite_stmt.excluded))
+    return None
+
+
+async def upsert_row(session: AsyncSession, model: type[Base], values: Dict[str, Any], key_column: str) -> None:
+    """
+    Вставляет строку или обновляет существующую по первичному ключу одним запросом
+    (INSERT ... ON CONFLICT для PostgreSQL и SQLite, merge для остальных СУБД).
+
+    :param session: Сессия БД.
+    :param model: Модель таблицы.
+    :param values: Значения столбцов.
+    :param key_column: Имя столбца первичного ключа.
+    """
+    await upsert_rows(session, model, [values], key_column)
+
+
+async def upsert_rows(session: AsyncSession, model: type[Base], rows: List[Dict[str, Any]], key_column: str) -> None:
+    """
+    Пакетный вариант upsert_row: вставляет или обновляет несколько строк с одинаковым набором столбцов.
+
+    :param session: Сессия БД.
+    :param model: Модель таблицы.
+    :param rows: Значения столбцов для каждой строки.
+    :param key_column: Имя столбца первичного ключа.
+    """
+    if not rows:
+        return
+    stmt = upsert_statement(
+        session.get_bind().dialect.name, model, rows, [key_column],
+        lambda excluded: {column: excluded[column] for column in rows[0] if column != key_column},
+    )
+    if stmt is not None:
+        await session.execute(stmt)
+    else:
+        for values in rows:
+            await session.merge(model(**values))
+
+
+@tracer.traced()
 async def set_user(tg_id: int, username: Optional[str] = None) -> None:
     """
     Устанавливает пользователя в базе данных.
@@ -17,13 +84,13 @@ async def set_user(tg_id: int, username: Optional[str] = None) -> None:
         tg_id (int): Telegram ID пользователя.
         username (Optional[str]): Имя пользователя (по умолчанию None).
     """
-    log.info(f"Trying to set user with tg_id={tg_id}, username={username}")
+    log.debug("Trying to set user with tg_id={}, username={}", tg_id, username)
     async with async_session() as session:
         # подключаемся к БД и ищем в ней текущего пользователя
         user = await get_user(tg_id)
         
         if not user:
-            log.info(f"Creating new user with tg_id={tg_id}, username={username}")
+            log.info("Creating new user with tg_id={}, username={}", tg_id, username)
             try:
                 session.add(User(tg_id=tg_id, username=username))
                 await session.commit()
@@ -32,13 +99,14 @@ async def set_user(tg_id: int, username: Optional[str] = None) -> None:
                 await session.rollback()
                 # await session.commit()
             # session.add(User(tg_id=tg_id, username=username))
-            log.info(f"A new user has been created with tg_id={tg_id}, username={username}")
+            log.info("A new user has been created with tg_id={}, username={}", tg_id, username)
             return
         else:
-            log.info(f"User with tg_id={tg_id}, username={username} already exists in the database")
+            log.debug("User with tg_id={}, username={} already exists in the database", tg_id, username)
             return
 
 
+@tracer.traced()
 async def get_user(tg_id: int) -> Optional[User]:
     """
     Получает пользователя из базы данных по его Telegram ID.
@@ -49,11 +117,11 @@ async def get_user(tg_id: int) -> Optional[User]:
     Returns:
         Optional[User]: Объект пользователя или None, если пользователь не найден.
     """
-    log.debug(f"User's with tg_id={tg_id} request")
+    log.debug("User's with tg_id={} request", tg_id)
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.tg_id == tg_id))
         if user:
-            log.info(f"User found: {user}")
+            log.debug("User with tg_id={} found (id={})", tg_id, user.id)
         else:
             log.warning(f"User with tg_id={tg_id} can't be found")
         return user
@@ -69,7 +137,7 @@ async def ensure_model_exists(model_name: str) -> int:
     Returns:
         int: ID модели.
     """
-    log.debug(f"Checking the existence of a model named {model_name}")
+    log.debug("Checking the existence of a model named {}", model_name)
     async with async_session() as session:
         # Проверяем, существует ли модель
         model = await session.scalar(select(AIModel).where(AIModel.name == model_name))
@@ -77,11 +145,14 @@ async def ensure_model_exists(model_name: str) -> int:
             # Добавляем модель, если не существует
             new_model = AIModel(name=model_name)
             session.add(new_model)
+            # ID берется до commit: после него атрибуты истекают (см. enqueue_job)
+            await session.flush()
+            model_id = new_model.id
             await session.commit()
-            log.info(f"A new model with the name {model_name} и id={new_model.id} has been created")
-            return new_model.id
+            log.info(f"A new model with the name {model_name} и id={model_id} has been created")
+            return model_id
         
-        log.info(f"The model {model_name} with id={model.id} already exists in the database")
+        log.debug("The model {} with id={} already exists in the database", model_name, model.id)
         return model.id
 
 
@@ -97,23 +168,26 @@ async def ensure_user_exists(user_id: int, username: Optional[str] = None) -> in
     Raises:
         ValueError: Если пользователь не найден и не задан username.
     """
-    log.debug(f"Checking user with id={user_id} existence in the database")
+    log.debug("Checking user with id={} existence in the database", user_id)
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.tg_id == user_id))
         if not user and username is not None:
             new_user = User(tg_id=user_id, username=username)
             session.add(new_user)
+            await session.flush()
+            new_user_id = new_user.id
             await session.commit()
-            log.info(f"A new user with id={new_user.id} и username={username} has been created")
-            return new_user.id
+            log.info(f"A new user with id={new_user_id} и username={username} has been created")
+            return new_user_id
         elif user:
-            log.info(f"User with id={user.id} already exists in the database")
+            log.debug("User with id={} already exists in the database", user.id)
             return user.id
         else:
             log.error(f"User with id={user_id} not found and username is not set")
             raise ValueError
 
 
+@tracer.traced()
 async def put_txt_gpt_data_to_db(request: str, answer: str, total_token_quantity: int,
                                  model_name: str, user_id: int) -> None:
     """
@@ -126,16 +200,16 @@ async def put_txt_gpt_data_to_db(request: str, answer: str, total_token_quantity
         model_name (str): Название модели.
         user_id (int): ID пользователя.
     """
-    log.info(
-        f"Saving request and response data from GPT: request='{request}', model_name='{model_name}', user_id={user_id}")
+    log.info("Saving request and response data from GPT: request='{}' ({} chars), model_name='{}', user_id={}",
+             truncate(request), len(request), model_name, user_id)
     try:
         # Убеждаемся, что модель существует или создаем её
         model_id = await ensure_model_exists(model_name)
         
         # Убеждаемся, что пользователь существует или создаем его
         user_id = await ensure_user_exists(user_id)
-        log.info(f"Trying to save request and response data from GPT model with id={model_id} "
-                 f"for the user with id={user_id}")
+        log.debug("Trying to save request and response data from GPT model with id={} for the user with id={}",
+                  model_id, user_id)
         async with async_session() as session:
             session.add(RequestAndResponse(
                 request=request,
@@ -146,9 +220,8 @@ async def put_txt_gpt_data_to_db(request: str, answer: str, total_token_quantity
                 requests_date=func.now()
             ))
             await session.commit()
-            log.info(
-                f"Request and response data from GPT successfully saved to the database for the user with id={user_id}"
-            )
+            log.info("Request and response data from GPT successfully saved to the database for the user with id={}",
+                     user_id)
     
     except Exception as e:
         log.error(f"Error saving GPT request and response data: {str(e)}")
@@ -173,6 +246,7 @@ async def get_base_query(user_id: int) -> Select[Tuple[RequestAndResponse, str]]
     return query
 
 
+@tracer.traced()
 async def get_history_data(period_or_count_filter: str,
                            user_id: int) -> Sequence[Tuple[RequestAndResponse, str]]:
     """
@@ -224,6 +298,7 @@ async def get_history_data(period_or_count_filter: str,
     return responses
 
 
+@tracer.traced()
 async def get_high_low_data(high_or_low_filter: str,
                             count: int,
                             user_id: int) -> Sequence[Tuple[RequestAndResponse, str]]:
@@ -264,3 +339,300 @@ async def get_high_low_data(high_or_low_filter: str,
             raise
     
     return responses
+
+
+async def enqueue_job(kind: str, payload: Dict[str, Any], chat_id: int, tg_id: int) -> int:
+    """
+    Ставит фоновую задачу в очередь.
+
+    Args:
+        kind (str): Тип задачи ("image", "text").
+        payload (Dict[str, Any]): Параметры задачи.
+        chat_id (int): ID чата, в который отправляется результат.
+        tg_id (int): Telegram ID пользователя.
+    Returns:
+        int: ID задачи.
+    """
+    async with async_session() as session:
+        job = Job(kind=kind, payload=payload, chat_id=chat_id, tg_id=tg_id, status="pending", attempts=0)
+        session.add(job)
+        # после commit атрибуты объекта истекают (expire_on_commit), а их ленивая загрузка
+        # вне контекста сессии завершается ошибкой MissingGreenlet: ID берется до commit
+        await session.flush()
+        job_id = job.id
+        await session.commit()
+        log.info(f"Job {job_id} ({kind}) has been enqueued for user with tg_id={tg_id}")
+        return job_id
+
+
+async def has_active_job(tg_id: int) -> bool:
+    """
+    Проверяет, есть ли у пользователя незавершенные фоновые задачи.
+
+    Args:
+        tg_id (int): Telegram ID пользователя.
+    Returns:
+        bool: True, если есть задачи в статусе "pending" или "running".
+    """
+    async with async_session() as session:
+        job_id = await session.scalar(
+            select(Job.id).where(Job.tg_id == tg_id, Job.status.in_(("pending", "running"))).limit(1)
+        )
+        return job_id is not None
+
+
+async def claim_job(lease_seconds: float) -> Optional[Job]:
+    """
+    Забирает из очереди самую старую задачу, ожидающую выполнения, или задачу с истекшей арендой
+    (например, брошенную упавшим процессом), и берет ее в аренду.
+
+    Args:
+        lease_seconds (float): Срок аренды задачи в секундах.
+    Returns:
+        Optional[Job]: Задача (отсоединенная от сессии) или None, если очередь пуста.
+    """
+    now = datetime.now()
+    # выбор и захват задачи - один запрос UPDATE: в SQLite нет блокировок строк (FOR UPDATE SKIP LOCKED
+    # пропускается), и отдельный SELECT вернул бы одну и ту же задачу всем свободным обработчикам
+    candidate = (
+        select(Job.id)
+        .where(or_(Job.status == "pending",
+                   and_(Job.status == "running", Job.locked_until < now)))
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with async_session() as session:
+        async with session.begin():
+            job = await session.scalar(
+                update(Job)
+                .where(Job.id == candidate)
+                .values(status="running", attempts=Job.attempts + 1,
+                        locked_until=now + timedelta(seconds=lease_seconds))
+                .returning(Job)
+            )
+            if job is None:
+                return None
+            session.expunge(job)
+    log.info(f"Job {job.id} ({job.kind}) claimed, attempt {job.attempts}")
+    return job
+
+
+async def extend_job_lease(job_id: int, lease_seconds: float) -> None:
+    """
+    Продлевает аренду выполняющейся задачи.
+
+    Args:
+        job_id (int): ID задачи.
+        lease_seconds (float): Новый срок аренды в секундах от текущего момента.
+    """
+    async with async_session() as session:
+        await session.execute(
+            update(Job).where(Job.id == job_id, Job.status == "running")
+            .values(locked_until=datetime.now() + timedelta(seconds=lease_seconds))
+        )
+        await session.commit()
+
+
+async def save_job_result(job_id: int, result: Dict[str, Any]) -> None:
+    """
+    Сохраняет промежуточный результат задачи в ее параметрах (payload), чтобы повторная попытка
+    не выполняла уже оплаченную работу заново.
+
+    Args:
+        job_id (int): ID задачи.
+        result (Dict[str, Any]): Значения, добавляемые к параметрам задачи.
+    """
+    async with async_session() as session:
+        job = await session.get(Job, job_id)
+        if job is None:
+            return
+        job.payload = {**job.payload, **result}
+        await session.commit()
+
+
+async def finish_job(job_id: int, status: str, error: Optional[str] = None) -> None:
+    """
+    Устанавливает итоговый или промежуточный статус задачи и снимает аренду.
+
+    Args:
+        job_id (int): ID задачи.
+        status (str): Новый статус ("done", "failed" или "pending" для повторной попытки).
+        error (Optional[str]): Текст ошибки.
+    """
+    async with async_session() as session:
+        await session.execute(
+            update(Job).where(Job.id == job_id)
+            .values(status=status, locked_until=None, error=error[:1000] if error else None)
+        )
+        await session.commit()
+    log.info(f"Job {job_id} is {status}")
+
+
+async def count_jobs(status: str = "pending") -> int:
+    """
+    Возвращает количество задач в указанном статусе.
+
+    Args:
+        status (str): Статус задач.
+    Returns:
+        int: Количество задач.
+    """
+    async with async_session() as session:
+        return await session.scalar(select(func.count(Job.id)).where(Job.status == status)) or 0
+
+
+async def get_bot_state(key: str) -> Optional[str]:
+    """
+    Возвращает значение служебного параметра бота.
+
+    Args:
+        key (str): Имя параметра.
+    Returns:
+        Optional[str]: Значение параметра или None, если он не сохранен.
+    """
+    async with async_session() as session:
+        return await session.scalar(select(BotState.value).where(BotState.key == key))
+
+
+async def set_bot_state(key: str, value: str) -> None:
+    """
+    Сохраняет значение служебного параметра бота.
+
+    Args:
+        key (str): Имя параметра.
+        value (str): Значение параметра.
+    """
+    async with async_session() as session:
+        await upsert_row(session, BotState, {"key": key, "value": value}, key_column="key")
+        await session.commit()
+    log.debug(f"Bot state {key}={value} saved")
+
+
+async def get_users_to_refresh(older_than: datetime, limit: int) -> List[Tuple[int, int, Optional[str]]]:
+    """
+    Возвращает пользователей, имена которых не сверялись с Telegram с указанного момента
+    (сначала никогда не сверявшихся, затем - давно сверявшихся).
+
+    Args:
+        older_than (datetime): Граница давности последней сверки.
+        limit (int): Размер пакета.
+    Returns:
+        List[Tuple[int, int, Optional[str]]]: Пары (ID, Telegram ID, имя пользователя).
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.id, User.tg_id, User.username)
+            .outerjoin(UserRefresh, UserRefresh.user_id == User.id)
+            .where(or_(UserRefresh.refreshed_at.is_(None), UserRefresh.refreshed_at < older_than))
+            .order_by(UserRefresh.refreshed_at.is_not(None), UserRefresh.refreshed_at, User.id)
+            .limit(limit)
+        )
+        return [(row.id, row.tg_id, row.username) for row in result]
+
+
+async def save_refreshed_usernames(changed: Dict[int, Optional[str]], refreshed_ids: Sequence[int]) -> None:
+    """
+    Сохраняет результат сверки пакета пользователей одной транзакцией: изменившиеся имена -
+    пакетным UPDATE по первичному ключу, время сверки - пакетным upsert.
+
+    Args:
+        changed (Dict[int, Optional[str]]): Новые имена по ID пользователя.
+        refreshed_ids (Sequence[int]): ID всех сверенных пользователей.
+    """
+    now = datetime.now()
+    async with async_session() as session:
+        if changed:
+            await session.execute(update(User), [{"id": user_id, "username": username}
+                                                 for user_id, username in changed.items()])
+        await upsert_rows(session, UserRefresh, [{"user_id": user_id, "refreshed_at": now}
+                                                 for user_id in refreshed_ids], key_column="user_id")
+        await session.commit()
+    log.info(f"Usernames refreshed for {len(refreshed_ids)} users, {len(changed)} changed")
+
+
+async def get_token_usage(scopes: Sequence[str], periods: Sequence[str]) -> Dict[Tuple[str, str], int]:
+    """
+    Возвращает расход токенов по владельцам счетчиков и периодам.
+
+    Args:
+        scopes (Sequence[str]): Владельцы счетчиков ("user:<tg_id>", "global").
+        periods (Sequence[str]): Периоды ("d:<дата>", "m:<месяц>").
+    Returns:
+        Dict[Tuple[str, str], int]: Расход токенов по парам (владелец, период); отсутствующие пары не возвращаются.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(TokenUsage.scope, TokenUsage.period, TokenUsage.tokens)
+            .where(TokenUsage.scope.in_(scopes), TokenUsage.period.in_(periods))
+        )
+        return {(row.scope, row.period): row.tokens for row in result}
+
+
+async def add_token_usage(deltas: Dict[Tuple[str, str], int]) -> None:
+    """
+    Атомарно увеличивает счетчики расхода токенов (безопасно при нескольких процессах бота).
+
+    Args:
+        deltas (Dict[Tuple[str, str], int]): Прирост расхода по парам (владелец, период).
+    """
+    if not deltas:
+        return
+    rows = [{"scope": scope, "period": period, "tokens": tokens} for (scope, period), tokens in deltas.items()]
+    async with async_session() as session:
+        stmt = upsert_statement(
+            session.get_bind().dialect.name, TokenUsage, rows, ["scope", "period"],
+            lambda excluded: {"tokens": TokenUsage.tokens + excluded.tokens, "updated_at": func.now()},
+        )
+        if stmt is not None:
+            await session.execute(stmt)
+        else:
+            for row in rows:
+                usage = await session.get(TokenUsage, (row["scope"], row["period"]), with_for_update=True)
+                if usage is None:
+                    session.add(TokenUsage(**row))
+                else:
+                    usage.tokens += row["tokens"]
+        await session.commit()
+
+
+async def get_conversation(tg_id: int) -> Optional[Conversation]:
+    """
+    Возвращает сохраненный диалог пользователя.
+
+    Args:
+        tg_id (int): Telegram ID пользователя.
+    Returns:
+        Optional[Conversation]: Диалог или None, если он не сохранен.
+    """
+    async with async_session() as session:
+        return await session.get(Conversation, tg_id)
+
+
+async def save_conversation(tg_id: int, summary: str, turns: List[Dict[str, Any]]) -> None:
+    """
+    Сохраняет диалог пользователя (одной строкой на пользователя).
+
+    Args:
+        tg_id (int): Telegram ID пользователя.
+        summary (str): Краткое содержание ранних реплик.
+        turns (List[Dict[str, Any]]): Последние реплики.
+    """
+    async with async_session() as session:
+        await upsert_row(session, Conversation,
+                         {"tg_id": tg_id, "summary": summary, "turns": turns, "updated_at": datetime.now()},
+                         key_column="tg_id")
+        await session.commit()
+
+
+async def delete_conversation(tg_id: int) -> None:
+    """
+    Удаляет диалог пользователя.
+
+    Args:
+        tg_id (int): Telegram ID пользователя.
+    """
+    async with async_session() as session:
+        await session.execute(delete(Conversation).where(Conversation.tg_id == tg_id))
+        await session.commit()
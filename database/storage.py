@@ -0,0 +1,106 @@
+import time
+from typing import Any, Dict, Hashable, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+
+from database.models import FSMRecord, RateLimitBucket, async_session
+from database.requests import upsert_row
+from utils.rate_limiter import BaseRateLimiter
+from utils.loguru_logger import log
+
+
+class DatabaseStorage(BaseStorage):
+    """
+    Хранилище FSM в основной БД бота (PostgreSQL/SQLite). Позволяет нескольким процессам бота
+    разделять состояния пользователей.
+
+    :param key_builder: Построитель строковых ключей хранилища.
+    """
+    def __init__(self, key_builder: Optional[KeyBuilder] = None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state_name = state.state if isinstance(state, State) else state
+        async with async_session() as session:
+            await upsert_row(session, FSMRecord,
+                             {"key": self.key_builder.build(key, "state"), "state": state_name},
+                             key_column="key")
+            await session.commit()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with async_session() as session:
+            return await session.scalar(
+                select(FSMRecord.state).where(FSMRecord.key == self.key_builder.build(key, "state"))
+            )
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        async with async_session() as session:
+            await upsert_row(session, FSMRecord,
+                             {"key": self.key_builder.build(key, "data"), "data": data or None},
+                             key_column="key")
+            await session.commit()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with async_session() as session:
+            data = await session.scalar(
+                select(FSMRecord.data).where(FSMRecord.key == self.key_builder.build(key, "data"))
+            )
+            return dict(data) if data else {}
+
+    async def close(self) -> None:
+        pass
+
+
+class DatabaseRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель частоты запросов "token bucket" со счетчиками в основной БД бота.
+    Ведро читается с блокировкой строки (SELECT ... FOR UPDATE там, где она поддерживается),
+    поэтому лимит соблюдается при нескольких процессах бота.
+
+    :param rate: Скорость пополнения (токенов в секунду).
+    :param burst: Емкость ведра.
+    :param namespace: Пространство имен ключей (например, "cheap" или "expensive").
+    :param purge_every: Через сколько вызовов удалять из таблицы полностью пополнившиеся ведра.
+    """
+    def __init__(self, rate: float, burst: int, namespace: str, purge_every: int = 1000):
+        super().__init__(rate, burst)
+        self.namespace = namespace
+        self.purge_every = purge_every
+        self._calls = 0
+
+    async def consume(self, key: Hashable, cost: float = 1.0) -> float:
+        bucket_key = f"{self.namespace}:{key}"
+        now = time.time()
+        async with async_session() as session:
+            async with session.begin():
+                bucket = await session.scalar(
+                    select(RateLimitBucket).where(RateLimitBucket.key == bucket_key).with_for_update()
+                )
+                if bucket is None:
+                    tokens, retry_after = self._take(float(self.burst), 0.0, cost)
+                    await upsert_row(session, RateLimitBucket,
+                                     {"key": bucket_key, "tokens": tokens, "updated_at": now},
+                                     key_column="key")
+                else:
+                    tokens, retry_after = self._take(bucket.tokens, now - bucket.updated_at, cost)
+                    bucket.tokens, bucket.updated_at = tokens, now
+
+        self._calls += 1
+        if self._calls % self.purge_every == 0:
+            await self.purge_idle()
+        return retry_after
+
+    async def purge_idle(self) -> None:
+        """
+        Удаляет ведра пространства имен, простоявшие дольше времени полного пополнения.
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                delete(RateLimitBucket)
+                .where(RateLimitBucket.key.startswith(f"{self.namespace}:"))
+                .where(RateLimitBucket.updated_at < time.time() - self._refill_time)
+            )
+            await session.commit()
+            log.debug("Purged {} idle rate limit buckets ({})", result.rowcount, self.namespace)
@@ -0,0 +1,66 @@
+import os
+import time
+
+from aiogram import F, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+
+from config_data import config
+from database.instrumentation import query_stats
+from utils.profiler import ProfilerBusyError, profiler
+
+router = Router(name=__name__)
+# команды доступны только администраторам; сообщения остальных пользователей проходят дальше
+router.message.filter(F.from_user.id.in_(config.ADMIN_IDS))
+
+
+@router.message(Command("profile"), flags={"in_flight": "bypass"})
+async def cmd_profile(message: Message, command: CommandObject) -> None:
+    """
+    Профилирует работающий процесс бота N секунд (/profile N) и отправляет файл свернутых стеков
+    для построения flame graph (flamegraph.pl, speedscope.app).
+
+    :param message: Сообщение от администратора.
+    :param command: Команда с аргументом - длительностью профилирования в секундах.
+    """
+    seconds = config.PROFILE_DEFAULT_SECONDS
+    if command.args:
+        if not command.args.strip().isdigit():
+            await message.answer("Использование: /profile [секунды]")
+            return
+        seconds = int(command.args.strip())
+    seconds = max(1, min(seconds, config.PROFILE_MAX_SECONDS))
+
+    await message.answer(f"Профилирование процесса {os.getpid()} в течение {seconds} с...")
+    try:
+        folded = await profiler.profile(seconds)
+    except ProfilerBusyError:
+        await message.answer("Профилирование уже выполняется.")
+        return
+
+    filename = f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    await message.answer_document(BufferedInputFile(folded.encode("utf-8"), filename=filename),
+                                  caption="Свернутые стеки: flamegraph.pl или speedscope.app")
+
+
+@router.message(Command("dbstats"), flags={"in_flight": "bypass"})
+async def cmd_dbstats(message: Message, command: CommandObject) -> None:
+    """
+    Отправляет формы SQL-запросов процесса с наибольшим суммарным временем выполнения (/dbstats N).
+
+    :param message: Сообщение от администратора.
+    :param command: Команда с аргументом - количеством форм запросов.
+    """
+    count = int(command.args.strip()) if command.args and command.args.strip().isdigit() else 10
+    top = query_stats.top(max(1, min(count, 50)))
+    if not top:
+        await message.answer("Запросов к БД еще не было.")
+        return
+
+    lines = [f"Процесс {os.getpid()}, медленные запросы - от {config.DB_SLOW_QUERY_THRESHOLD} с"]
+    for shape_id, stats in top:
+        lines.append(f"\n[{shape_id}] всего {stats.total:.2f} с, вызовов {stats.calls}, "
+                     f"среднее {stats.total / stats.calls * 1000:.1f} мс, макс. {stats.max * 1000:.1f} мс, "
+                     f"медленных {stats.slow}\n{stats.statement[:500]}")
+    # тексты запросов содержат символы разметки Markdown
+    await message.answer("\n".join(lines)[:4096], parse_mode=None)
@@ -1,21 +1,24 @@
-import asyncio
 from aiogram.types import Message, User
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from typing import Optional
 
-from api.gpt_generators import gpt_text  # , gpt_image
 from states import main_states as st
-from database.requests import put_txt_gpt_data_to_db
+from database.requests import has_active_job
+from jobs.queue import job_queue
+from jobs.executors import run_text_generation
 import config_data.config as config
 from utils.actions_decorators import typing_action
-from utils.loguru_logger import log  # Импорт настроенного логгера
+from utils.scheduler import schedule_state_reset
+from utils.loguru_logger import log, truncate  # Импорт настроенного логгера
+from utils.metrics import PROMPTS_ADJUSTED
+from utils.token_estimator import token_estimator
 
-router = Router()
+router = Router(name=__name__)
 
 
 @router.message(F.text == "Сгенерировать \nтекст 📄")
-@typing_action(delay=1)
+@typing_action()
 async def cmd_generate_text(message: Message, state: FSMContext) -> None:
     """
     Обрабатывает команду для начала генерации текста.
@@ -26,6 +29,7 @@ async def cmd_generate_text(message: Message, state: FSMContext) -> None:
     try:
         log.debug("The user started generating text")
         await state.set_state(st.MainStates.await_input_for_gen_text)
+        schedule_state_reset(config.PENDING_STATE_TTL, state, st.MainStates.await_input_for_gen_text)
         await message.answer('Введите ваш запрос')
         user_id = message.from_user.id if message.from_user else 'неизвестный пользователь'
         log.info(f"User {user_id} set the state {st.MainStates.await_input_for_gen_text}")
@@ -36,11 +40,13 @@ async def cmd_generate_text(message: Message, state: FSMContext) -> None:
         await message.answer("Произошла ошибка, попробуйте позже.")
 
 
-@router.message(st.MainStates.await_input_for_gen_text)
-@typing_action(delay=1)
+@router.message(st.MainStates.await_input_for_gen_text, flags={"rate_limit": "expensive", "in_flight": "acquire", "token_quota": True})
+@typing_action()
 async def send_result(message: Message, state: FSMContext) -> None:
     """
     Обрабатывает запрос пользователя для генерации текста и отправляет результат.
+    Длина запроса оценивается в токенах до обращения к модели: запросы длиннее PROMPT_MAX_TOKENS отклоняются,
+    длиннее JOB_TEXT_MIN_TOKENS - ставятся в фоновую очередь задач.
 
     :param message: Сообщение от пользователя.
     :param state: Контекст состояния FSM.
@@ -52,8 +58,7 @@ async def send_result(message: Message, state: FSMContext) -> None:
         return
     
     log.debug("Processing user input to generate text")
-    await state.set_state(st.MainStates.processing_state)
-    log.info(f"Request to generate text from {user.username}: {message.text}")
+    log.info("Request to generate text from {}: {}", user.username, truncate(message.text))
     
     await message.answer(config.WAIT_MESSAGE_AFTER_COMMAND + config.WAIT_MESSAGE_AFTER_COMMAND_TXT)
     if message.text is None:
@@ -61,46 +66,28 @@ async def send_result(message: Message, state: FSMContext) -> None:
         await state.clear()
         return
     
-    response = await gpt_text(message.text)
-    if not response or not response.choices or not response.choices[0].message:
-        await message.answer("Не удалось получить ответ от GPT.")
+    tokens = token_estimator.count(message.text)
+    if tokens > config.PROMPT_MAX_TOKENS:
+        PROMPTS_ADJUSTED.inc(action="rejected")
+        log.info("Text generation request from user {} rejected: about {} tokens", user.id, tokens)
+        await message.answer(config.PROMPT_TOO_LONG_MESSAGE.format(tokens=tokens, limit=config.PROMPT_MAX_TOKENS))
         await state.clear()
         return
+
+    # Длинные запросы выполняются в фоновой очереди, короткие - сразу
+    if tokens >= config.JOB_TEXT_MIN_TOKENS:
+        if await has_active_job(user.id):
+            await message.answer(config.JOB_ALREADY_QUEUED_MESSAGE)
+            await state.clear()
+            return
+        await job_queue.enqueue("text", {"text": message.text}, chat_id=message.chat.id, tg_id=user.id)
+        PROMPTS_ADJUSTED.inc(action="queued")
+        log.info(f"Long text generation request from user {user.id} has been queued")
+    elif message.bot is not None:
+        await run_text_generation(message.bot, message.chat.id, user.id, message.text)
     
-    if response.choices[0].message.content and response.usage:
-        # Получение названия модели
-        model_name = response.model
-        log.debug(f"Model {model_name} used {response.usage.total_tokens} tokens for response.")
-    
-        await put_txt_gpt_data_to_db(request=message.text,
-                                     answer=response.choices[0].message.content,
-                                     total_token_quantity=response.usage.total_tokens,
-                                     model_name=model_name,
-                                     user_id=user.id,
-                                     )
-    if response.usage:
-        log.info(f"Data is saved in the database for the user {user.id}")
-        log.debug(f"Costs per request (in tokens): \n"
-                  f"Prompt tokens: {response.usage.prompt_tokens}, \n"
-                  f"Completion tokens: {response.usage.completion_tokens}, \n"
-                  f"Total tokens: {response.usage.total_tokens}\n"
-                  f"Generated response: {response.choices[0].message.content}\n")
-    
-    # Отправляем полученный ответ в чат
-    # await message.answer(response.choices[0].message.content)
-    if response.choices[0].message.content is not None:
-        await message.answer(response.choices[0].message.content)
-    else:
-        log.error("There is no response text to send to the user.")
-        await message.answer("Не удалось сформировать ответ.")
-        await state.clear()
-        return
-    
-    log.info(f"Reply sent to user {user.username}")
-    
-    await asyncio.sleep(3)  # дадим время на получение пользователем ответа и потом сбросим состояние
     await state.clear()
-    log.debug(f"State reset for user {user.id}")
+    log.debug("State reset for user {}", user.id)
 
 # -------------------------------------------------------------------------------------------------#
 # These handlers are workable but API they use is not free, so we use free Kandinsky API instead   #
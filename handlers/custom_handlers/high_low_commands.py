@@ -5,18 +5,19 @@ from aiogram.fsm.context import FSMContext
 from datetime import datetime
 from aiogram.types import FSInputFile
 from os import path
-from typing import Sequence
 
 from database.requests import get_high_low_data, get_user
 from keyboards.inline.high_low_buttons import get_high_low_kb
-from config_data.config import BASE_DIR, WAIT_MESSAGE_AFTER_COMMAND
-from utils.common import async_write_file, get_report_header
+from config_data.config import (BASE_DIR, PENDING_STATE_TTL, WAIT_MESSAGE_AFTER_COMMAND,
+                                WAIT_MESSAGE_POOL_OVERLOADED)
+from utils.common import build_report_file, get_report_header
+from utils.workers import PoolOverloadedError
 from utils.actions_decorators import (typing_action, upload_document_action)
+from utils.scheduler import schedule_state_reset
 from states import main_states as st
 from utils.loguru_logger import log
-from database.models import RequestAndResponse
 
-router = Router()
+router = Router(name=__name__)
 
 
 async def get_high_low_message(comm: str, message: Message) -> None:
@@ -42,7 +43,7 @@ async def get_high_low_message(comm: str, message: Message) -> None:
 
 
 @router.message(Command("high"))
-@typing_action(delay=1)
+@typing_action()
 async def cmd_high(message: Message) -> None:
     """
     Обрабатывает команду для получения запросов с наибольшей стоимостью.
@@ -53,7 +54,7 @@ async def cmd_high(message: Message) -> None:
 
 
 @router.message(Command("low"))
-@typing_action(delay=1)
+@typing_action()
 async def cmd_low(message: Message) -> None:
     """
     Обрабатывает команду для получения запросов с наименьшей стоимостью.
@@ -63,7 +64,7 @@ async def cmd_low(message: Message) -> None:
     await get_high_low_message('/low', message)
 
 
-@typing_action(delay=1)
+@typing_action()
 async def cmd_set_custom_num(message: Message, state: FSMContext) -> None:
     """
     Обрабатывает команду для установки пользовательского количества запросов.
@@ -73,6 +74,7 @@ async def cmd_set_custom_num(message: Message, state: FSMContext) -> None:
     """
     await message.answer("Введите количество запросов:")
     await state.set_state(st.HighLowStates.waiting_for_custom_num_state)
+    schedule_state_reset(PENDING_STATE_TTL, state, st.HighLowStates.waiting_for_custom_num_state)
 
 
 # Обработчик пользовательского ввода в состоянии waiting_for_custom_num_state
@@ -139,17 +141,20 @@ async def get_high_low_history_with_custom_num(message: Message,
         return
     
     report_header = await get_report_header(user)
-    report = await get_report(responses, report_header)
     
     today_str = datetime.now().strftime("%Y.%m.%d_%H-%M_%S")
     file_name = f"{user.tg_id}_{high_or_low_filter}{count}_{today_str}.txt"
     report_file_path = path.join(BASE_DIR, "reports", file_name)
-    await async_write_file(report_file_path, report)
+    try:
+        report_file_path = await build_report_file(report_file_path, report_header, responses)
+    except PoolOverloadedError:
+        await message.answer(WAIT_MESSAGE_POOL_OVERLOADED)
+        return
     
     report_file = FSInputFile(report_file_path)
     
     # @upload_document_action_with_message(delay=3)
-    @upload_document_action(delay=3)
+    @upload_document_action()
     async def send_file(mess: Message) -> None:
         await mess.answer_document(report_file, caption=report_header)
     
@@ -164,7 +169,8 @@ async def get_high_low_history(callback_query: CallbackQuery, state: FSMContext)
     :param callback_query: Callback-запрос от пользователя.
     :param state: Контекст состояния FSM.
     """
-    if not isinstance(callback_query.message, Message):
+    message = callback_query.message
+    if not isinstance(message, Message):  # None или InaccessibleMessage
         log.error("Невозможно получить доступ к сообщению для отправки документа.")
         return
     
@@ -187,7 +193,7 @@ async def get_high_low_history(callback_query: CallbackQuery, state: FSMContext)
     
     if count_str == "custom_num":
         await state.set_state(st.HighLowStates.waiting_for_custom_num_state)
-        await cmd_set_custom_num(callback_query.message, state)
+        await cmd_set_custom_num(message, state)
         await state.update_data(high_or_low_filter=high_or_low_filter)
         await callback_query.answer()
         return
@@ -200,7 +206,7 @@ async def get_high_low_history(callback_query: CallbackQuery, state: FSMContext)
         high_or_low_filter = user_data.get("high_or_low_filter", "")
         
         if count is None:
-            await callback_query.message.answer("The number of requests must be an integer.")
+            await message.answer("The number of requests must be an integer.")
             await callback_query.answer()
             return
     
@@ -209,18 +215,21 @@ async def get_high_low_history(callback_query: CallbackQuery, state: FSMContext)
     
     if responses:
         
-        today_str = datetime.now().strftime("%Y.%m.%d_%H-%M")
+        today_str = datetime.now().strftime("%Y.%m.%d_%H-%M_%S")
         file_name = f"{user.tg_id}_{high_or_low_filter}{count}_{today_str}.txt"
         report_file_path = path.join(BASE_DIR, "reports", file_name)
         
         report_header = await get_report_header(user)
-        report = await get_report(responses, report_header)
-        
-        await async_write_file(report_file_path, report)
+        try:
+            report_file_path = await build_report_file(report_file_path, report_header, responses)
+        except PoolOverloadedError:
+            # callback уже подтвержден сообщением ожидания: повторный answer() Telegram отклоняет
+            await message.answer(WAIT_MESSAGE_POOL_OVERLOADED)
+            return
         
         report_file = FSInputFile(report_file_path)
         
-        @upload_document_action(delay=3)
+        @upload_document_action()
         async def send_file(callback_q: CallbackQuery) -> None:
             mess = callback_q.message
             if not isinstance(mess, Message):
@@ -230,42 +239,17 @@ async def get_high_low_history(callback_query: CallbackQuery, state: FSMContext)
             await mess.answer_document(report_file, caption=report_header)
         
         await send_file(callback_query)
-        await callback_query.message.delete()
+        await message.delete()
     
     else:
         # Добавляем декоратор для отправки сообщения о пустой истории
-        @typing_action(delay=1)
+        @typing_action()
         async def send_empty_history(message: Message) -> None:
             await message.answer("Ваша история запросов пока пуста")
         
-        if not isinstance(callback_query.message, Message):
+        if not isinstance(message, Message):
             await callback_query.answer("Невозможно получить доступ к сообщению.")
             return
-        await send_empty_history(callback_query.message)
+        await send_empty_history(message)
     
     await callback_query.answer()
-
-
-# async def get_report(responses: List[Any], report_header: str) -> str:
-async def get_report(responses: Sequence[tuple[RequestAndResponse, str]], report_header: str) -> str:
-    """
-    Формирует отчет на основе данных запросов и ответов.
-
-    :param responses: Последовательность кортежей,
-    содержащих объекты RequestAndResponse и название модели.
-    :param report_header: Заголовок отчета.
-    :return: Сформированный отчет в виде строки.
-    """
-    report = report_header
-    report += "\n\n".join(
-        [
-            f"Запись #{num}\n\n"
-            f"Дата запроса:\n{resp[0].requests_date}\n\n"
-            f"Модель ИИ:\n{resp[1]}\n\n"
-            f"Общее количество токенов:\n{resp[0].total_token_quantity}\n"
-            f"Запрос:\n{'-' * 20}\n{resp[0].request}\n"
-            f"Ответ:\n{'-' * 20}\n{resp[0].answer}\n\n"
-            for num, resp in enumerate(responses, start=1)
-        ]
-    )
-    return report
@@ -7,15 +7,17 @@ from os import path
 
 from database.requests import get_history_data, get_user
 from keyboards.inline.history_buttons import get_history_kb
-from config_data.config import BASE_DIR
-from utils.common import async_write_file, get_report_header
+from config_data.config import BASE_DIR, WAIT_MESSAGE_POOL_OVERLOADED
+from utils.common import build_report_file, get_report_header
+from utils.reports import render_history_report
+from utils.workers import PoolOverloadedError
 from utils.actions_decorators import typing_action, upload_document_action
 
-router = Router()
+router = Router(name=__name__)
 
 
 @router.message(Command("history"))
-@typing_action(delay=1)
+@typing_action()
 async def cmd_history(message: Message) -> None:
     """
     Обрабатывает команду для получения истории запросов.
@@ -50,30 +52,19 @@ async def get_history(callback_query: CallbackQuery) -> None:
     
     if responses:
         # user = callback_query.from_user
-        today_str = datetime.now().strftime("%Y.%m.%d_%H-%M")
+        today_str = datetime.now().strftime("%Y.%m.%d_%H-%M_%S")
         file_name = f"{user.tg_id}_{period_or_count_filter}_{today_str}.txt"
         file_path = path.join(BASE_DIR, "reports", file_name)
         
         # report_header = "История запросов пользователя {} ({}):\n\n".format(user.id, user.username or "N/A")
         report_header = await get_report_header(user)
-        await async_write_file(file_path, report_header)
-        
-        num = 1
-        for response in responses:
-            
-            request_and_response, model_name = response[0], response[1]
-            
-            hist_record = (f"Запись #{num}.\n\n"
-                           f"Модель ИИ:\n{'-' * 20}\n{model_name}\n\n"
-                           f"Общее количество токенов:\n{'-' * 20}\n{request_and_response.total_token_quantity}\n\n"
-                           f"Запрос:\n{'-' * 20}\n{request_and_response.request}\n\n"
-                           f"Ответ:\n{'-' * 20}\n{request_and_response.answer}\n\n\n\n\n"
-                           )
-            
-            await async_write_file(file_path, hist_record)
-            num += 1
+        try:
+            file_path = await build_report_file(file_path, report_header, responses, render_history_report)
+        except PoolOverloadedError:
+            await callback_query.answer(WAIT_MESSAGE_POOL_OVERLOADED, show_alert=True)
+            return
             
-        @upload_document_action(delay=3)
+        @upload_document_action()
         async def send_file(callback_q: CallbackQuery) -> None:
             mess = callback_q.message
             if mess is not None and not isinstance(mess, InaccessibleMessage):
@@ -83,7 +74,7 @@ async def get_history(callback_query: CallbackQuery) -> None:
         await send_file(callback_query)
     else:
         # Добавляем декоратор для отправки сообщения о пустой истории
-        @typing_action(delay=1)
+        @typing_action()
         async def send_empty_history(mess: Message) -> None:
             await mess.answer("Ваша история запросов пока пуста")
         
@@ -0,0 +1,38 @@
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from utils.actions_decorators import typing_action
+from utils.token_quotas import token_quotas
+
+router = Router(name=__name__)
+
+BUDGET_NAMES = {
+    ("user", "d"): "Ваш расход за сегодня",
+    ("user", "m"): "Ваш расход за месяц",
+    ("global", "d"): "Общий расход бота за сегодня",
+    ("global", "m"): "Общий расход бота за месяц",
+}
+
+
+@router.message(Command("usage"), flags={"in_flight": "bypass"})
+@typing_action()
+async def cmd_usage(message: Message) -> None:
+    """
+    Отправляет пользователю расход токенов и оставшиеся лимиты за день и месяц.
+
+    :param message: Сообщение от пользователя.
+    """
+    if message.from_user is None:
+        await message.answer("Не удалось определить пользователя.")
+        return
+    
+    usage = await token_quotas.usage(message.from_user.id)
+    if not usage:
+        await message.answer("Лимиты токенов не установлены.")
+        return
+    
+    lines = [f"{BUDGET_NAMES[(budget.owner, budget.period)]}: {used} из {budget.limit} токенов "
+             f"({min(100, used * 100 // budget.limit)}%)"
+             for budget, used in usage]
+    await message.answer("\n".join(lines))
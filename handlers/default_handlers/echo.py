@@ -3,10 +3,10 @@ from aiogram import Router
 from keyboards.reply import main_kb as kb
 from utils.actions_decorators import typing_action
 
-router = Router()
+router = Router(name=__name__)
 
 
-@typing_action(delay=2)
+@typing_action()
 async def reply_to_text(message: Message) -> None:
     """
     Отправляет ответное сообщение с предложением выбрать тип генерации контента.
@@ -1,33 +1,26 @@
-import json
-import os
 from aiogram.types import Message
 from aiogram import Router
 from aiogram.filters import Command
 
-from config_data.config import CONFIG_DIR
 from utils.actions_decorators import typing_action
+from utils.command_sync import get_commands
 
-router = Router()
+router = Router(name=__name__)
 
 
 @router.message(Command("help"))
-@typing_action(delay=1)
+@typing_action()
 async def bot_help(message: Message) -> None:
     """
     Отправляет список доступных команд и их описания.
 
     :param message: Входящее сообщение от пользователя.
     """
-    # Получаем путь к директории, в которой находится скрипт
-    config_dir = CONFIG_DIR
-
-    # Путь к JSON-файлу
-    json_path = os.path.join(config_dir, 'bot_commands.json')
-
-    with open(json_path, 'r', encoding='utf-8') as file:
-        bot_commands = json.load(file)
+    # Команды загружаются из bot_commands.json один раз, с учетом языка пользователя
+    language_code = message.from_user.language_code if message.from_user else None
+    bot_commands = get_commands(language_code)
 
     # text = [f"/{command} - {desk}" for command, desk in DEFAULT_COMMANDS]
-    text = [f"/{cmd['command']}\t\t\t\t\t - {cmd['description']}" for cmd in bot_commands]
+    text = [f"/{cmd.command}\t\t\t\t\t - {cmd.description}" for cmd in bot_commands]
 
     await message.answer("\n".join(text))
@@ -4,16 +4,17 @@ from aiogram.filters import CommandStart
 from keyboards.reply import main_kb as kb
 from aiogram.fsm.context import FSMContext
 from database.requests import set_user
+from utils.conversations import conversation_store
 from utils.actions_decorators import typing_action
 
-router = Router()
+router = Router(name=__name__)
 
 
-@router.message(CommandStart())
-@typing_action(delay=1)
+@router.message(CommandStart(), flags={"in_flight": "bypass"})
+@typing_action()
 async def bot_start(message: Message, state: FSMContext) -> None:
     """
-    Обрабатывает команду /start, очищает состояние и регистрирует пользователя.
+    Обрабатывает команду /start, очищает состояние, начинает диалог с моделью заново и регистрирует пользователя.
 
     :param message: Входящее сообщение от пользователя.
     :param state: Контекст состояния FSM.
@@ -31,6 +32,7 @@ async def bot_start(message: Message, state: FSMContext) -> None:
     # Передаем tg_id и username в функцию set_user
     if user:
         await set_user(tg_id=user.id, username=username)
+        await conversation_store.reset(user.id)
     else:
         raise ValueError("user is None")
     
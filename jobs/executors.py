@@ -0,0 +1,170 @@
+# jobs/executors.py
+# Исполнители фоновых задач очереди: генерация изображений и длинных текстов.
+import base64
+from io import BytesIO
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.enums import ChatAction
+from aiogram.types import BufferedInputFile
+
+from api.gpt_generators import gpt_text
+from api.kandinsky_generators import Text2ImageAPI
+from database.models import Job
+from database.requests import put_txt_gpt_data_to_db, save_job_result
+from jobs.queue import job_queue
+import config_data.config as config
+from utils.actions_decorators import chat_action
+from utils.loguru_logger import log, truncate
+from utils.metrics import PROMPT_ESTIMATE_RATIO, TOKENS
+from utils.token_quotas import token_quotas
+from utils.conversations import conversation_store
+from utils.token_estimator import predict_cost, token_estimator
+
+
+async def deliver_answer(bot: Bot, chat_id: int, tg_id: int, text: str, answer: str,
+                         completion_tokens: Optional[int]) -> None:
+    """
+    Отправляет ответ модели в чат и добавляет запрос и ответ в диалог.
+
+    :param bot: Экземпляр бота.
+    :param chat_id: ID чата, в который отправляется ответ.
+    :param tg_id: Telegram ID пользователя.
+    :param text: Текст запроса.
+    :param answer: Текст ответа модели.
+    :param completion_tokens: Количество токенов ответа (из usage), если известно.
+    """
+    await bot.send_message(chat_id, answer)
+    log.info("Reply sent to user {}", tg_id)
+    await conversation_store.add_exchange(tg_id, text, answer, completion_tokens)
+
+
+async def run_text_generation(bot: Bot, chat_id: int, tg_id: int, text: str, reload_context: bool = False,
+                              job_id: Optional[int] = None) -> None:
+    """
+    Получает ответ GPT на запрос пользователя с учетом контекста диалога, сохраняет его в БД и отправляет в чат.
+    Запрос с контекстом, не помещающийся в контекстное окно модели, сокращается до обращения к модели.
+
+    :param bot: Экземпляр бота.
+    :param chat_id: ID чата, в который отправляется ответ.
+    :param tg_id: Telegram ID пользователя.
+    :param text: Текст запроса.
+    :param reload_context: Перечитать диалог из БД (для фоновых задач, выполняемых любым процессом).
+    :param job_id: ID задачи очереди: ответ сохраняется в задаче до записи в БД и отправки.
+    """
+    history = await conversation_store.context(tg_id, reload=reload_context)
+    plan = token_estimator.fit_prompt(text, history, config.MODEL_CONTEXT_TOKENS - config.COMPLETION_RESERVE_TOKENS)
+    if plan.trimmed:
+        log.info("Prompt of user {} trimmed to about {} tokens", tg_id, plan.prompt_tokens)
+        await bot.send_message(chat_id, config.PROMPT_TRIMMED_MESSAGE)
+    log.debug("Prompt of user {}: about {} tokens (~${:.5f} with a full reply), {} context messages dropped",
+              tg_id, plan.prompt_tokens, predict_cost(plan.prompt_tokens, config.COMPLETION_RESERVE_TOKENS),
+              plan.history_dropped)
+    response = await gpt_text(plan.text, plan.history)
+    if not response or not response.choices or not response.choices[0].message:
+        await bot.send_message(chat_id, "Не удалось получить ответ от GPT.")
+        return
+    
+    answer = response.choices[0].message.content
+    completion_tokens = response.usage.completion_tokens if response.usage else None
+    if job_id is not None and answer is not None:
+        # повторная попытка задачи (ошибка отправки, истекшая аренда, остановка процесса) отправит
+        # сохраненный ответ, не обращаясь к модели и не учитывая расход снова
+        await save_job_result(job_id, {"answer": answer, "completion_tokens": completion_tokens})
+
+    if response.choices[0].message.content and response.usage:
+        # Получение названия модели
+        model_name = response.model
+        log.debug("Model {} used {} tokens for response.", model_name, response.usage.total_tokens)
+        
+        await put_txt_gpt_data_to_db(request=text,
+                                     answer=response.choices[0].message.content,
+                                     total_token_quantity=response.usage.total_tokens,
+                                     model_name=model_name,
+                                     user_id=tg_id,
+                                     )
+    if response.usage:
+        token_quotas.record(tg_id, response.usage.total_tokens)
+        TOKENS.inc(response.usage.prompt_tokens, model=response.model, kind="prompt")
+        TOKENS.inc(response.usage.completion_tokens, model=response.model, kind="completion")
+        PROMPT_ESTIMATE_RATIO.observe(response.usage.prompt_tokens / plan.prompt_tokens)
+        log.info("Data is saved in the database for the user {}", tg_id)
+        log.debug("Costs per request (in tokens): prompt {}, completion {}, total {}; generated response: {}",
+                  response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens,
+                  truncate(response.choices[0].message.content))
+    
+    # Отправляем полученный ответ в чат
+    if answer is None:
+        log.error("There is no response text to send to the user.")
+        await bot.send_message(chat_id, "Не удалось сформировать ответ.")
+        return
+    
+    await deliver_answer(bot, chat_id, tg_id, text, answer, completion_tokens)
+
+
+@job_queue.register("text")
+async def execute_text_job(bot: Bot, job: Job) -> None:
+    """
+    Выполняет задачу генерации длинного текста.
+
+    :param bot: Экземпляр бота.
+    :param job: Задача очереди (payload: {"text": ...}; после ответа модели - также "answer"
+        и "completion_tokens").
+    """
+    answer = job.payload.get("answer")
+    if answer is not None:
+        # ответ получен предыдущей попыткой, но не был доставлен
+        log.info("Job {} already has an answer, re-sending it to user {}", job.id, job.tg_id)
+        await deliver_answer(bot, job.chat_id, job.tg_id, job.payload["text"], answer,
+                             job.payload.get("completion_tokens"))
+        return
+
+    async with chat_action(bot, job.chat_id, ChatAction.TYPING):
+        await run_text_generation(bot, job.chat_id, job.tg_id, job.payload["text"], reload_context=True,
+                                  job_id=job.id)
+
+
+@job_queue.register("image")
+async def execute_image_job(bot: Bot, job: Job) -> None:
+    """
+    Выполняет задачу генерации изображения с помощью Kandinsky и отправляет изображение в чат.
+
+    :param bot: Экземпляр бота.
+    :param job: Задача очереди (payload: {"prompt": ...}).
+    """
+    prompt: str = job.payload["prompt"]
+    log.info("Generating image for user {}: {}", job.tg_id, truncate(prompt))
+    
+    api = Text2ImageAPI(url=config.FUSIONBRAIN_URL,
+                        api_key=config.FUSIONBRAIN_API_KEY,
+                        secret_key=config.FUSIONBRAIN_SECRET_KEY)
+    try:
+        async with chat_action(bot, job.chat_id, ChatAction.UPLOAD_PHOTO):
+            model_id: int = await api.get_model()
+            uuid = await api.generate(prompt, model_id)
+            
+            # бывает, что Kandinsky API не отдает даже uuid, предусмотрим этот случай
+            if uuid is None:
+                await bot.send_message(
+                    job.chat_id,
+                    "Ошибка: Сервер не смог обработать ваш запрос (возможно, из-за большой нагруженности).\n"
+                    "Попробуйте еще раз. Если ошибка будет повторяться, попробуйте позже или обратитесь к разработчику."
+                )
+                return
+            
+            # Ожидание завершения генерации, получаем ответ в виде данных Base64
+            images_base64_string: list[str] | None = await api.check_generation(uuid)
+            
+            if images_base64_string is None:
+                await bot.send_message(job.chat_id, "Ошибка: не удалось сгенерировать изображение. Попробуйте еще раз.")
+                return
+            
+            # Декодирование данных Base64 и проверка, что получено корректное изображение
+            images_base64_data: bytes = base64.b64decode(images_base64_string[0])
+            from PIL import Image  # Pillow загружается при первой генерации изображения, а не при запуске
+            Image.open(BytesIO(images_base64_data)).verify()
+            
+            input_file = BufferedInputFile(images_base64_data, filename="generated_image.png")
+            await bot.send_photo(job.chat_id, photo=input_file)
+    finally:
+        await api.close()
@@ -0,0 +1,184 @@
+# jobs/queue.py
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+
+from config_data import config
+from database.models import Job
+from database.requests import claim_job, count_jobs, enqueue_job, extend_job_lease, finish_job
+from utils.loguru_logger import log
+from utils.metrics import QUEUE_DEPTH, registry
+from utils.tracing import NO_TRACE, current_trace_id, tracer
+
+JobExecutor = Callable[[Bot, Job], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    Долговременная очередь фоновых задач на базе основной БД с локальным пулом обработчиков.
+
+    Обработчики сообщений ставят задачу в очередь и сразу возвращаются, обработчики очереди забирают задачи
+    в аренду, выполняют их и отправляют результат пользователю. Аренда продлевается во время выполнения;
+    задачи, аренда которых истекла (процесс упал или был перезапущен), выполняются повторно.
+
+    :param workers: Количество обработчиков очереди в процессе.
+    :param poll_interval: Интервал опроса БД (в секундах), если локальных уведомлений о новых задачах нет.
+    :param lease: Срок аренды задачи в секундах.
+    :param max_attempts: Максимальное количество попыток выполнения задачи.
+    """
+    def __init__(self, workers: int, poll_interval: float, lease: float, max_attempts: int):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._executors: Dict[str, JobExecutor] = {}
+        self._tasks: List[asyncio.Task[None]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.active = 0  # количество выполняющихся в процессе задач
+
+    def register(self, kind: str) -> Callable[[JobExecutor], JobExecutor]:
+        """
+        Декоратор регистрации исполнителя задач указанного типа.
+
+        :param kind: Тип задачи.
+        """
+        def decorator(executor: JobExecutor) -> JobExecutor:
+            self._executors[kind] = executor
+            return executor
+
+        return decorator
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], chat_id: int, tg_id: int) -> int:
+        """
+        Ставит задачу в очередь и будит обработчики очереди.
+
+        :param kind: Тип задачи.
+        :param payload: Параметры задачи.
+        :param chat_id: ID чата, в который отправляется результат.
+        :param tg_id: Telegram ID пользователя.
+        :return: ID задачи.
+        """
+        if kind not in self._executors:
+            raise ValueError(f"Unknown job kind: {kind}")
+        trace_id = current_trace_id()
+        if trace_id != NO_TRACE:
+            # выполнение задачи продолжает трассу апдейта, поставившего ее в очередь
+            payload = {**payload, "trace_id": trace_id}
+        job_id = await enqueue_job(kind, payload, chat_id, tg_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def start(self, bot: Bot) -> None:
+        """
+        Запускает обработчики очереди (вызывается при запуске диспетчера).
+
+        :param bot: Экземпляр бота для отправки результатов.
+        """
+        if self._tasks:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(bot, index), name=f"job-worker-{index}")
+                       for index in range(self.workers)]
+        log.info(f"Job queue started with {self.workers} workers")
+
+    async def stop(self, timeout: float = 0) -> None:
+        """
+        Останавливает обработчики очереди: новые задачи больше не забираются, выполняющиеся
+        дорабатывают в течение timeout секунд, после чего прерываются и возвращаются в очередь.
+
+        :param timeout: Время ожидания выполняющихся задач в секундах.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if timeout > 0:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log.info("Job queue stopped")
+
+    async def collect_metrics(self) -> None:
+        """
+        Обновляет метрики очереди: задачи в БД по статусам и выполняющиеся в процессе.
+        """
+        for status in ("pending", "running"):
+            QUEUE_DEPTH.set(await count_jobs(status), queue="jobs", status=status)
+        QUEUE_DEPTH.set(self.active, queue="jobs", status="local_active")
+
+    async def _wait_for_jobs(self) -> None:
+        assert self._wakeup is not None
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        if not self._stopping:
+            self._wakeup.clear()
+
+    async def _worker(self, bot: Bot, index: int) -> None:
+        while not self._stopping:
+            try:
+                job = await claim_job(self.lease)
+            except Exception as e:
+                log.error(f"Job worker {index} failed to claim a job: {repr(e)}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if job is None:
+                await self._wait_for_jobs()
+                continue
+
+            await self._execute(bot, job)
+
+    async def _keep_lease(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await extend_job_lease(job_id, self.lease)
+            except Exception as e:
+                log.warning(f"Failed to extend lease of job {job_id}: {repr(e)}")
+
+    async def _execute(self, bot: Bot, job: Job) -> None:
+        executor = self._executors.get(job.kind)
+        if executor is None:
+            log.error(f"No executor registered for job {job.id} ({job.kind})")
+            await finish_job(job.id, "failed", error=f"Unknown job kind: {job.kind}")
+            return
+
+        self.active += 1
+        heartbeat = asyncio.create_task(self._keep_lease(job.id))
+        try:
+            with tracer.trace(f"job {job.kind}", trace_id=job.payload.get("trace_id"), job_id=job.id,
+                              attempt=job.attempts):
+                await executor(bot, job)
+        except asyncio.CancelledError:
+            # остановка процесса: задача будет выполнена заново этим или другим процессом
+            await asyncio.shield(finish_job(job.id, "pending", error="Interrupted by shutdown"))
+            raise
+        except Exception as e:
+            log.exception(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {repr(e)}")
+            if job.attempts < self.max_attempts:
+                await finish_job(job.id, "pending", error=repr(e))
+            else:
+                await finish_job(job.id, "failed", error=repr(e))
+                with contextlib.suppress(Exception):
+                    await bot.send_message(job.chat_id, config.JOB_FAILED_MESSAGE)
+        else:
+            await finish_job(job.id, "done")
+        finally:
+            heartbeat.cancel()
+            self.active -= 1
+
+
+# Общая очередь фоновых задач бота
+job_queue = JobQueue(workers=config.JOB_WORKERS,
+                     poll_interval=config.JOB_POLL_INTERVAL,
+                     lease=config.JOB_LEASE,
+                     max_attempts=config.JOB_MAX_ATTEMPTS)
+registry.add_collector(job_queue.collect_metrics)
@@ -1,109 +1,91 @@
-import os
-import json
+import signal
 import asyncio
-from aiogram import Bot, Dispatcher
-from aiogram.types import BotCommand
-from typing import List
 
-from utils import bot_loader
-from handlers.custom_handlers import (gpt_generators, kandinsky_generators, history_command,
-                                      high_low_commands, processing_state_handling)
-from handlers.default_handlers import start, help, echo
-from middlewares.antiflood import AntiFloodMiddleware
-from middlewares.check_old_requests import UpdateTimeValidationMiddleware
-from database.models import async_create_all
 from config_data import config
-from utils.loguru_logger import log
+from utils.loguru_logger import log, setup_logger
 
-# Инициализируем бота
-bot = bot_loader.bot
-dp = Dispatcher()
-
-# Подключаем мидлвейры
-dp.message.middleware(AntiFloodMiddleware())
-dp.message.middleware(UpdateTimeValidationMiddleware())
-
-# Регистрируем роутеры обработчиков
-dp.include_routers(
-    processing_state_handling.router,
-    gpt_generators.router,
-    kandinsky_generators.router,
-    history_command.router,
-    high_low_commands.router,
-    start.router,
-    help.router,
-    echo.router,
-)
+# Остановка запрошена сигналом: после выхода из main() бот не перезапускается
+shutdown_requested = False
+# Диспетчер начал long polling: до этого момента stop_polling() завершается ошибкой
+polling_started = False
 
 
 async def main() -> None:
     """Запускает бота"""
+    global polling_started
+    # модули бота загружаются здесь, а не при импорте main.py: порожденные рабочие процессы (BOT_WORKERS)
+    # импортируют main.py заново, и диспетчер со всеми обработчиками в них создается только один раз (bot_app)
+    from database.models import async_create_all
+    from utils.bot_loader import bot
+    from utils.command_sync import command_sync
+    from utils.username_refresher import username_refresher
+
     await async_create_all()
-    await async_set_bot_commands(current_bot=bot)
+    metrics_server: asyncio.Task[None] | None = None
+    # меню команд сверяется с Telegram в фоне и обновляется только при расхождении
+    command_sync.start(bot)
+    # имена пользователей сверяются с Telegram в фоне пакетами, с общим ограничением частоты запросов
+    username_refresher.start(bot)
     
-    # очищаем состояния и удаляем необработанные до запуска функции main() апдейты
-    await bot.delete_webhook(drop_pending_updates=True)
-    
-    # для устранения ошибок соединения с сервером Telegram
     try:
-        await dp.start_polling(bot, request_timeout=60)  # Увеличим значение таймаута
-        log.info("Bot started successfully")
+        if config.BOT_WORKERS > 1:
+            if config.DELIVERY_MODE != "webhook":
+                raise ValueError("BOT_WORKERS > 1 requires DELIVERY_MODE=webhook")
+            from utils.supervisor import Supervisor
+            log.info(f"Bot started in supervisor mode with {config.BOT_WORKERS} workers")
+            await Supervisor(workers=config.BOT_WORKERS).run()
+        elif config.DELIVERY_MODE == "webhook":
+            from bot_app import dp
+            from utils.web_server import run_webhook
+            log.info("Bot started in webhook mode")
+            await run_webhook(dp, bot)
+        else:
+            from bot_app import dp, graceful_shutdown
+            from utils.metrics import create_metrics_app
+            from utils.web_server import serve_app
+            # необработанные апдейты не удаляются: продолжаем с сохраненного при остановке смещения
+            await bot.delete_webhook(drop_pending_updates=False)
+            await graceful_shutdown.restore_offset(bot)
+            
+            # в режиме long polling метрики отдает отдельный HTTP-сервер на том же порту
+            if config.METRICS_ENABLED:
+                metrics_server = asyncio.create_task(serve_app(create_metrics_app()))
+            
+            # для устранения ошибок соединения с сервером Telegram
+            log.info("Bot started in polling mode")
+            # сигналы обрабатываются в main_loop(), чтобы отличать остановку от перезапуска;
+            # start_polling занимает блокировку диспетчера до первой точки переключения задач
+            polling_started = True
+            await dp.start_polling(bot, request_timeout=60, handle_signals=False)  # Увеличим значение таймаута
     
     finally:
+        polling_started = False
+        if metrics_server is not None:
+            metrics_server.cancel()
+            await asyncio.gather(metrics_server, return_exceptions=True)
+        await command_sync.stop()
+        await username_refresher.stop()
         await bot.session.close()
-    
-    # Периодическое обновление команд кнопки "Меню" (каждые 5 минут)
-    await asyncio.create_task(async_periodic_command_updater(interval=300))
-
-
-async def get_username_by_id(tg_id: int, current_bot: Bot) -> str | None:
-    """
-    Возвращает имя пользователя по его Telegram ID.
-
-    :param tg_id: Telegram ID пользователя.
-    :param current_bot: Экземпляр бота.
-    :return: Имя пользователя или None, если не удалось получить.
-    """
-    try:
-        user = await current_bot.get_chat(tg_id)
-        return user.username
-    except Exception as e:
-        # print(f"Error retrieving username for {tg_id}: {e}")
-        log.error(f"Error retrieving username for {tg_id}: {e}")
-        return None
 
 
-async def async_set_bot_commands(current_bot: Bot) -> None:
+def request_shutdown(main_task: asyncio.Task[None]) -> None:
     """
-    Устанавливает команды бота на основе файла bot_commands.json.
-    :param current_bot: Экземпляр бота.
-    """
-    
-    # Путь к JSON-файлу
-    json_path = os.path.join(config.CONFIG_DIR, 'bot_commands.json')
-    
-    with open(json_path, 'r', encoding='utf-8') as file:
-        bot_commands = json.load(file)
-    
-    commands: List[BotCommand] = [BotCommand(**cmd) for cmd in bot_commands]
-    await current_bot.set_my_commands(commands)
-
+    Обработчик сигналов SIGINT/SIGTERM: прекращает прием апдейтов и запускает корректную остановку.
 
-async def async_periodic_command_updater(interval: int = 300) -> None:
+    :param main_task: Задача, в которой работает main().
     """
-    Периодически обновляет команды бота, восстанавливая кнопку "Меню" в левом нижнем углу,
-    иногда исчезающую в случае ошибки (соединения и прочих).
-
-    :param interval: Интервал времени в секундах между обновлениями команд.
-    """
-    while True:
-        try:
-            await async_set_bot_commands(bot)
-            log.info("Bot commands have been updated")
-        except Exception as e:
-            log.error(f"Error updating bot commands: {repr(e)}")
-        
-        await asyncio.sleep(interval)
+    global shutdown_requested
+    if shutdown_requested:
+        return
+    shutdown_requested = True
+    log.info("Shutdown requested, stopping intake of new updates")
+    if config.DELIVERY_MODE == "webhook" or config.BOT_WORKERS > 1 or not polling_started:
+        # остановка HTTP-сервера прекращает прием апдейтов, диспетчер дорабатывает при остановке приложения;
+        # до начала long polling (создание схемы БД, восстановление смещения) main() просто отменяется
+        main_task.cancel()
+    else:
+        from bot_app import dp
+        asyncio.create_task(dp.stop_polling())
 
 
 async def main_loop() -> None:
@@ -114,15 +96,21 @@ async def main_loop() -> None:
     
     retry_delay = 1  # начальная задержка в секундах
     max_delay = 300  # максимальная задержка
-
-    while True:
+    loop = asyncio.get_running_loop()
+
+    while not shutdown_requested:
+        main_task = asyncio.create_task(main())
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, request_shutdown, main_task)
+            except NotImplementedError:  # Windows
+                pass
         try:
             log.info("Starting the main loop main_loop()")  # Добавляем отладочное сообщение
-            await main()
+            await main_task
             retry_delay = 1  # сброс задержки после успешного выполнения
         except (KeyboardInterrupt, SystemExit, asyncio.CancelledError) as e:
             log.info(f"The bot's work is completed by the user's command ({repr(e)})")
-            await bot.session.close()
             break
         except ConnectionError as e:
             log.error(f"Bot stopped with connection error: {repr(e)}")
@@ -133,7 +121,13 @@ async def main_loop() -> None:
             await asyncio.sleep(retry_delay)
             retry_delay = min(max_delay, retry_delay * 2)  # удвоение задержки
     
+    log.info("The bot has been stopped")
+    # журнал пишется в фоновом потоке - дожидаемся записи оставшихся сообщений
+    await log.complete()
+    
 
 if __name__ == '__main__':
+    config.check_environment()
+    setup_logger()
     with log.catch():
         asyncio.run(main_loop())
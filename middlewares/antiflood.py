@@ -1,31 +1,47 @@
-import asyncio
-from typing import Callable, Dict, Awaitable, Any
+from typing import Callable, Dict, Awaitable, Any, Set
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 
 from aiogram.types import Message, TelegramObject
-from cachetools import TTLCache
+
+from config_data import config
+from utils.rate_limiter import BaseRateLimiter
+from utils.storage_factory import create_antiflood_limiters
+from utils.scheduler import scheduler, schedule_message_deletion
+from utils.loguru_logger import log
+from utils.metrics import THROTTLED
 
 
 class AntiFloodMiddleware(BaseMiddleware):
     """
     Промежуточное ПО (middleware) для предотвращения флуда в Telegram боте.
-    Ограничивает минимальный интервал между обработкой сообщений от одного пользователя.
+    Ограничивает частоту обработки сообщений от одного пользователя по алгоритму "token bucket".
+
+    Лимит выбирается по флагу обработчика "rate_limit" ("cheap" по умолчанию, "expensive" - для генераций):
+        @router.message(..., flags={"rate_limit": "expensive"})
 
     Атрибуты:
-        cache_limits (TTLCache): Кэш с временем жизни для ограничения сообщений.
-        time_to_live (int): Время жизни записей в кэше (в секундах).
+        limiters (Dict[str, BaseRateLimiter]): Ограничители для каждого класса обработчиков.
+        notice_ttl (float): Время (в секундах), через которое удаляется предупреждение о флуде.
     """
 
-    def __init__(self, time_to_live: int = 3):
+    def __init__(self, limiters: Dict[str, BaseRateLimiter] | None = None,
+                 notice_ttl: float = config.ANTIFLOOD_NOTICE_TTL):
         """
-        Инициализирует промежуточное ПО с заданным временем жизни для кэша.
+        Инициализирует промежуточное ПО.
 
         Параметры:
-            time_to_live (int): Время жизни записей в кэше в секундах. По умолчанию 3 секунды.
+            limiters (Dict[str, BaseRateLimiter] | None): Ограничители по классам обработчиков.
+                По умолчанию строятся из настроек ANTIFLOOD_* и STORAGE_BACKEND в config_data/config.py.
+            notice_ttl (float): Время жизни предупреждения о флуде в секундах.
         """
-        self.cache_limits: TTLCache[int, None] = TTLCache(maxsize=100, ttl=time_to_live)
-        self.time_to_live: int = time_to_live
-    
+        if limiters is None:
+            limiters = create_antiflood_limiters()
+        self.limiters = limiters
+        self.notice_ttl = notice_ttl
+        # Пользователи, которым уже отправлено предупреждение (чтобы не отвечать на каждое сообщение)
+        self._warned: Set[int] = set()
+
     async def __call__(self,
                        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
                        event: TelegramObject,
@@ -43,26 +59,46 @@ class AntiFloodMiddleware(BaseMiddleware):
         """
         if not isinstance(event, Message):
             return await handler(event, data)
-        
+
         if event.from_user is None:
             return await handler(event, data)
-        
+
         user_id: int = event.from_user.id
-        
-        if user_id in self.cache_limits:
-            answer_message: Message = await event.answer(
-                text="Минимальный интервал между запросами ограничен, прошу немного подождать..."
-            )
-            
-            # Ждем время жизни кэша
-            await asyncio.sleep(self.time_to_live)
-            
-            # Удаляем сообщение-ответ
-            await answer_message.delete()
-            
-            # Удаляем исходное сообщение пользователя
-            await event.delete()
+        limit_class: str = get_flag(data, "rate_limit", default="cheap")
+        limiter = self.limiters.get(limit_class) or self.limiters["cheap"]
+
+        retry_after = await limiter.consume(user_id)
+        if not retry_after:
+            self._warned.discard(user_id)
+            return await handler(event, data)
+
+        THROTTLED.inc(limit_class=limit_class)
+        log.debug("User {} throttled ({}), retry after {:.1f}s", user_id, limit_class, retry_after)
+        if user_id in self._warned:
+            # Предупреждение уже висит в чате - просто убираем лишнее сообщение
+            self._schedule_delete(event)
             return
-        
-        self.cache_limits[event.from_user.id] = None
-        return await handler(event, data)
+
+        self._warned.add(user_id)
+        answer_message: Message = await event.answer(
+            text="Минимальный интервал между запросами ограничен, "
+                 f"прошу немного подождать (~{max(1, round(retry_after))} сек.)..."
+        )
+
+        # Удаляем предупреждение и исходное сообщение пользователя отложенно, не задерживая конвейер
+        self._schedule_delete(answer_message, event, warned_user_id=user_id)
+        return
+
+    def _schedule_delete(self, *messages: Message, warned_user_id: int | None = None) -> None:
+        """
+        Планирует удаление сообщений через notice_ttl секунд.
+
+        :param messages: Сообщения для удаления.
+        :param warned_user_id: Пользователь, для которого по истечении времени снимается отметка о предупреждении.
+        """
+        schedule_message_deletion(self.notice_ttl, *messages)
+        if warned_user_id is not None:
+            async def reset_warning() -> None:
+                self._warned.discard(warned_user_id)
+
+            scheduler.call_later(self.notice_ttl, reset_warning, key=("antiflood_warning", warned_user_id))
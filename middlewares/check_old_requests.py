@@ -1,17 +1,38 @@
-from datetime import datetime, timedelta, timezone
-from aiogram import BaseMiddleware
-from aiogram.types import Update, TelegramObject, Message
-from typing import Callable, Dict, Awaitable, Any
+import asyncio
+import time
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Update, TelegramObject
+from typing import Callable, Dict, Awaitable, Any, Set
+
+from config_data import config
+from utils.loguru_logger import log
+from utils.metrics import STALE_DROPPED
+from utils.send_queue import bulk_sends
 
 
 # Middleware апдейт на просроченность (позволяет избегать ошибок обработки устаревших апдейтов)
 class UpdateTimeValidationMiddleware(BaseMiddleware):
     """
-    Промежуточное ПО для проверки времени обновления.
-    Этот middleware позволяет избегать ошибок обработки устаревших обновлений,
-    пропуская обработку апдейтов, которые старше заданного временного порога.
+    Внешнее (outer) промежуточное ПО уровня апдейтов для проверки времени обновления.
+    Регистрируется через dp.update.outer_middleware(...) и отбрасывает апдейты старше max_age секунд
+    до выбора роутера и обработчика, чтобы после простоя бот не выполнял устаревшие запросы
+    (в том числе обращения к внешним API).
+
+    Атрибуты:
+        max_age (float): Максимальный возраст апдейта в секундах.
+        notify (bool): Отправлять ли пользователям сообщение о том, что их запрос устарел.
+        notify_interval (float): Интервал (в секундах) пакетной отправки таких сообщений.
     """
-    
+
+    def __init__(self, max_age: float = config.STALE_UPDATE_MAX_AGE,
+                 notify: bool = config.STALE_UPDATE_NOTIFY,
+                 notify_interval: float = config.STALE_UPDATE_NOTIFY_INTERVAL):
+        self.max_age = max_age
+        self.notify = notify
+        self.notify_interval = notify_interval
+        self._pending_chats: Set[int] = set()
+        self._notify_task: asyncio.Task[None] | None = None
+
     async def __call__(self,
                        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
                        event: TelegramObject,
@@ -21,31 +42,66 @@ class UpdateTimeValidationMiddleware(BaseMiddleware):
 
         Параметры:
             handler: Callable - следующий обработчик в цепочке обработки.
-            event: Union[Update, Message, CallbackQuery] - событие, которое нужно обработать.
-            data: Dict[str, Union[str, datetime]] - дополнительные данные обработчика.
+            event: Update - апдейт, который нужно обработать.
+            data: Dict[str, Any] - дополнительные данные обработчика.
 
         Возвращает:
             None, если апдейт слишком старый и его следует пропустить.
             Awaitable[None], результат выполнения следующего обработчика в цепочке.
         """
-        
-        time_stamp: datetime | None = None
-        
-        if isinstance(event, Update):
-            # Проверяем, является ли событие сообщением и имеет ли оно дату
-            if event.message and isinstance(event.message, Message):
-                time_stamp = event.message.date
-            # Проверяем, является ли событие callback_query и имеет ли оно дату
-            elif (event.callback_query and event.callback_query.message
-                  and isinstance(event.callback_query.message, Message)):
-                time_stamp = event.callback_query.message.date
-        
-        if time_stamp:
-            # current_time = datetime.utcnow()
-            current_time: datetime = datetime.now(timezone.utc)
-            update_time = time_stamp
-            if current_time - update_time > timedelta(seconds=30):
-                print("Update is too old and will be skipped")
-                return
-        
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        # У callback_query нет собственной даты (дата вложенного сообщения - это время его отправки ботом),
+        # поэтому проверяются только события, несущие дату отправки пользователем.
+        # Дата исправленного сообщения - время исходной отправки, поэтому для него берется время исправления
+        message = event.message or event.edited_message
+        time_stamp: float | None = None
+        if event.message is not None:
+            time_stamp = event.message.date.timestamp()
+        elif event.edited_message is not None:
+            edit_date = event.edited_message.edit_date  # Unix time
+            time_stamp = float(edit_date) if edit_date else event.edited_message.date.timestamp()
+
+        if time_stamp is not None and time.time() - time_stamp > self.max_age:
+            event_type = "message" if event.message else "edited_message"
+            STALE_DROPPED.inc(event=event_type)
+            log.info(f"Update {event.update_id} ({event_type}) is too old and will be skipped")
+
+            if self.notify and message is not None:
+                bot: Bot | None = data.get("bot")
+                if bot is not None:
+                    self._queue_notice(bot, message.chat.id)
+            return
+
         return await handler(event, data)
+
+    def _queue_notice(self, bot: Bot, chat_id: int) -> None:
+        """
+        Добавляет чат в очередь уведомлений; одно уведомление на чат за интервал пакетной отправки.
+
+        :param bot: Экземпляр бота.
+        :param chat_id: ID чата.
+        """
+        self._pending_chats.add(chat_id)
+        if self._notify_task is None or self._notify_task.done():
+            self._notify_task = asyncio.create_task(self._send_notices(bot))
+
+    async def _send_notices(self, bot: Bot) -> None:
+        """
+        Через notify_interval секунд отправляет накопленным чатам сообщение об устаревшем запросе.
+        Чаты, добавленные во время отправки, получают уведомление в следующем пакете той же задачи.
+
+        :param bot: Экземпляр бота.
+        """
+        while self._pending_chats:
+            await asyncio.sleep(self.notify_interval)
+            chats, self._pending_chats = self._pending_chats, set()
+            log.info(f"Sending expired request notices to {len(chats)} chats")
+            # уведомления отправляются с низким приоритетом, чтобы не задерживать ответы на новые запросы
+            with bulk_sends():
+                for chat_id in chats:
+                    try:
+                        await bot.send_message(chat_id, config.STALE_UPDATE_NOTICE)
+                    except Exception as e:
+                        log.warning(f"Failed to send expired request notice to chat {chat_id}: {repr(e)}")
@@ -0,0 +1,75 @@
+from typing import Callable, Dict, Awaitable, Any
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject
+
+from config_data import config
+from utils.in_flight import InFlightRegistry
+from utils.loguru_logger import log
+from utils.metrics import IN_FLIGHT_REJECTED
+
+# Общий реестр длительных операций пользователей
+in_flight_registry = InFlightRegistry(timeout=config.IN_FLIGHT_TIMEOUT)
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Промежуточное ПО, не допускающее параллельных запросов пользователя во время длительной операции.
+
+    Поведение задается флагом обработчика "in_flight":
+        "acquire" - обработчик занимает пользователя на время своего выполнения
+                    (освобождение - по завершении, ошибке или истечении IN_FLIGHT_TIMEOUT);
+        "bypass"  - обработчик выполняется всегда (например, /start);
+        без флага - обработчик отклоняется, пока у пользователя выполняется операция.
+
+    Атрибуты:
+        registry (InFlightRegistry): Реестр длительных операций.
+    """
+
+    def __init__(self, registry: InFlightRegistry = in_flight_registry):
+        self.registry = registry
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        """
+        Вызывается при обработке каждого сообщения.
+
+        Параметры:
+            handler (Callable[[Message, Dict[str, Any]], Awaitable[Any]]): Следующий обработчик в цепочке.
+            event (Message): Сообщение от пользователя.
+            data (Dict[str, Any]): Дополнительные данные обработчика.
+
+        Возвращает:
+            Any: Результат выполнения следующего обработчика или None, если запрос отклонен.
+        """
+        if not isinstance(event, Message) or event.from_user is None:
+            return await handler(event, data)
+
+        mode = get_flag(data, "in_flight")
+        if mode == "bypass":
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        if mode != "acquire":
+            if self.registry.is_busy(user_id):
+                await self._reject(event)
+                return
+            return await handler(event, data)
+
+        token = self.registry.acquire(user_id)
+        if token is None:
+            await self._reject(event)
+            return
+
+        try:
+            return await handler(event, data)
+        finally:
+            self.registry.release(user_id, token)
+
+    @staticmethod
+    async def _reject(event: Message) -> None:
+        IN_FLIGHT_REJECTED.inc()
+        log.debug("Request from user {} rejected: operation in progress", event.chat.id)
+        await event.answer("Операция в процессе. Пожалуйста, подождите...")
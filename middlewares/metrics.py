@@ -0,0 +1,32 @@
+import time
+from typing import Callable, Dict, Awaitable, Any
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.router import Router
+from aiogram.types import TelegramObject
+
+from utils.metrics import HANDLER_SECONDS
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Промежуточное ПО, измеряющее время выполнения обработчиков по роутерам (метрика bot_handler_duration_seconds).
+    Регистрируется последним внутренним промежуточным ПО, чтобы не учитывать время антифлуда и проверок.
+    """
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        router: Router | None = data.get("event_router")
+        labels = {
+            "router": router.name if router is not None else "unknown",
+            "event": type(event).__name__,
+        }
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, outcome=outcome, **labels)
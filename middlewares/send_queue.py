@@ -0,0 +1,27 @@
+from functools import partial
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods.base import Response, TelegramMethod, TelegramType
+
+from utils.send_queue import SendQueue, send_queue
+
+
+class SendQueueMiddleware(BaseRequestMiddleware):
+    """
+    Промежуточное ПО сессии бота: запросы на отправку и правку сообщений проходят через очередь исходящих
+    сообщений (ограничения частоты Telegram, повтор после ответа 429, приоритеты, объединение правок).
+    Подключается ко всем запросам бота, поэтому обработчики по-прежнему вызывают message.answer и т.п.
+
+    Атрибуты:
+        queue (SendQueue): Очередь исходящих сообщений.
+    """
+
+    def __init__(self, queue: SendQueue = send_queue):
+        self.queue = queue
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        return await self.queue.send(getattr(method, "chat_id", None), method, partial(make_request, bot))
@@ -0,0 +1,47 @@
+from typing import Callable, Dict, Awaitable, Any
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject
+
+from config_data import config
+from utils.token_quotas import QuotaExceededError, TokenQuotas, token_quotas
+from utils.loguru_logger import log
+from utils.metrics import registry
+from utils.token_estimator import token_estimator
+
+QUOTA_REJECTED = registry.counter("bot_token_quota_rejected_total", "Requests rejected by token budgets",
+                                  ("owner", "period"))
+
+PERIOD_NAMES = {"d": "сегодня", "m": "этот месяц"}
+
+
+class TokenQuotaMiddleware(BaseMiddleware):
+    """
+    Промежуточное ПО, отклоняющее запросы к LLM до обращения к модели, если бюджет токенов пользователя
+    или бота исчерпан или будет превышен запросом (по оценке длины текста сообщения). Применяется к обработчикам с флагом "token_quota":
+        @router.message(..., flags={"token_quota": True})
+
+    Атрибуты:
+        quotas (TokenQuotas): Бюджеты токенов.
+    """
+
+    def __init__(self, quotas: TokenQuotas = token_quotas):
+        self.quotas = quotas
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if not isinstance(event, Message) or event.from_user is None or not get_flag(data, "token_quota"):
+            return await handler(event, data)
+
+        try:
+            await self.quotas.check(event.from_user.id, token_estimator.count(event.text or ""))
+        except QuotaExceededError as e:
+            budget = e.budget
+            QUOTA_REJECTED.inc(owner=budget.owner, period=budget.period)
+            log.info(f"Request from user {event.from_user.id} rejected: {e}")
+            template = config.TOKEN_QUOTA_USER_MESSAGE if budget.owner == "user" else config.TOKEN_QUOTA_GLOBAL_MESSAGE
+            await event.answer(template.format(period=PERIOD_NAMES[budget.period]))
+            return
+        return await handler(event, data)
@@ -0,0 +1,44 @@
+from typing import Callable, Dict, Awaitable, Any
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods.base import Response, TelegramMethod, TelegramType
+from aiogram.types import TelegramObject, Update, User
+
+from utils.tracing import tracer
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Промежуточное ПО трассировки.
+    Внешнее на апдейтах - начинает трассу апдейта (ID трассы доступен всем последующим вызовам);
+    внутреннее на событиях - выполняет обработчик как отрезок трассы "handler <роутер>.<функция>".
+    """
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if isinstance(event, Update):
+            user: User | None = data.get("event_from_user")
+            with tracer.trace("update", update_id=event.update_id, event=event.event_type,
+                              user_id=user.id if user else None):
+                return await handler(event, data)
+
+        router = data.get("event_router")
+        callback = getattr(data.get("handler"), "callback", None)
+        name = f"{router.name if router else 'unknown'}.{getattr(callback, '__name__', 'unknown')}"
+        with tracer.span(f"handler {name}", event=type(event).__name__):
+            return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """
+    Промежуточное ПО сессии бота: каждый запрос к Bot API выполняется как отрезок трассы "telegram.<метод>".
+    """
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        with tracer.span(f"telegram.{method.__api_method__}"):
+            return await make_request(bot, method)
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import time
+from typing import Callable, Dict, Awaitable, Any, FrozenSet, List, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.loguru_logger import log
+
+# Поля с персональными данными, удаляемые из апдейта целиком
+DROPPED_FIELDS = frozenset({"phone_number", "contact", "location", "venue", "photo", "document", "voice", "audio",
+                            "video", "video_note", "sticker", "animation", "caption_entities", "bio", "email",
+                            "shipping_address", "order_info"})
+# Поля с идентификаторами пользователей и чатов, заменяемые псевдонимами
+ID_FIELDS = frozenset({"id", "user_id", "chat_id", "sender_chat_id"})
+NAME_FIELDS = frozenset({"first_name", "last_name", "username", "title"})
+
+
+def _pseudonym(value: int, salt: bytes) -> int:
+    digest = hmac.new(salt, str(value).encode(), hashlib.sha256).digest()
+    # сохраняем знак (отрицательные id - групповые чаты) и положительность id пользователей
+    pseudonym = int.from_bytes(digest[:6], "big") + 1
+    return -pseudonym if value < 0 else pseudonym
+
+
+def _scrub_text(text: str, keep_texts: FrozenSet[str]) -> str:
+    if text in keep_texts:
+        return text
+    if text.startswith("/"):
+        command, _, rest = text.partition(" ")
+        return command + (" " + _scrub_text(rest, frozenset()) if rest else "")
+    # сохраняем количество и длину слов, чтобы не менялись нагрузка и расход токенов
+    return " ".join("x" * len(word) for word in text.split(" "))
+
+
+def scrub_update(data: Any, salt: bytes, keep_texts: FrozenSet[str] = frozenset()) -> Any:
+    """
+    Удаляет из апдейта персональные данные: id пользователей и чатов заменяются устойчивыми псевдонимами
+    (HMAC с солью, поэтому последовательность сообщений одного чата сохраняется), имена - производными
+    от псевдонимов, тексты - строками той же длины (команды и тексты кнопок сохраняются), вложения удаляются.
+
+    :param data: Апдейт в виде словаря (или его часть).
+    :param salt: Соль псевдонимизации.
+    :param keep_texts: Тексты, сохраняемые как есть (например, тексты кнопок клавиатуры).
+    :return: Очищенная копия.
+    """
+    if isinstance(data, list):
+        return [scrub_update(item, salt, keep_texts) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    result: Dict[str, Any] = {}
+    for key, value in data.items():
+        if key in DROPPED_FIELDS:
+            continue
+        if key in ID_FIELDS and isinstance(value, int):
+            result[key] = _pseudonym(value, salt)
+        elif key in NAME_FIELDS and isinstance(value, str):
+            result[key] = f"{key}_{hashlib.sha256(salt + value.encode()).hexdigest()[:8]}"
+        elif key in ("text", "caption") and isinstance(value, str):
+            result[key] = _scrub_text(value, keep_texts)
+        elif key == "entities":
+            # разметка, кроме команд, может указывать на ссылки и упоминания
+            result[key] = [entity for entity in value if entity.get("type") == "bot_command"]
+        else:
+            result[key] = scrub_update(value, salt, keep_texts)
+    return result
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """
+    Внешнее промежуточное ПО, записывающее входящие апдейты в JSONL-файл для последующего воспроизведения
+    (benchmarks/replay.py). Каждая строка: {"ts": время получения, "update": апдейт}.
+    Запись выполняется пакетами в отдельном потоке и не задерживает обработку апдейтов.
+
+    :param path: Путь к файлу журнала (дописывается); "{pid}" заменяется PID процесса (для режима BOT_WORKERS).
+    :param scrub: Удалять ли персональные данные (см. scrub_update).
+    :param salt: Соль псевдонимизации; если не задана, для журнала генерируется случайная соль
+        (псевдонимы с пустой солью восстанавливаются перебором id).
+    :param sample_rate: Доля записываемых апдейтов (от 0 до 1).
+    :param keep_texts: Тексты, сохраняемые при очистке как есть.
+    :param flush_interval: Интервал записи накопленных апдейтов в секундах.
+    """
+    def __init__(self, path: str, scrub: bool = True, salt: str = "", sample_rate: float = 1.0,
+                 keep_texts: FrozenSet[str] = frozenset(), flush_interval: float = 1.0):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.scrub = scrub
+        if scrub and not salt:
+            salt = secrets.token_hex(16)
+            log.warning("RECORD_UPDATES_SALT is not set: using a random salt, pseudonyms of this log "
+                        "will not match other logs or runs")
+        self.salt = salt.encode()
+        self.sample_rate = sample_rate
+        self.keep_texts = keep_texts
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self._buffer: List[str] = []
+        self._writer: Optional[asyncio.Task[None]] = None
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if isinstance(event, Update) and (self.sample_rate >= 1 or random.random() < self.sample_rate):
+            self._record(event)
+        return await handler(event, data)
+
+    def _record(self, update: Update) -> None:
+        payload = update.model_dump(mode="json", by_alias=True, exclude_none=True, exclude_unset=True)
+        if self.scrub:
+            payload = scrub_update(payload, self.salt, self.keep_texts)
+        self._buffer.append(json.dumps({"ts": time.time(), "update": payload}, ensure_ascii=False))
+        self.recorded += 1
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_later())
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+    async def _write_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Записывает накопленные апдейты в файл.
+        """
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            log.error(f"Failed to write {len(lines)} recorded updates to {self.path}: {repr(e)}")
@@ -7,7 +7,6 @@ class MainStates(StatesGroup):
     """
     await_input_for_gen_text = State()
     generating_image_state = State()
-    processing_state = State()
     
 
 class HighLowStates(StatesGroup):
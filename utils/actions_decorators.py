@@ -1,92 +1,74 @@
-import asyncio
+from contextlib import asynccontextmanager
 from functools import wraps
+from aiogram import Bot
 from aiogram.types import Message, CallbackQuery
 from aiogram.enums import ChatAction
-from typing import Callable, Union, TypeVar, Coroutine, Any
+from aiogram.utils.chat_action import ChatActionSender
+from typing import AsyncIterator, Callable, Union, TypeVar, Coroutine, Any
+
+from config_data import config
 
 
 # Определяем переменную типа для декорируемой функции
 F = TypeVar('F', bound=Callable[..., Coroutine[Any, Any, Any]])
 
 
-def typing_action(delay: int = 1) -> Callable[[F], F]:
+@asynccontextmanager
+async def chat_action(bot: Bot, chat_id: int, action: str = ChatAction.TYPING,
+                      interval: float = config.CHAT_ACTION_INTERVAL,
+                      initial_delay: float = config.CHAT_ACTION_INITIAL_DELAY) -> AsyncIterator[None]:
     """
-    Декоратор для отправки статуса "печатает..." в чат перед выполнением функции.
+    Контекстный менеджер, который в фоне повторяет статус чата ("печатает...", "загружает фото..." и т.п.)
+    каждые interval секунд, пока выполняется тело блока, и останавливается при выходе из него.
 
-    Параметры:
-    - delay (int): Задержка в секундах между отправкой статуса и выполнением функции.
-    Возвращает:
-    - Callable[[F], F]: Декоратор для функции.
-    """
-    def decorator(func: F) -> F:
-        @wraps(func)
-        async def wrapper(message: Message, *args: Any, **kwargs: Any) -> Any:
-            bot = message.bot
-            if bot is None:
-                raise ValueError("Bot instance is not available in the message.")
-
-            await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
-            # await message.bot.send_chat_action(message.chat.id, ChatAction.TYPING)
-            await asyncio.sleep(delay)
-            result = await func(message, *args, **kwargs)
-            return result
-        
-        return wrapper
-    
-    return decorator
-
-
-def upload_photo_action(delay: int = 3) -> Callable:
-    """
-    Декоратор для отправки статуса "загружает фото..." в чат перед выполнением функции.
+    Первый статус отправляется через initial_delay секунд: если работа завершилась быстрее,
+    статус не отправляется вовсе и ответ приходит без задержки.
 
     Параметры:
-    - delay (int): Задержка в секундах между отправкой статуса и выполнением функции.
-    Возвращает:
-    - Callable[[F], F]: Декоратор для функции.
+    - bot (Bot): Экземпляр бота.
+    - chat_id (int): ID чата.
+    - action (str): Статус чата.
+    - interval (float): Интервал повторной отправки статуса (Telegram показывает статус около 5 секунд).
+    - initial_delay (float): Задержка перед первой отправкой статуса.
     """
-    def decorator(func: F) -> F:
-        @wraps(func)
-        async def wrapper(message: Message, *args: Any, **kwargs: Any) -> Any:
-            bot = message.bot
-            if bot is None:
-                raise ValueError("Bot instance is not available in the message.")
-            # await message.bot.send_chat_action(message.chat.id, ChatAction.UPLOAD_PHOTO)
-            await asyncio.sleep(delay)
-            result = await func(message, *args, **kwargs)
-            return result
-        
-        return wrapper
-    
-    return decorator
-
-
-def upload_document_action(delay: int = 3) -> Callable[[F], F]:
+    async with ChatActionSender(bot=bot, chat_id=chat_id, action=action,
+                                interval=interval, initial_sleep=initial_delay):
+        yield
+
+
+def _chat_action_decorator(action: str) -> Callable[..., Callable[[F], F]]:
     """
-    Декоратор для отправки статуса "загружает документ..." в чат перед выполнением функции.
+    Создает фабрику декораторов, выполняющих функцию внутри chat_action с заданным статусом.
+    Первый аргумент декорируемой функции - Message или CallbackQuery.
 
     Параметры:
-    - delay (int): Задержка в секундах между отправкой статуса и выполнением функции.
+    - action (str): Статус чата.
     Возвращает:
-    - Callable[[F], F]: Декоратор для функции.
+    - Фабрику декораторов с параметром interval.
     """
-    # def decorator(func: Callable[[Union[Message, CallbackQuery]], Awaitable[None]]) -> Callable:
-    def decorator(func: F) -> F:
-        @wraps(func)
-        async def wrapper(arg: Union[Message, CallbackQuery], *args: Any, **kwargs: Any) -> Any:
-            if isinstance(arg, CallbackQuery):
-                message = arg.message
-                if message is None or message.bot is None:
-                    raise ValueError("Bot instance is not available in the callback query message.")
-                await message.bot.send_chat_action(message.chat.id, ChatAction.UPLOAD_DOCUMENT)
-            elif isinstance(arg, Message):
-                bot = arg.bot
-                if bot is None:
+    def factory(interval: float = config.CHAT_ACTION_INTERVAL) -> Callable[[F], F]:
+        def decorator(func: F) -> F:
+            @wraps(func)
+            async def wrapper(arg: Union[Message, CallbackQuery], *args: Any, **kwargs: Any) -> Any:
+                message = arg.message if isinstance(arg, CallbackQuery) else arg
+                if not isinstance(message, Message) or message.bot is None:
                     raise ValueError("Bot instance is not available in the message.")
-                await bot.send_chat_action(arg.chat.id, ChatAction.UPLOAD_DOCUMENT)
-            await asyncio.sleep(delay)
-            result = await func(arg, *args, **kwargs)
-            return result
-        return wrapper
-    
-    return decorator
+
+                async with chat_action(message.bot, message.chat.id, action, interval=interval):
+                    return await func(arg, *args, **kwargs)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    return factory
+
+
+# Декоратор для показа статуса "печатает..." в чате во время выполнения функции
+typing_action = _chat_action_decorator(ChatAction.TYPING)
+
+# Декоратор для показа статуса "загружает фото..." в чате во время выполнения функции
+upload_photo_action = _chat_action_decorator(ChatAction.UPLOAD_PHOTO)
+
+# Декоратор для показа статуса "загружает документ..." в чате во время выполнения функции
+upload_document_action = _chat_action_decorator(ChatAction.UPLOAD_DOCUMENT)
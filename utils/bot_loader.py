@@ -1,10 +1,18 @@
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from config_data import config
+from middlewares.send_queue import SendQueueMiddleware
+from middlewares.tracing import TelegramTracingMiddleware
 
 if config.BOT_TOKEN is None:
     raise ValueError("BOT_TOKEN is not defined")
 
 default = DefaultBotProperties(parse_mode='Markdown')
-bot = Bot(token=config.BOT_TOKEN, default=default)
+session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL)) if config.TELEGRAM_API_URL else None
+bot = Bot(token=config.BOT_TOKEN, default=default, session=session)
+# очередь - внешнее промежуточное ПО: отрезок трассы запроса не включает ожидание в очереди
+bot.session.middleware(SendQueueMiddleware())
+bot.session.middleware(TelegramTracingMiddleware())
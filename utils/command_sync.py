@@ -0,0 +1,178 @@
+# utils/command_sync.py
+import asyncio
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Type, Union
+
+from aiogram import Bot
+from aiogram.types import (BotCommand, BotCommandScopeAllChatAdministrators,
+                           BotCommandScopeAllGroupChats, BotCommandScopeAllPrivateChats, BotCommandScopeChat,
+                           BotCommandScopeChatAdministrators, BotCommandScopeChatMember,
+                           BotCommandScopeDefault)
+
+from config_data import config
+from utils.loguru_logger import log
+
+COMMANDS_FILE = Path(config.CONFIG_DIR) / "bot_commands.json"
+
+# области видимости, которые принимают getMyCommands и setMyCommands
+CommandScope = Union[BotCommandScopeDefault, BotCommandScopeAllPrivateChats, BotCommandScopeAllGroupChats,
+                     BotCommandScopeAllChatAdministrators, BotCommandScopeChat, BotCommandScopeChatAdministrators,
+                     BotCommandScopeChatMember]
+
+SCOPE_TYPES: Dict[str, Type[CommandScope]] = {
+    "default": BotCommandScopeDefault,
+    "all_private_chats": BotCommandScopeAllPrivateChats,
+    "all_group_chats": BotCommandScopeAllGroupChats,
+    "all_chat_administrators": BotCommandScopeAllChatAdministrators,
+    "chat": BotCommandScopeChat,
+    "chat_administrators": BotCommandScopeChatAdministrators,
+    "chat_member": BotCommandScopeChatMember,
+}
+
+
+class CommandSet(NamedTuple):
+    """
+    Набор команд меню для области видимости и языка.
+    """
+    scope: CommandScope
+    language_code: Optional[str]
+    commands: List[BotCommand]
+
+    @property
+    def digest(self) -> str:
+        return commands_digest(self.commands)
+
+    @property
+    def label(self) -> str:
+        return f"{self.scope.type}/{self.language_code or '*'}"
+
+
+def commands_digest(commands: Sequence[BotCommand]) -> str:
+    """
+    Хеш набора команд для сравнения желаемого и установленного в Telegram меню.
+
+    :param commands: Команды бота.
+    :return: Шестнадцатеричный хеш.
+    """
+    payload = json.dumps([(cmd.command, cmd.description) for cmd in commands], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _parse_scope(raw: Any) -> CommandScope:
+    if raw is None:
+        return BotCommandScopeDefault()
+    if isinstance(raw, str):
+        raw = {"type": raw}
+    params = dict(raw)
+    scope_type = params.pop("type", "default")
+    if scope_type not in SCOPE_TYPES:
+        raise ValueError(f"Unknown bot command scope: {scope_type}")
+    return SCOPE_TYPES[scope_type](**params)
+
+
+@lru_cache(maxsize=None)
+def load_command_sets(path: Path = COMMANDS_FILE) -> List[CommandSet]:
+    """
+    Загружает наборы команд из файла один раз за время работы процесса.
+
+    Файл содержит либо список команд (меню по умолчанию для всех языков), либо объект
+    {"sets": [{"scope": ..., "language_code": ..., "commands": [...]}, ...]}, где scope - название
+    области видимости ("default", "all_private_chats", ...) или объект {"type": "chat", "chat_id": ...}.
+
+    :param path: Путь к файлу команд.
+    :return: Наборы команд.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    raw_sets = [{"commands": data}] if isinstance(data, list) else data["sets"]
+    return [
+        CommandSet(scope=_parse_scope(raw.get("scope")),
+                   language_code=raw.get("language_code") or None,
+                   commands=[BotCommand(**cmd) for cmd in raw["commands"]])
+        for raw in raw_sets
+    ]
+
+
+def get_commands(language_code: Optional[str] = None) -> List[BotCommand]:
+    """
+    Возвращает команды меню по умолчанию для языка пользователя (или общие, если для языка набора нет).
+
+    :param language_code: Код языка пользователя.
+    :return: Команды бота.
+    """
+    default_sets = [cmd_set for cmd_set in load_command_sets() if cmd_set.scope.type == "default"]
+    for cmd_set in default_sets:
+        if language_code and cmd_set.language_code == language_code:
+            return cmd_set.commands
+    for cmd_set in default_sets:
+        if cmd_set.language_code is None:
+            return cmd_set.commands
+    return []
+
+
+class CommandSync:
+    """
+    Фоновая синхронизация меню команд: периодически сравнивает наборы команд из файла с тем,
+    что возвращает Telegram (getMyCommands), и вызывает setMyCommands только при расхождении.
+
+    :param interval: Интервал между проверками в секундах.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def sync_once(self, bot: Bot) -> int:
+        """
+        Сверяет все наборы команд с Telegram и обновляет расходящиеся.
+
+        :param bot: Экземпляр бота.
+        :return: Количество обновленных наборов.
+        """
+        updated = 0
+        for cmd_set in load_command_sets():
+            current = await bot.get_my_commands(scope=cmd_set.scope, language_code=cmd_set.language_code)
+            if commands_digest(current) == cmd_set.digest:
+                continue
+            await bot.set_my_commands(cmd_set.commands, scope=cmd_set.scope, language_code=cmd_set.language_code)
+            log.info(f"Bot commands {cmd_set.label} were out of sync and have been updated")
+            updated += 1
+        return updated
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            delay = self.interval
+            try:
+                await self.sync_once(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # при ошибке (например, соединения) повторяем проверку раньше
+                delay = min(self.interval, 30.0)
+                log.error(f"Error syncing bot commands, retrying in {delay:.0f}s: {repr(e)}")
+            await asyncio.sleep(delay)
+
+    def start(self, bot: Bot) -> None:
+        """
+        Запускает фоновую синхронизацию (первая проверка выполняется сразу).
+
+        :param bot: Экземпляр бота.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot), name="command-sync")
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую синхронизацию.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+command_sync = CommandSync(interval=config.COMMAND_SYNC_INTERVAL)
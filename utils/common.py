@@ -1,8 +1,12 @@
 import os
 import aiofiles
 import asyncio
+from typing import Callable, Iterable, Sequence
 
-from database.models import User as DBUser
+from database.models import User as DBUser, RequestAndResponse
+from config_data import config
+from utils.reports import ReportRecord, render_report, write_report_file
+from utils.workers import report_executor
 
 
 async def async_write_file(file_path: str, data: str) -> None:
@@ -39,3 +43,34 @@ async def get_report_header(user: DBUser) -> str:
     """
     
     return f"История запросов пользователя {user.tg_id} ({user.username or 'username is N/A'})\n\n"
+
+
+def to_report_records(responses: Sequence[tuple[RequestAndResponse, str]]) -> list[ReportRecord]:
+    """
+    Преобразует строки выборки из БД в простые кортежи, которые можно передать в рабочий процесс.
+
+    :param responses: Последовательность кортежей, содержащих объекты RequestAndResponse и название модели.
+    :return: Список записей отчета.
+    """
+    return [
+        (str(resp.requests_date), model_name, resp.total_token_quantity, resp.request, resp.answer)
+        for resp, model_name in responses
+    ]
+
+
+async def build_report_file(file_path: str, report_header: str,
+                            responses: Sequence[tuple[RequestAndResponse, str]],
+                            render: Callable[[str, Iterable[ReportRecord]], str] = render_report) -> str:
+    """
+    Формирует, при необходимости сжимает и записывает отчет в пуле рабочих процессов,
+    не блокируя цикл событий.
+
+    :param file_path: Путь к текстовому файлу отчета.
+    :param report_header: Заголовок отчета.
+    :param responses: Последовательность кортежей, содержащих объекты RequestAndResponse и название модели.
+    :param render: Функция формирования текста отчета из utils.reports.
+    :return: Путь к итоговому файлу отчета.
+    :raises PoolOverloadedError: Если пул формирования отчетов перегружен.
+    """
+    return await report_executor.run(write_report_file, file_path, report_header,
+                                     to_report_records(responses), config.REPORT_COMPRESS_THRESHOLD, render)
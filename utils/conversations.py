@@ -0,0 +1,226 @@
+# utils/conversations.py
+import asyncio
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional
+
+from api.gpt_generators import gpt_summarize
+from config_data import config
+from database.requests import delete_conversation, get_conversation, save_conversation
+from utils.loguru_logger import log
+from utils.metrics import TOKENS
+from utils.token_estimator import token_estimator
+from utils.token_quotas import token_quotas
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam
+
+Turn = Dict[str, Any]  # {"role": "user" | "assistant", "content": ..., "tokens": ...}
+
+ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+class ConversationSession:
+    """
+    Диалог пользователя в памяти: последние реплики в кольцевом буфере и краткое содержание более ранних.
+    Реплики, вытесненные из буфера, ждут в pending, пока их не учтет краткое содержание.
+
+    :param tg_id: Telegram ID пользователя.
+    :param summary: Краткое содержание ранних реплик.
+    :param turns: Последние реплики.
+    :param max_turns: Размер кольцевого буфера реплик.
+    """
+    __slots__ = ("tg_id", "summary", "turns", "pending", "last_active", "summarizer")
+
+    def __init__(self, tg_id: int, summary: str, turns: List[Turn], max_turns: int):
+        self.tg_id = tg_id
+        self.summary = summary
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.pending: List[Turn] = []
+        self.last_active = time.monotonic()
+        self.summarizer: Optional[asyncio.Task[None]] = None
+        for turn in turns:
+            self.append(turn)
+
+    def append(self, turn: Turn) -> None:
+        if len(self.turns) == self.turns.maxlen:
+            self.pending.append(self.turns.popleft())
+        self.turns.append(turn)
+
+    def fold(self, recent_tokens: int) -> None:
+        """
+        Переносит старые реплики в pending, если последние реплики не укладываются в бюджет.
+        Переносится с запасом (до половины бюджета), чтобы краткое содержание обновлялось раз в несколько реплик.
+        """
+        if sum(turn["tokens"] for turn in self.turns) <= recent_tokens:
+            return
+        # последняя пара реплик остается целиком
+        while len(self.turns) > 2 and sum(turn["tokens"] for turn in self.turns) > recent_tokens // 2:
+            self.pending.append(self.turns.popleft())
+
+    def stored_turns(self) -> List[Turn]:
+        return [*self.pending, *self.turns]
+
+
+class ConversationStore:
+    """
+    Многошаговые диалоги с моделью при ограниченном расходе токенов.
+
+    В запрос к модели попадают краткое содержание ранних реплик и последние реплики целиком в пределах
+    бюджета токенов; реплики, не укладывающиеся в бюджет, в фоне добавляются к краткому содержанию
+    отдельным запросом к модели. Поэтому стоимость запроса не растет с длиной диалога.
+    Диалоги хранятся в памяти (LRU) и сохраняются в БД после каждой реплики.
+
+    :param context_tokens: Бюджет токенов контекста (краткое содержание и реплики) на запрос; 0 - без контекста.
+    :param summary_tokens: Максимальная длина краткого содержания в токенах.
+    :param max_turns: Максимум последних реплик, хранимых целиком.
+    :param turn_max_chars: Максимальная длина реплики, сохраняемой в диалоге.
+    :param idle_ttl: Время бездействия в секундах, после которого диалог начинается заново.
+    :param max_sessions: Максимум диалогов в памяти.
+    """
+    def __init__(self, context_tokens: int, summary_tokens: int, max_turns: int, turn_max_chars: int,
+                 idle_ttl: float, max_sessions: int):
+        self.context_tokens = context_tokens
+        self.summary_tokens = summary_tokens
+        self.max_turns = max_turns
+        self.turn_max_chars = turn_max_chars
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[int, ConversationSession] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.context_tokens > 0
+
+    @property
+    def recent_tokens(self) -> int:
+        return self.context_tokens - self.summary_tokens
+
+    async def _load(self, tg_id: int) -> ConversationSession:
+        stored = await get_conversation(tg_id)
+        if stored is None or (datetime.now() - stored.updated_at).total_seconds() > self.idle_ttl:
+            return ConversationSession(tg_id, "", [], self.max_turns)
+        return ConversationSession(tg_id, stored.summary or "", list(stored.turns or []), self.max_turns)
+
+    async def get(self, tg_id: int, reload: bool = False) -> ConversationSession:
+        """
+        Возвращает диалог пользователя из памяти или из БД.
+
+        :param tg_id: Telegram ID пользователя.
+        :param reload: Перечитать диалог из БД (например, в фоновой задаче, выполняемой другим процессом).
+        """
+        session = self._sessions.get(tg_id)
+        # диалог, краткое содержание которого обновляется, не заменяется: обновление сохранит его в БД
+        if session is None or (reload and session.summarizer is None):
+            session = await self._load(tg_id)
+        elif session.summarizer is None and time.monotonic() - session.last_active > self.idle_ttl:
+            session = ConversationSession(tg_id, "", [], self.max_turns)
+        self._sessions[tg_id] = session
+        self._sessions.move_to_end(tg_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    async def context(self, tg_id: int, reload: bool = False) -> List["ChatCompletionMessageParam"]:
+        """
+        Собирает контекст запроса к модели: краткое содержание и последние реплики в пределах бюджета.
+
+        :param tg_id: Telegram ID пользователя.
+        :param reload: Перечитать диалог из БД.
+        :return: Сообщения в формате Chat Completions (без текущего запроса).
+        """
+        if not self.enabled:
+            return []
+        session = await self.get(tg_id, reload)
+        budget = self.context_tokens
+        messages: List["ChatCompletionMessageParam"] = []
+        if session.summary:
+            budget -= token_estimator.count(session.summary)
+            messages.append({"role": "system",
+                             "content": f"Краткое содержание предыдущей части диалога: {session.summary}"})
+        recent: List[Turn] = []
+        for turn in reversed(session.stored_turns()):
+            if turn["tokens"] > budget:
+                break
+            budget -= turn["tokens"]
+            recent.append(turn)
+        messages.extend({"role": turn["role"], "content": turn["content"]} for turn in reversed(recent))
+        return messages
+
+    async def add_exchange(self, tg_id: int, request: str, answer: str, answer_tokens: Optional[int] = None) -> None:
+        """
+        Добавляет запрос и ответ в диалог, сохраняет его и при необходимости обновляет краткое содержание.
+
+        :param tg_id: Telegram ID пользователя.
+        :param request: Текст запроса.
+        :param answer: Текст ответа модели.
+        :param answer_tokens: Количество токенов ответа (из usage), если известно.
+        """
+        if not self.enabled:
+            return
+        session = await self.get(tg_id)
+        for role, text, tokens in (("user", request, None), ("assistant", answer, answer_tokens)):
+            content = text[:self.turn_max_chars]
+            if not tokens or len(content) < len(text):
+                tokens = token_estimator.count(content)
+            session.append({"role": role, "content": content, "tokens": tokens})
+        session.last_active = time.monotonic()
+        session.fold(self.recent_tokens)
+        await save_conversation(tg_id, session.summary, session.stored_turns())
+        if session.pending and session.summarizer is None:
+            session.summarizer = asyncio.create_task(self._summarize(session), name=f"conversation-summary-{tg_id}")
+
+    async def _summarize(self, session: ConversationSession) -> None:
+        try:
+            while session.pending:
+                batch = list(session.pending)
+                dialogue = "\n".join(f"{ROLE_NAMES[turn['role']]}: {turn['content']}" for turn in batch)
+                response = await gpt_summarize(session.summary, dialogue, self.summary_tokens)
+                content = response.choices[0].message.content if response.choices else None
+                if not content:
+                    log.warning(f"Empty conversation summary for user {session.tg_id}")
+                    return
+                session.summary = content.strip()
+                del session.pending[:len(batch)]
+                if response.usage:
+                    token_quotas.record(session.tg_id, response.usage.total_tokens)
+                    TOKENS.inc(response.usage.prompt_tokens, model=response.model, kind="prompt")
+                    TOKENS.inc(response.usage.completion_tokens, model=response.model, kind="completion")
+                await save_conversation(session.tg_id, session.summary, session.stored_turns())
+                log.debug("Conversation summary of user {} updated ({} turns folded)", session.tg_id, len(batch))
+        except Exception as e:
+            # реплики остаются в pending и будут учтены при следующем обновлении
+            log.warning(f"Failed to update conversation summary for user {session.tg_id}: {repr(e)}")
+        finally:
+            session.summarizer = None
+
+    async def reset(self, tg_id: int) -> None:
+        """
+        Начинает диалог пользователя заново.
+
+        :param tg_id: Telegram ID пользователя.
+        """
+        session = self._sessions.pop(tg_id, None)
+        if session is not None and session.summarizer is not None:
+            session.summarizer.cancel()
+        if self.enabled:
+            await delete_conversation(tg_id)
+
+    async def stop(self) -> None:
+        """
+        Дожидается обновления кратких содержаний, начатых до остановки.
+        """
+        tasks = [session.summarizer for session in self._sessions.values() if session.summarizer is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+conversation_store = ConversationStore(
+    context_tokens=config.CONVERSATION_CONTEXT_TOKENS,
+    summary_tokens=config.CONVERSATION_SUMMARY_TOKENS,
+    max_turns=config.CONVERSATION_MAX_TURNS,
+    turn_max_chars=config.CONVERSATION_TURN_MAX_CHARS,
+    idle_ttl=config.CONVERSATION_IDLE_TTL,
+    max_sessions=config.CONVERSATION_MAX_SESSIONS,
+)
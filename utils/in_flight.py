@@ -0,0 +1,63 @@
+# utils/in_flight.py
+import itertools
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class InFlightRegistry:
+    """
+    Реестр пользователей, у которых выполняется длительная операция (генерация текста или изображения).
+
+    Хранит для каждого ключа момент, после которого запись считается просроченной, поэтому "зависший"
+    обработчик не блокирует пользователя дольше timeout секунд, и номер записи: освободить ключ может
+    только владелец записи, а не обработчик, чья запись уже истекла и была занята заново.
+
+    :param timeout: Время (в секундах), по истечении которого запись освобождается автоматически.
+    """
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._deadlines: Dict[Hashable, Tuple[float, int]] = {}  # (момент истечения, номер записи)
+        self._tokens = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def is_busy(self, key: Hashable) -> bool:
+        """
+        Проверяет, выполняется ли операция для ключа.
+
+        :param key: Ключ (например, Telegram ID пользователя).
+        :return: True, если для ключа есть непросроченная запись.
+        """
+        entry = self._deadlines.get(key)
+        if entry is None:
+            return False
+        if entry[0] < time.monotonic():
+            del self._deadlines[key]
+            return False
+        return True
+
+    def acquire(self, key: Hashable, timeout: float | None = None) -> Optional[int]:
+        """
+        Занимает ключ, если для него не выполняется другая операция.
+
+        :param key: Ключ (например, Telegram ID пользователя).
+        :param timeout: Время жизни записи в секундах (по умолчанию - timeout реестра).
+        :return: Номер записи для release, если ключ занят успешно, None - если операция уже выполняется.
+        """
+        if self.is_busy(key):
+            return None
+        token = next(self._tokens)
+        self._deadlines[key] = (time.monotonic() + (timeout or self.timeout), token)
+        return token
+
+    def release(self, key: Hashable, token: int) -> None:
+        """
+        Освобождает ключ, если он все еще занят записью token.
+
+        :param key: Ключ (например, Telegram ID пользователя).
+        :param token: Номер записи, полученный от acquire.
+        """
+        entry = self._deadlines.get(key)
+        if entry is not None and entry[1] == token:
+            del self._deadlines[key]
@@ -0,0 +1,140 @@
+# utils/lifecycle.py
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update
+
+from database.requests import get_bot_state, set_bot_state
+from utils.loguru_logger import log
+
+POLLING_OFFSET_KEY = "polling_offset"
+
+# Действие при остановке: получает оставшееся до крайнего срока время в секундах
+DrainHook = Callable[[float], Awaitable[Any]]
+
+
+class UpdateTracker(BaseMiddleware):
+    """
+    Внешнее промежуточное ПО уровня апдейтов, отслеживающее апдейты, которые обрабатываются прямо сейчас,
+    и наибольший полученный update_id (для сохранения смещения long polling при остановке).
+    """
+    def __init__(self) -> None:
+        self.active: Set[int] = set()
+        self.last_update_id: Optional[int] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        update_id = event.update_id
+        if self.last_update_id is None or update_id > self.last_update_id:
+            self.last_update_id = update_id
+        self.active.add(update_id)
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.active.discard(update_id)
+            if not self.active:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """
+        Ждет завершения обработки всех апдейтов.
+
+        :param timeout: Время ожидания в секундах.
+        :return: True, если все апдейты обработаны, False - если истекло время ожидания.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @property
+    def next_offset(self) -> Optional[int]:
+        """
+        Смещение, с которого следует продолжить получение апдейтов: самый старый необработанный апдейт
+        или следующий за последним полученным.
+        """
+        if self.active:
+            return min(self.active)
+        if self.last_update_id is not None:
+            return self.last_update_id + 1
+        return None
+
+
+class GracefulShutdown:
+    """
+    Протокол корректной остановки бота: прием апдейтов прекращается, обработчики и фоновые работы
+    дорабатывают до крайнего срока, смещение long polling сохраняется в БД, чтобы после перезапуска
+    продолжить с необработанных апдейтов, не теряя их.
+
+    :param tracker: Отслеживание обрабатываемых апдейтов.
+    :param timeout: Крайний срок остановки в секундах.
+    :param persist_offset: Сохранять ли смещение (только для long polling).
+    """
+    def __init__(self, tracker: UpdateTracker, timeout: float, persist_offset: bool = True):
+        self.tracker = tracker
+        self.timeout = timeout
+        self.persist_offset = persist_offset
+        self.requested = False  # остановка запрошена (сигнал), перезапуск не требуется
+        self._hooks: List[Tuple[str, DrainHook]] = []
+
+    def add_hook(self, name: str, hook: DrainHook) -> None:
+        """
+        Регистрирует действие, выполняемое после завершения обработки апдейтов (в порядке регистрации).
+
+        :param name: Название действия для журнала.
+        :param hook: Асинхронная функция, получающая оставшееся до крайнего срока время.
+        """
+        self._hooks.append((name, hook))
+
+    async def drain(self) -> None:
+        """
+        Дожидается завершения обработки апдейтов и выполняет зарегистрированные действия
+        (вызывается при остановке диспетчера).
+        """
+        deadline = time.monotonic() + self.timeout
+        log.info(f"Draining: {len(self.tracker.active)} updates in progress, deadline {self.timeout}s")
+
+        if not await self.tracker.wait_idle(deadline - time.monotonic()):
+            log.warning(f"Shutdown deadline exceeded, {len(self.tracker.active)} updates left unfinished")
+
+        for name, hook in self._hooks:
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                await hook(remaining)
+                log.info(f"Drain step '{name}' completed")
+            except Exception as e:
+                log.error(f"Drain step '{name}' failed: {repr(e)}")
+
+        offset = self.tracker.next_offset
+        if self.persist_offset and offset is not None:
+            try:
+                await set_bot_state(POLLING_OFFSET_KEY, str(offset))
+                log.info(f"Polling offset {offset} saved")
+            except Exception as e:
+                log.error(f"Failed to save polling offset: {repr(e)}")
+
+    @staticmethod
+    async def restore_offset(bot: Bot) -> None:
+        """
+        Подтверждает в Telegram апдейты, обработанные до предыдущей остановки, чтобы long polling
+        продолжился с первого необработанного апдейта.
+
+        :param bot: Экземпляр бота.
+        """
+        offset = await get_bot_state(POLLING_OFFSET_KEY)
+        if offset is None:
+            return
+        # getUpdates с offset подтверждает все апдейты с меньшими update_id
+        await bot.get_updates(offset=int(offset), limit=1, timeout=0)
+        log.info(f"Polling resumed from offset {offset}")
@@ -1,32 +1,109 @@
 # utils/loguru_logger.py
-import yaml
+import os
+import random
 import sys
 from loguru import logger
-from typing import Any
+from typing import Any, Dict, Optional, Tuple
 
 from config_data import config
 
+STREAMS = {'sys.stdout': sys.stdout, 'sys.stderr': sys.stderr}
+
+
+def truncate(value: Any, limit: Optional[int] = None) -> str:
+    """
+    Обрезает большие значения (тексты запросов, ответы моделей) перед записью в журнал.
+
+    :param value: Значение для журнала.
+    :param limit: Максимальная длина (по умолчанию LOG_PAYLOAD_LIMIT).
+    :return: Строка не длиннее limit с отметкой о количестве отброшенных символов.
+    """
+    text = str(value)
+    limit = config.LOG_PAYLOAD_LIMIT if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... (+{len(text) - limit} chars)"
+
+
+class ModuleFilter:
+    """
+    Фильтр записей журнала по модулю-источнику: минимальный уровень и доля записываемых
+    DEBUG-событий (для частых событий вроде срабатываний антифлуда).
+    Правило модуля "database" применяется и к "database.requests"; пустое имя - правило по умолчанию.
+
+    :param levels: Минимальные уровни по модулям.
+    :param sampling: Доли записываемых DEBUG-событий по модулям (от 0 до 1).
+    """
+    def __init__(self, levels: Dict[str, str], sampling: Dict[str, float]):
+        self.levels = {module: logger.level(level).no for module, level in levels.items()}
+        self.sampling = {module: float(rate) for module, rate in sampling.items()}
+        self._debug_no = logger.level("DEBUG").no
+        self._cache: Dict[str, Tuple[int, float]] = {}
+
+    @staticmethod
+    def _lookup(rules: Dict[str, Any], name: str, default: Any) -> Any:
+        while name:
+            if name in rules:
+                return rules[name]
+            name = name.rpartition(".")[0]
+        return rules.get("", default)
+
+    def _rules(self, name: str) -> Tuple[int, float]:
+        rules = self._cache.get(name)
+        if rules is None:
+            rules = (self._lookup(self.levels, name, 0), self._lookup(self.sampling, name, 1.0))
+            self._cache[name] = rules
+        return rules
+
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        min_level, rate = self._rules(record["name"] or "")
+        level_no = record["level"].no
+        if level_no < min_level:
+            return False
+        if rate < 1 and level_no <= self._debug_no:
+            return random.random() < rate
+        return True
+
 
 # def setup_logger(config_path: str) -> Type[logger]:
-def setup_logger(config_path: str) -> Any:
+def worker_sink(path: str, worker: int) -> str:
+    """
+    Возвращает путь файла журнала рабочего процесса: logs/main.jsonl -> logs/main.worker1.jsonl.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{worker}{ext}"
+
+
+def setup_logger(config_path: str = config.LOGGING_CONF, worker: Optional[int] = None) -> Any:
     """
     Настраивает логгер с использованием конфигурационного файла.
+    Вызывается явно при запуске процесса бота (до этого записи идут в stderr); повторный вызов
+    заменяет обработчики, а не дублирует их.
     Аргументы:
         config_path (str): Путь к YAML файлу конфигурации логгера.
+        worker (Optional[int]): Номер рабочего процесса супервизора. Ротация и сжатие файлов loguru
+            не согласуются между процессами, поэтому каждый рабочий процесс пишет в свои файлы.
     Возвращает:
         logger: Настроенный объект логгера.
     """
+    import yaml
+
     with open(config_path, 'r') as file:
         config_data = yaml.safe_load(file)
-    
+
+    module_filter = ModuleFilter(config_data.get('levels') or {}, config_data.get('sampling') or {})
     logger.remove()  # Удаляем все стандартные обработчики
+    logger.configure(extra={'trace_id': '-'})  # ID трассы проставляется патчером utils/tracing.py
     for handler in config_data['handlers']:
-        if handler['sink'] == 'sys.stdout':
-            handler['sink'] = sys.stdout
+        if handler['sink'] in STREAMS:
+            handler['sink'] = STREAMS[handler['sink']]
+        elif worker is not None:
+            handler['sink'] = worker_sink(handler['sink'], worker)
+        handler.setdefault('filter', module_filter)
         logger.add(**handler)
-    
+
     return logger
 
 
-# Настройка логгера с использованием конфигурационного файла
-log = setup_logger(config_path=config.LOGGING_CONF)
+# Логгер, настраиваемый setup_logger() при запуске процесса бота
+log = logger
@@ -0,0 +1,283 @@
+# utils/metrics.py
+import bisect
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from aiohttp import web
+
+from config_data import config
+from utils.loguru_logger import log
+from utils.tracing import tracer
+
+LabelValues = Tuple[str, ...]
+Collector = Callable[[], Awaitable[None]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Базовый класс метрики с набором меток.
+
+    :param name: Имя метрики.
+    :param documentation: Описание метрики (строка HELP).
+    :param labelnames: Имена меток.
+    """
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Монотонно растущий счетчик.
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """
+    Текущее значение величины (размер очереди, количество активных задач и т.п.).
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """
+    Распределение величины (длительности) по корзинам.
+
+    :param buckets: Верхние границы корзин в порядке возрастания.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # по каждому набору меток: количество наблюдений в корзинах (последняя - +Inf) и сумма
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Измеряет длительность выполнения блока.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса с выводом в текстовом формате Prometheus.
+    Метрики, значения которых дорого поддерживать постоянно (например, длина очереди в БД),
+    обновляются сборщиками непосредственно перед выводом.
+    """
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def add_collector(self, collector: Collector) -> None:
+        """
+        Регистрирует асинхронную функцию, обновляющую метрики перед выводом.
+        """
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        """
+        Вызывает сборщики и возвращает все метрики в текстовом формате Prometheus.
+        """
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                log.warning(f"Metrics collector {collector.__qualname__} failed: {repr(e)}")
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+HANDLER_SECONDS = registry.histogram("bot_handler_duration_seconds",
+                                     "Handler execution time by router", ("router", "event", "outcome"))
+UPSTREAM_SECONDS = registry.histogram("bot_upstream_request_duration_seconds",
+                                      "Upstream API request time", ("api", "operation"))
+UPSTREAM_ERRORS = registry.counter("bot_upstream_errors_total",
+                                   "Failed upstream API requests", ("api", "operation", "error"))
+DB_QUERY_SECONDS = registry.histogram("bot_db_query_duration_seconds",
+                                      "Database statement execution time", ("statement",))
+DB_SHAPE_CALLS = registry.counter("bot_db_query_shape_calls_total", "Database statements executed by query shape",
+                                  ("shape",))
+DB_SHAPE_SECONDS = registry.counter("bot_db_query_shape_seconds_total",
+                                    "Database statement execution time by query shape", ("shape",))
+DB_SHAPE_MAX_SECONDS = registry.gauge("bot_db_query_shape_max_seconds",
+                                      "Slowest execution of a query shape since start", ("shape",))
+DB_SHAPE_INFO = registry.gauge("bot_db_query_shape_info", "Normalized statement of a query shape",
+                               ("shape", "statement"))
+DB_SLOW_QUERIES = registry.counter("bot_db_slow_queries_total", "Statements slower than DB_SLOW_QUERY_THRESHOLD",
+                                   ("shape",))
+TOKENS = registry.counter("bot_llm_tokens_total", "LLM tokens used", ("model", "kind"))
+QUEUE_DEPTH = registry.gauge("bot_queue_depth", "Queued or running items", ("queue", "status"))
+THROTTLED = registry.counter("bot_throttled_total", "Requests rejected by the anti-flood limiter", ("limit_class",))
+STALE_DROPPED = registry.counter("bot_stale_updates_dropped_total", "Stale updates dropped on arrival", ("event",))
+LOOP_LAG = registry.histogram("bot_event_loop_lag_seconds", "Event loop wake-up delay",
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+IN_FLIGHT_REJECTED = registry.counter("bot_in_flight_rejected_total",
+                                      "Messages rejected while an operation of the user is in progress")
+SEND_WAIT_SECONDS = registry.histogram("bot_telegram_send_wait_seconds",
+                                       "Time outgoing Bot API requests waited for rate limits", ("priority",),
+                                       buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+SEND_RETRIES = registry.counter("bot_telegram_send_retries_total", "Bot API requests retried after a 429 response",
+                                ("method",))
+SEND_COALESCED = registry.counter("bot_telegram_edits_coalesced_total",
+                                  "Message edits replaced by a newer edit before sending", ("method",))
+PROMPTS_ADJUSTED = registry.counter("bot_llm_prompts_adjusted_total",
+                                    "Prompts rejected, queued or trimmed by the token estimate", ("action",))
+PROMPT_ESTIMATE_RATIO = registry.histogram("bot_llm_prompt_estimate_ratio",
+                                           "Actual prompt tokens divided by the local estimate",
+                                           buckets=(0.5, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 2.0))
+
+
+@asynccontextmanager
+async def track_upstream(api: str, operation: str) -> AsyncIterator[None]:
+    """
+    Измеряет длительность запроса к внешнему API и считает ошибки.
+
+    :param api: Название API ("openai", "fusionbrain").
+    :param operation: Название операции.
+    """
+    start = time.perf_counter()
+    try:
+        with tracer.span(f"{api}.{operation}"):
+            yield
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(api=api, operation=operation, error=type(e).__name__)
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, api=api, operation=operation)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """
+    Обработчик HTTP-запроса метрик.
+    """
+    body = await registry.render()
+    return web.Response(body=body.encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def add_metrics_route(app: web.Application) -> None:
+    """
+    Добавляет в aiohttp-приложение маршрут METRICS_PATH.
+
+    :param app: aiohttp-приложение.
+    """
+    app.router.add_get(config.METRICS_PATH, metrics_handler)
+
+
+def create_metrics_app() -> web.Application:
+    """
+    Создает aiohttp-приложение, отдающее только метрики (для режима long polling и рабочих процессов).
+    """
+    app = web.Application()
+    add_metrics_route(app)
+    return app
@@ -0,0 +1,150 @@
+# utils/profiler.py
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from types import FrameType
+from typing import Dict, List, Optional
+
+from config_data import config
+from utils.loguru_logger import log
+from utils.metrics import LOOP_LAG
+
+
+class ProfilerBusyError(Exception):
+    """
+    Исключение, возникающее при попытке запустить профилирование, пока выполняется предыдущее.
+    """
+
+
+def _fold(frame: Optional[FrameType], thread_name: str) -> str:
+    frames: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames)).replace(" ", "_")
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик: отдельный поток периодически снимает стеки всех потоков процесса
+    (в том числе потока цикла событий) и считает одинаковые стеки. Результат - "свернутые" стеки
+    (формат flamegraph.pl, speedscope): строка "поток;файл:функция;... количество".
+
+    :param interval: Интервал между снимками в секундах.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def _sample(self, duration: float) -> Counter:
+        stacks: Counter = Counter()
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()
+                                     if thread.ident is not None}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    stacks[_fold(frame, names.get(thread_id, f"thread-{thread_id}"))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    async def profile(self, duration: float) -> str:
+        """
+        Профилирует процесс в течение duration секунд, не блокируя цикл событий.
+
+        :param duration: Длительность профилирования в секундах.
+        :return: Свернутые стеки, по одному на строку.
+        :raises ProfilerBusyError: Если профилирование уже выполняется.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Profiling is already in progress")
+        try:
+            log.info(f"Sampling profiler started for {duration}s")
+            stacks = await asyncio.to_thread(self._sample, duration)
+        finally:
+            self._lock.release()
+        log.info(f"Sampling profiler finished: {sum(stacks.values())} samples, {len(stacks)} unique stacks")
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class LoopLagMonitor:
+    """
+    Контроль блокировок цикла событий. Задача в цикле событий просыпается каждые interval секунд
+    и измеряет задержку пробуждения (метрика bot_event_loop_lag_seconds), а сторожевой поток,
+    если цикл не отвечает дольше threshold секунд, записывает в журнал стек, на котором он заблокирован
+    (например, синхронный HTTP-запрос или тяжелое вычисление в обработчике).
+
+    :param threshold: Длительность блокировки в секундах, после которой она записывается в журнал.
+    :param interval: Интервал проверки в секундах.
+    """
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._last_beat = time.monotonic()
+            LOOP_LAG.observe(lag)
+            if lag > self.threshold:
+                log.warning(f"Event loop was blocked for {lag:.3f}s")
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled <= self.threshold:
+                reported = False
+                continue
+            if reported or self._loop_thread_id is None:
+                continue
+            # стек снимается, пока цикл еще заблокирован: он указывает на место блокировки
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable"
+            log.warning(f"Event loop is blocked for {stalled:.3f}s, current stack:\n{stack}")
+            reported = True
+
+    async def start(self) -> None:
+        """
+        Запускает контроль в текущем цикле событий.
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-lag-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """
+        Останавливает контроль.
+        """
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+
+profiler = SamplingProfiler(interval=config.PROFILE_INTERVAL)
+loop_lag_monitor = LoopLagMonitor(threshold=config.LOOP_LAG_THRESHOLD, interval=config.LOOP_LAG_INTERVAL)
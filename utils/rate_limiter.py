@@ -0,0 +1,102 @@
+# utils/rate_limiter.py
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Hashable
+
+
+class BaseRateLimiter(ABC):
+    """
+    Базовый класс ограничителя частоты запросов по алгоритму "token bucket".
+
+    :param rate: Скорость пополнения (токенов в секунду).
+    :param burst: Емкость ведра (максимальное количество запросов подряд).
+    """
+    def __init__(self, rate: float, burst: int):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive")
+        self.rate = rate
+        self.burst = burst
+        self._refill_time = burst / rate  # время полного пополнения пустого ведра
+
+    @abstractmethod
+    async def consume(self, key: Hashable, cost: float = 1.0) -> float:
+        """
+        Пытается списать cost токенов из ведра ключа.
+
+        :param key: Ключ ведра (например, Telegram ID пользователя).
+        :param cost: Стоимость запроса в токенах.
+        :return: 0, если запрос разрешен, иначе время в секундах до появления нужного количества токенов.
+        """
+
+    async def close(self) -> None:
+        """
+        Освобождает ресурсы хранилища счетчиков.
+        """
+
+    def _take(self, tokens: float, elapsed: float, cost: float) -> tuple[float, float]:
+        """
+        Пополняет ведро за прошедшее время и пытается списать из него cost токенов.
+
+        :param tokens: Количество токенов в ведре на момент последнего обновления.
+        :param elapsed: Время (в секундах), прошедшее с последнего обновления.
+        :param cost: Стоимость запроса в токенах.
+        :return: Новое количество токенов и время до повторной попытки (0, если запрос разрешен).
+        """
+        tokens = min(float(self.burst), tokens + max(0.0, elapsed) * self.rate)
+        if tokens >= cost:
+            return tokens - cost, 0.0
+        return tokens, (cost - tokens) / self.rate
+
+
+class TokenBucketLimiter(BaseRateLimiter):
+    """
+    Ограничитель частоты запросов по алгоритму "token bucket" с отдельным ведром на каждый ключ,
+    хранящий счетчики в памяти процесса.
+
+    Ведро вмещает до burst токенов и пополняется со скоростью rate токенов в секунду.
+    Память - O(1) на активный ключ: хранится только пара (токены, время последнего обновления).
+    Ведра хранятся в порядке последнего обращения; ведро, простоявшее дольше времени полного
+    пополнения, эквивалентно отсутствующему и удаляется без потери информации. При превышении
+    max_keys удаляются самые давно не использовавшиеся ведра.
+
+    :param rate: Скорость пополнения (токенов в секунду).
+    :param burst: Емкость ведра (максимальное количество запросов подряд).
+    :param max_keys: Максимальное количество одновременно отслеживаемых ключей.
+    """
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        super().__init__(rate, burst)
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[Hashable, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict(self, now: float) -> None:
+        """
+        Удаляет полностью пополнившиеся ведра с начала очереди и ведра сверх лимита max_keys.
+        """
+        buckets = self._buckets
+        while buckets:
+            key, (_, updated_at) = next(iter(buckets.items()))
+            if now - updated_at >= self._refill_time or len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+            else:
+                break
+
+    async def consume(self, key: Hashable, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens, retry_after = self._take(float(self.burst), 0.0, cost)
+        else:
+            tokens, retry_after = self._take(bucket[0], now - bucket[1], cost)
+
+        if bucket is None:
+            self._buckets[key] = [tokens, now]
+        else:
+            bucket[0], bucket[1] = tokens, now
+            self._buckets.move_to_end(key)
+
+        self._evict(now)
+        return retry_after
@@ -0,0 +1,68 @@
+# utils/redis_storage.py
+# Хранилища на базе Redis-совместимого сервера (Redis, KeyDB, Valkey или локальная заглушка вроде fakeredis).
+import math
+import time
+from typing import Any, Hashable
+
+from utils.rate_limiter import BaseRateLimiter
+
+# Атомарное пополнение и списание токенов ведра на стороне сервера
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+return tostring(retry_after)
+"""
+
+
+def create_redis_client(url: str) -> Any:
+    """
+    Создает асинхронный клиент Redis по URL.
+
+    :param url: URL сервера, например "redis://localhost:6379/0".
+    :return: Экземпляр redis.asyncio.Redis.
+    :raises RuntimeError: Если пакет redis не установлен.
+    """
+    try:
+        from redis.asyncio import Redis
+    except ImportError as e:
+        raise RuntimeError("The 'redis' package is required for STORAGE_BACKEND=redis") from e
+    return Redis.from_url(url)
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель частоты запросов "token bucket" со счетчиками в Redis.
+    Ведро обновляется Lua-скриптом атомарно, ключи удаляются сервером по истечении времени полного пополнения.
+
+    :param redis: Асинхронный клиент Redis.
+    :param rate: Скорость пополнения (токенов в секунду).
+    :param burst: Емкость ведра.
+    :param namespace: Пространство имен ключей (например, "cheap" или "expensive").
+    """
+    def __init__(self, redis: Any, rate: float, burst: int, namespace: str):
+        super().__init__(rate, burst)
+        self.redis = redis
+        self.namespace = namespace
+        self._ttl = max(1, math.ceil(self._refill_time))
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def consume(self, key: Hashable, cost: float = 1.0) -> float:
+        retry_after = await self._script(
+            keys=[f"antiflood:{self.namespace}:{key}"],
+            args=[self.rate, self.burst, cost, time.time(), self._ttl],
+        )
+        return float(retry_after)
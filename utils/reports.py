@@ -0,0 +1,80 @@
+# utils/reports.py
+# Чистые функции формирования отчетов. Модуль намеренно не импортирует конфигурацию,
+# БД и aiogram: он загружается в рабочих процессах пула (utils/workers.py).
+import os
+import zipfile
+from typing import Callable, Iterable, Sequence, Tuple
+
+# (дата запроса, название модели, количество токенов, запрос, ответ)
+ReportRecord = Tuple[str, str, int, str, str]
+
+
+def render_report(report_header: str, records: Iterable[ReportRecord]) -> str:
+    """
+    Формирует текст отчета на основе данных запросов и ответов.
+
+    :param report_header: Заголовок отчета.
+    :param records: Записи отчета в виде простых кортежей (см. ReportRecord).
+    :return: Сформированный отчет в виде строки.
+    """
+    separator = '-' * 20
+    entries = [
+        f"Запись #{num}\n\n"
+        f"Дата запроса:\n{requests_date}\n\n"
+        f"Модель ИИ:\n{model_name}\n\n"
+        f"Общее количество токенов:\n{total_tokens}\n"
+        f"Запрос:\n{separator}\n{request}\n"
+        f"Ответ:\n{separator}\n{answer}\n\n"
+        for num, (requests_date, model_name, total_tokens, request, answer) in enumerate(records, start=1)
+    ]
+    # заголовок уже оканчивается пустой строкой; записи разделяются пустой строкой
+    return report_header + "\n\n".join(entries)
+
+
+def render_history_report(report_header: str, records: Iterable[ReportRecord]) -> str:
+    """
+    Формирует текст отчета /history (без даты запроса, с разделителями у каждого поля).
+
+    :param report_header: Заголовок отчета.
+    :param records: Записи отчета в виде простых кортежей (см. ReportRecord).
+    :return: Сформированный отчет в виде строки.
+    """
+    separator = '-' * 20
+    parts = [report_header]
+    for num, (_, model_name, total_tokens, request, answer) in enumerate(records, start=1):
+        parts.append(
+            f"Запись #{num}.\n\n"
+            f"Модель ИИ:\n{separator}\n{model_name}\n\n"
+            f"Общее количество токенов:\n{separator}\n{total_tokens}\n\n"
+            f"Запрос:\n{separator}\n{request}\n\n"
+            f"Ответ:\n{separator}\n{answer}\n\n\n\n\n"
+        )
+    return "".join(parts)
+
+
+def write_report_file(file_path: str, report_header: str,
+                      records: Sequence[ReportRecord], compress_threshold: int = 0,
+                      render: Callable[[str, Iterable[ReportRecord]], str] = render_report) -> str:
+    """
+    Формирует отчет и записывает его в файл. Если размер отчета превышает порог,
+    отчет упаковывается в zip-архив рядом с исходным путем.
+
+    :param file_path: Путь к текстовому файлу отчета.
+    :param report_header: Заголовок отчета.
+    :param records: Записи отчета.
+    :param compress_threshold: Размер отчета в байтах, начиная с которого он сжимается (0 - не сжимать).
+    :param render: Функция формирования текста отчета (функция модуля, чтобы ее можно было передать в пул).
+    :return: Путь к итоговому файлу (.txt или .zip).
+    """
+    data = render(report_header, records).encode('utf-8')
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    if compress_threshold and len(data) > compress_threshold:
+        zip_path = os.path.splitext(file_path)[0] + '.zip'
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(os.path.basename(file_path), data)
+        return zip_path
+
+    with open(file_path, 'wb') as file:
+        file.write(data)
+    return file_path
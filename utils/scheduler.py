@@ -0,0 +1,187 @@
+# utils/scheduler.py
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.types import Message
+
+from utils.loguru_logger import log
+
+Callback = Callable[[], Awaitable[Any]]
+
+
+class ScheduledAction:
+    """
+    Отложенное действие планировщика.
+
+    :param when: Момент выполнения (по time.monotonic()).
+    :param callback: Асинхронная функция без аргументов.
+    :param key: Ключ действия (новое действие с тем же ключом заменяет предыдущее).
+    """
+    __slots__ = ("when", "callback", "key", "cancelled")
+
+    def __init__(self, when: float, callback: Callback, key: Optional[Hashable]):
+        self.when = when
+        self.callback = callback
+        self.key = key
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Отменяет действие (запись удаляется из кучи при наступлении ее срока).
+        """
+        self.cancelled = True
+
+
+class HousekeepingScheduler:
+    """
+    Планировщик отложенных служебных действий (сброс состояний, удаление сообщений и т.п.).
+
+    Все действия хранятся в одной двоичной куче и обслуживаются одной фоновой задачей,
+    которая спит до ближайшего срока, поэтому тысячи ожидающих таймеров почти ничего не стоят,
+    а обработчики возвращаются сразу, не дожидаясь выполнения действий.
+    """
+    def __init__(self) -> None:
+        self._heap: List[tuple[float, int, ScheduledAction]] = []
+        self._keys: Dict[Hashable, ScheduledAction] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task[None]] = None
+        self._running_tasks: Set[asyncio.Task[Any]] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def call_later(self, delay: float, callback: Callback, key: Optional[Hashable] = None) -> ScheduledAction:
+        """
+        Планирует выполнение действия через delay секунд.
+
+        :param delay: Задержка в секундах.
+        :param callback: Асинхронная функция без аргументов.
+        :param key: Ключ действия; ранее запланированное действие с тем же ключом отменяется.
+        :return: Запланированное действие (можно отменить через cancel()).
+        """
+        if key is not None:
+            self.cancel(key)
+
+        action = ScheduledAction(time.monotonic() + delay, callback, key)
+        if key is not None:
+            self._keys[key] = action
+
+        is_earliest = not self._heap or action.when < self._heap[0][0]
+        heapq.heappush(self._heap, (action.when, next(self._counter), action))
+        self._ensure_runner()
+        if is_earliest and self._wakeup is not None:
+            self._wakeup.set()
+        return action
+
+    def cancel(self, key: Hashable) -> None:
+        """
+        Отменяет действие с указанным ключом, если оно запланировано.
+
+        :param key: Ключ действия.
+        """
+        action = self._keys.pop(key, None)
+        if action is not None:
+            action.cancel()
+
+    def _ensure_runner(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run(), name="housekeeping-scheduler")
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            timeout = self._heap[0][0] - time.monotonic()
+            if timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, action = heapq.heappop(self._heap)
+            if action.cancelled:
+                continue
+            if action.key is not None and self._keys.get(action.key) is action:
+                del self._keys[action.key]
+
+            task = asyncio.create_task(self._execute(action))
+            self._running_tasks.add(task)
+            task.add_done_callback(self._running_tasks.discard)
+
+    @staticmethod
+    async def _execute(action: ScheduledAction) -> None:
+        try:
+            await action.callback()
+        except Exception as e:
+            log.warning(f"Scheduled action {action.key or action.callback} failed: {repr(e)}")
+
+    async def stop(self) -> None:
+        """
+        Останавливает планировщик; невыполненные действия отбрасываются,
+        уже запущенные - дожидаются завершения.
+        """
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._running_tasks:
+            await asyncio.gather(*self._running_tasks, return_exceptions=True)
+        log.info(f"Housekeeping scheduler stopped, {len(self._heap)} pending actions dropped")
+        self._heap.clear()
+        self._keys.clear()
+
+
+# Общий планировщик служебных действий бота
+scheduler = HousekeepingScheduler()
+
+
+def schedule_message_deletion(delay: float, *messages: Message) -> ScheduledAction:
+    """
+    Планирует удаление сообщений через delay секунд (ошибки удаления игнорируются).
+
+    :param delay: Задержка в секундах.
+    :param messages: Сообщения для удаления.
+    :return: Запланированное действие.
+    """
+    async def delete_messages() -> None:
+        for message in messages:
+            try:
+                await message.delete()
+            except Exception as e:
+                log.debug(f"Failed to delete message {message.message_id}: {repr(e)}")
+
+    return scheduler.call_later(delay, delete_messages)
+
+
+def schedule_state_reset(delay: float, state: FSMContext, expected_state: State) -> ScheduledAction:
+    """
+    Планирует сброс состояния FSM через delay секунд, если к этому моменту пользователь
+    все еще находится в состоянии expected_state (например, так и не отправил запрос).
+
+    :param delay: Задержка в секундах.
+    :param state: Контекст состояния FSM пользователя.
+    :param expected_state: Состояние, которое нужно сбросить.
+    :return: Запланированное действие.
+    """
+    async def reset_state() -> None:
+        if await state.get_state() == expected_state.state:
+            await state.clear()
+            log.debug(f"Abandoned state {expected_state.state} reset for user {state.key.user_id}")
+
+    return scheduler.call_later(delay, reset_state, key=("state_reset", state.key))
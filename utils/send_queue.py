@@ -0,0 +1,239 @@
+# utils/send_queue.py
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from config_data import config
+from utils.loguru_logger import log
+from utils.metrics import QUEUE_DEPTH, SEND_COALESCED, SEND_RETRIES, SEND_WAIT_SECONDS
+from utils.rate_limiter import TokenBucketLimiter
+from utils.tracing import tracer
+
+INTERACTIVE = 0  # ответы пользователям
+BULK = 1  # массовые уведомления
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# методы Bot API, на которые распространяются ограничения Telegram на отправку сообщений
+QUEUED_METHODS = frozenset({
+    "sendMessage", "sendPhoto", "sendDocument", "sendVideo", "sendAudio", "sendVoice", "sendAnimation",
+    "sendSticker", "sendMediaGroup", "sendLocation", "sendContact", "sendPoll", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup",
+})
+# частые правки одного сообщения, ожидающие отправки, заменяются последней
+COALESCED_METHODS = frozenset({"editMessageText", "editMessageCaption", "editMessageReplyMarkup"})
+
+GLOBAL_KEY = "global"
+
+_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+Send = Callable[[Any], Awaitable[Any]]
+
+
+@contextmanager
+def bulk_sends() -> Iterator[None]:
+    """
+    Отправляет сообщения внутри блока с низким приоритетом: они не задерживают ответы пользователям.
+    """
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _EditHandover(Exception):
+    """
+    Вызов, отправлявший правку, отменен; правку отправляет один из замененных вызовов.
+    """
+
+
+class PendingEdit:
+    """
+    Правка сообщения, ожидающая отправки: последняя версия метода и результат, общий для всех
+    вызовов, замененных этой правкой.
+    """
+    __slots__ = ("method", "future")
+
+    def __init__(self, method: Any):
+        self.method = method
+        self.future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+
+
+class SendQueue:
+    """
+    Очередь исходящих сообщений процесса с учетом ограничений Telegram.
+
+    Перед отправкой запрос ждет токен ведра своего чата (сообщения одного чата отправляются по порядку)
+    и токен общего ведра бота; общие токены выдаются ожидающим по приоритету (ответы пользователям раньше
+    массовых уведомлений), внутри приоритета - по очереди. При ответе 429 запрос повторяется через
+    retry_after секунд, а остальные сообщения этого чата ждут вместе с ним. Правки сообщения, поступившие,
+    пока предыдущая правка того же сообщения ждет отправки, объединяются: отправляется только последняя.
+
+    :param global_rate: Сообщений в секунду на бота (на процесс).
+    :param chat_rate: Сообщений в секунду на личный чат.
+    :param group_rate: Сообщений в секунду на группу или канал.
+    :param chat_burst: Сообщений подряд в один чат.
+    :param max_retries: Максимум повторов запроса после ответа 429.
+    :param max_retry_after: Максимальное время ожидания повтора в секундах; при большем ошибка не перехватывается.
+    """
+    def __init__(self, global_rate: float, chat_rate: float, group_rate: float, chat_burst: int,
+                 max_retries: int, max_retry_after: float):
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._global = TokenBucketLimiter(rate=global_rate, burst=max(1, int(global_rate)))
+        self._chats = TokenBucketLimiter(rate=chat_rate, burst=chat_burst)
+        self._groups = TokenBucketLimiter(rate=group_rate, burst=chat_burst)
+        self._chat_locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}  # замок и количество его пользователей
+        self._waiters: List[Tuple[int, int, asyncio.Future[None]]] = []  # куча (приоритет, номер, ожидание)
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task[None]] = None
+        self._edits: Dict[Tuple[str, Hashable, int], PendingEdit] = {}
+
+    def _update_depth(self) -> None:
+        QUEUE_DEPTH.set(len(self._waiters), queue="telegram_send", status="waiting")
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            if self._waiters[0][2].done():  # ожидание отменено
+                heapq.heappop(self._waiters)
+                continue
+            delay = await self._global.consume(GLOBAL_KEY)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            # ожидание могло быть отменено во время паузы; токен достанется следующему
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+            self._update_depth()
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._waiters and not await self._global.consume(GLOBAL_KEY):
+            return
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._update_depth()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="telegram-send-queue")
+        await waiter
+
+    async def _acquire_chat(self, chat_id: Hashable) -> None:
+        # ID личных чатов положительные, групп и каналов - отрицательные (или @username канала)
+        limiter = self._chats if isinstance(chat_id, int) and chat_id > 0 else self._groups
+        while delay := await limiter.consume(chat_id):
+            await asyncio.sleep(delay)
+
+    async def _send_with_retry(self, chat_id: Hashable, name: str, request: Callable[[], Awaitable[Any]]) -> Any:
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            await self._acquire_chat(chat_id)
+            await self._acquire_global(priority)
+            waited = time.perf_counter() - start
+            SEND_WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES[priority])
+            if waited > 0.001:
+                tracer.record("telegram.queue", waited, method=name)
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                SEND_RETRIES.inc(method=name)
+                log.warning("Telegram flood control for chat {}: retrying {} in {}s (attempt {})",
+                            chat_id, name, e.retry_after, attempt)
+                await asyncio.sleep(e.retry_after)
+
+    async def _send_edit(self, lock: asyncio.Lock, chat_id: Hashable, name: str, message_id: int, method: Any,
+                         send: Send, replace: bool = True) -> Any:
+        key = (name, chat_id, message_id)
+        edit = self._edits.get(key)
+        if edit is not None:
+            if replace:
+                edit.method = method
+                SEND_COALESCED.inc(method=name)
+            try:
+                return await asyncio.shield(edit.future)
+            except _EditHandover:
+                # последнюю версию отправляет первый из замененных вызовов, остальные ждут его
+                # (или правку, поступившую после отмены: она новее и не заменяется)
+                return await self._send_edit(lock, chat_id, name, message_id, edit.method, send, replace=False)
+
+        edit = self._edits[key] = PendingEdit(method)
+
+        def request() -> Awaitable[Any]:
+            # отправляется последняя версия правки; правки, поступившие позже, ждут следующей отправки
+            if self._edits.get(key) is edit:
+                del self._edits[key]
+            return send(edit.method)
+
+        try:
+            async with lock:
+                result = await self._send_with_retry(chat_id, name, request)
+        except BaseException as e:
+            if self._edits.get(key) is edit:
+                del self._edits[key]
+            # отмена вызывающего не отменяет замененные правки: отправка передается им
+            edit.future.set_exception(_EditHandover() if isinstance(e, asyncio.CancelledError) else e)
+            edit.future.exception()  # ошибку получает вызывающий; замененные правки могут ее не ждать
+            raise
+        edit.future.set_result(result)
+        return result
+
+    async def send(self, chat_id: Optional[Hashable], method: Any, send: Send) -> Any:
+        """
+        Отправляет запрос к Bot API с соблюдением ограничений Telegram.
+
+        :param chat_id: ID чата получателя (None - запрос отправляется сразу).
+        :param method: Метод Bot API.
+        :param send: Функция, выполняющая запрос.
+        :return: Ответ Bot API.
+        """
+        name = method.__api_method__
+        if chat_id is None or name not in QUEUED_METHODS:
+            return await send(method)
+
+        lock = self._lock(chat_id)
+        try:
+            message_id = getattr(method, "message_id", None)
+            if name in COALESCED_METHODS and message_id is not None:
+                return await self._send_edit(lock, chat_id, name, message_id, method, send)
+            async with lock:
+                return await self._send_with_retry(chat_id, name, lambda: send(method))
+        finally:
+            self._release(chat_id)
+
+    def _lock(self, chat_id: Hashable) -> asyncio.Lock:
+        lock, users = self._chat_locks.get(chat_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._chat_locks[chat_id] = (lock, users + 1)
+        return lock
+
+    def _release(self, chat_id: Hashable) -> None:
+        lock, users = self._chat_locks[chat_id]
+        if users > 1:
+            self._chat_locks[chat_id] = (lock, users - 1)
+        else:
+            del self._chat_locks[chat_id]
+
+
+send_queue = SendQueue(
+    # чаты закреплены за рабочими процессами, а общий лимит бота делится между ними
+    global_rate=config.TELEGRAM_GLOBAL_RATE / max(1, config.BOT_WORKERS),
+    chat_rate=config.TELEGRAM_CHAT_RATE,
+    group_rate=config.TELEGRAM_GROUP_RATE,
+    chat_burst=config.TELEGRAM_CHAT_BURST,
+    max_retries=config.TELEGRAM_SEND_MAX_RETRIES,
+    max_retry_after=config.TELEGRAM_SEND_MAX_RETRY_AFTER,
+)
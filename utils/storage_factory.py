@@ -0,0 +1,69 @@
+# utils/storage_factory.py
+from typing import Any, Dict
+
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config_data import config
+from utils.rate_limiter import BaseRateLimiter, TokenBucketLimiter
+from utils.loguru_logger import log
+
+_redis_client: Any = None
+
+
+def _get_redis() -> Any:
+    """
+    Возвращает общий для FSM и ограничителей клиент Redis (создается при первом обращении).
+    """
+    global _redis_client
+    if _redis_client is None:
+        from utils.redis_storage import create_redis_client
+        _redis_client = create_redis_client(config.REDIS_URL)
+    return _redis_client
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Создает хранилище FSM в соответствии с настройкой STORAGE_BACKEND ("memory", "database" или "redis").
+
+    :return: Хранилище FSM для Dispatcher.
+    """
+    log.info(f"Using '{config.STORAGE_BACKEND}' FSM storage")
+    if config.STORAGE_BACKEND == "database":
+        from database.storage import DatabaseStorage
+        return DatabaseStorage()
+    if config.STORAGE_BACKEND == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage(redis=_get_redis(), key_builder=DefaultKeyBuilder(with_destiny=True))
+    return MemoryStorage()
+
+
+def create_rate_limiter(namespace: str, rate: float, burst: int) -> BaseRateLimiter:
+    """
+    Создает ограничитель частоты запросов в соответствии с настройкой STORAGE_BACKEND.
+
+    :param namespace: Пространство имен счетчиков.
+    :param rate: Скорость пополнения (токенов в секунду).
+    :param burst: Емкость ведра.
+    :return: Ограничитель частоты запросов.
+    """
+    if config.STORAGE_BACKEND == "database":
+        from database.storage import DatabaseRateLimiter
+        return DatabaseRateLimiter(rate=rate, burst=burst, namespace=namespace)
+    if config.STORAGE_BACKEND == "redis":
+        from utils.redis_storage import RedisRateLimiter
+        return RedisRateLimiter(_get_redis(), rate=rate, burst=burst, namespace=namespace)
+    return TokenBucketLimiter(rate=rate, burst=burst, max_keys=config.ANTIFLOOD_MAX_TRACKED_USERS)
+
+
+def create_antiflood_limiters() -> Dict[str, BaseRateLimiter]:
+    """
+    Создает ограничители антифлуда для дешевых команд и дорогих генераций.
+
+    :return: Словарь ограничителей по классам обработчиков.
+    """
+    return {
+        "cheap": create_rate_limiter("cheap", config.ANTIFLOOD_CHEAP_RATE, config.ANTIFLOOD_CHEAP_BURST),
+        "expensive": create_rate_limiter("expensive", config.ANTIFLOOD_EXPENSIVE_RATE,
+                                         config.ANTIFLOOD_EXPENSIVE_BURST),
+    }
@@ -0,0 +1,276 @@
+# utils/supervisor.py
+# Режим нескольких рабочих процессов: один процесс-супервизор принимает вебхук и распределяет апдейты
+# по рабочим процессам по chat id, рабочие процессы обрабатывают апдейты своим Dispatcher.
+import asyncio
+import json
+import multiprocessing
+import re
+import signal
+import threading
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from config_data import config
+from utils.loguru_logger import log, setup_logger
+from utils.metrics import add_metrics_route, create_metrics_app, registry
+
+UPDATES_ROUTED = registry.counter("bot_supervisor_updates_total", "Updates passed to worker processes",
+                                  ("worker", "outcome"))
+WORKER_RESTARTS = registry.counter("bot_supervisor_worker_restarts_total", "Worker process restarts", ("worker",))
+
+# Первое вхождение "chat":{"id":...} - чат сообщения, callback-запроса и т.п.; иначе - отправитель
+_CHAT_ID_RE = re.compile(rb'"chat"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+_FROM_ID_RE = re.compile(rb'"from"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+_UPDATE_ID_RE = re.compile(rb'"update_id"\s*:\s*(\d+)')
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def extract_routing_key(body: bytes) -> int:
+    """
+    Быстро (без полного разбора JSON) извлекает из апдейта ключ маршрутизации: chat id,
+    а при его отсутствии - id отправителя или update_id.
+
+    :param body: Тело апдейта в формате JSON.
+    :return: Ключ маршрутизации.
+    """
+    for pattern in (_CHAT_ID_RE, _FROM_ID_RE, _UPDATE_ID_RE):
+        match = pattern.search(body)
+        if match:
+            return int(match.group(1))
+    return 0
+
+
+class WorkerHandle:
+    """
+    Рабочий процесс супервизора и канал передачи ему апдейтов.
+
+    :param index: Номер рабочего процесса.
+    """
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[BaseProcess] = None
+        self.connection: Optional[Connection] = None
+        self.lock = asyncio.Lock()  # сохраняет порядок отправки апдейтов в канал
+        self.restarts = 0
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None  # момент перезапуска упавшего процесса
+
+    def start(self) -> None:
+        """
+        Запускает (или перезапускает) рабочий процесс с новым каналом.
+        """
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        self.process = context.Process(target=worker_main, args=(self.index, parent_conn),
+                                       name=f"bot-worker-{self.index}", daemon=True)
+        self.process.start()
+        parent_conn.close()
+        self.connection = child_conn
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        log.info(f"Worker {self.index} started with pid {self.process.pid}")
+
+    async def send(self, routing_key: int, body: bytes) -> None:
+        """
+        Передает апдейт рабочему процессу.
+
+        :param routing_key: Ключ маршрутизации апдейта.
+        :param body: Тело апдейта.
+        """
+        async with self.lock:
+            connection = self.connection
+            if connection is None:
+                raise ConnectionError(f"Worker {self.index} is not running")
+            payload = routing_key.to_bytes(8, "big", signed=True) + body
+            await asyncio.get_running_loop().run_in_executor(None, connection.send_bytes, payload)
+
+    def stop(self, timeout: float) -> None:
+        """
+        Закрывает канал (рабочий процесс дорабатывает полученные апдейты и завершается) и ждет процесс.
+
+        :param timeout: Время ожидания завершения процесса в секундах.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                log.warning(f"Worker {self.index} did not stop in time and will be terminated")
+                self.process.terminate()
+                self.process.join()
+
+
+class Supervisor:
+    """
+    Супервизор рабочих процессов бота: принимает вебхук Telegram, распределяет апдейты
+    по рабочим процессам (все апдейты одного чата - в один процесс, в порядке поступления)
+    и перезапускает упавшие процессы.
+
+    :param workers: Количество рабочих процессов.
+    """
+    def __init__(self, workers: int):
+        self.workers: List[WorkerHandle] = [WorkerHandle(index) for index in range(workers)]
+
+    def _worker_for(self, routing_key: int) -> WorkerHandle:
+        return self.workers[routing_key % len(self.workers)]
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """
+        Обрабатывает POST-запрос вебхука: проверяет секрет и передает апдейт рабочему процессу.
+        """
+        if config.WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+
+        body = await request.read()
+        routing_key = extract_routing_key(body)
+        worker = self._worker_for(routing_key)
+        try:
+            await worker.send(routing_key, body)
+        except (ConnectionError, OSError) as e:
+            UPDATES_ROUTED.inc(worker=str(worker.index), outcome="error")
+            log.error(f"Failed to pass update to worker {worker.index}: {repr(e)}")
+            # Telegram повторит доставку апдейта
+            return web.Response(status=503)
+        UPDATES_ROUTED.inc(worker=str(worker.index), outcome="ok")
+        return web.Response()
+
+    async def monitor(self) -> None:
+        """
+        Следит за рабочими процессами и перезапускает упавшие с нарастающей задержкой.
+        Пауза перед перезапуском выдерживается без блокировки канала: пока процесс не запущен,
+        апдейты его чатов сразу получают ответ 503 (Telegram повторит доставку), а остальные
+        процессы проверяются и перезапускаются независимо.
+        """
+        while True:
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.process is None or worker.process.is_alive():
+                    continue
+                if worker.restart_at is None:
+                    log.error(f"Worker {worker.index} exited with code {worker.process.exitcode}, restarting")
+                    WORKER_RESTARTS.inc(worker=str(worker.index))
+                    async with worker.lock:
+                        if worker.connection is not None:
+                            worker.connection.close()
+                            worker.connection = None
+                    # если процесс падает сразу после запуска, увеличиваем паузу перед перезапуском
+                    if now - worker.started_at < config.WORKER_RESTART_DELAY * 10:
+                        worker.restarts += 1
+                    else:
+                        worker.restarts = 0
+                    worker.restart_at = now + min(60.0, config.WORKER_RESTART_DELAY * 2 ** worker.restarts)
+                if now >= worker.restart_at:
+                    worker.start()
+            await asyncio.sleep(min(1.0, config.WORKER_RESTART_DELAY))
+
+    async def run(self) -> None:
+        """
+        Запускает рабочие процессы, регистрирует вебхук и обслуживает входящие апдейты до отмены задачи.
+        """
+        from utils.bot_loader import bot
+        from utils.web_server import serve_app
+
+        if not config.WEBHOOK_BASE_URL:
+            raise ValueError("WEBHOOK_BASE_URL must be set for BOT_WORKERS > 1")
+
+        for worker in self.workers:
+            worker.start()
+
+        app = web.Application()
+        app.router.add_post(config.WEBHOOK_PATH, self.handle_update)
+        if config.METRICS_ENABLED:
+            add_metrics_route(app)
+
+        webhook_url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+        await bot.set_webhook(url=webhook_url, secret_token=config.WEBHOOK_SECRET,
+                              max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                              drop_pending_updates=False)
+        log.info(f"Supervisor started {len(self.workers)} workers, webhook is set to {webhook_url}")
+
+        monitor_task = asyncio.create_task(self.monitor())
+        try:
+            await serve_app(app)
+        finally:
+            monitor_task.cancel()
+            for worker in self.workers:
+                await asyncio.get_running_loop().run_in_executor(None, worker.stop, config.WORKER_STOP_TIMEOUT)
+            await bot.session.close()
+            log.info("Supervisor stopped")
+
+
+def worker_main(index: int, connection: Connection) -> None:
+    """
+    Точка входа рабочего процесса: принимает апдейты из канала и передает их Dispatcher.
+
+    :param index: Номер рабочего процесса.
+    :param connection: Канал, из которого читаются апдейты.
+    """
+    # Ctrl-C получает вся группа процессов: остановкой рабочих процессов управляет супервизор,
+    # закрывая каналы, чтобы полученные апдейты были доработаны
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logger(worker=index)
+    asyncio.run(_worker_loop(index, connection))
+
+
+async def _worker_loop(index: int, connection: Connection) -> None:
+    from bot_app import bot, dp
+    from utils.web_server import serve_app
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Optional[bytes]] = asyncio.Queue()
+
+    def reader() -> None:
+        # блокирующее чтение канала выполняется в отдельном потоке, чтобы не блокировать цикл событий
+        while True:
+            try:
+                payload = connection.recv_bytes()
+            except (EOFError, OSError):
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+                return
+            loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+    threading.Thread(target=reader, name=f"worker-{index}-reader", daemon=True).start()
+
+    # последняя задача по каждому чату: апдейты одного чата обрабатываются строго по очереди
+    chat_tails: Dict[int, asyncio.Task[Any]] = {}
+
+    async def process(routing_key: int, body: bytes, previous: Optional[asyncio.Task[Any]]) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await dp.feed_raw_update(bot, json.loads(body))
+        except Exception as e:
+            log.exception(f"Worker {index} failed to process update: {repr(e)}")
+        finally:
+            if chat_tails.get(routing_key) is asyncio.current_task():
+                del chat_tails[routing_key]
+
+    log.info(f"Worker {index} is ready")
+    metrics_server: Optional[asyncio.Task[None]] = None
+    if config.METRICS_ENABLED:
+        metrics_server = asyncio.create_task(
+            serve_app(create_metrics_app(), port=config.METRICS_WORKER_BASE_PORT + index)
+        )
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        while (payload := await queue.get()) is not None:
+            routing_key = int.from_bytes(payload[:8], "big", signed=True)
+            chat_tails[routing_key] = asyncio.create_task(
+                process(routing_key, payload[8:], chat_tails.get(routing_key))
+            )
+        # канал закрыт супервизором: дорабатываем полученные апдейты
+        if chat_tails:
+            await asyncio.gather(*chat_tails.values(), return_exceptions=True)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        if metrics_server is not None:
+            metrics_server.cancel()
+            await asyncio.gather(metrics_server, return_exceptions=True)
+        await bot.session.close()
+        log.info(f"Worker {index} stopped")
@@ -0,0 +1,171 @@
+# utils/token_estimator.py
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, NamedTuple, Sequence
+
+from config_data import config
+from utils.metrics import PROMPTS_ADJUSTED
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam
+
+# слова, числа, переводы строк, прочие пробелы, знаки препинания и символы
+_PIECES = re.compile(r"[^\W\d_]+|\d+|\n+|[^\S\n]+|[^\w\s]+|_+")
+_CYRILLIC = re.compile("[\u0400-\u04ff]")
+_CACHED_PIECE_CHARS = 32  # более длинные фрагменты не кэшируются
+
+MESSAGE_OVERHEAD = 3  # служебные токены формата Chat Completions на сообщение
+REPLY_OVERHEAD = 3  # служебные токены начала ответа
+TRIM_MARKER = "\n[...]\n"
+
+
+def _piece_tokens(piece: str) -> int:
+    """
+    Оценивает количество токенов фрагмента текста. Коэффициенты подобраны по словарю cl100k_base
+    (gpt-3.5-turbo, gpt-4): короткое английское слово - один токен, русское - около 2,5 символа на токен,
+    числа делятся на группы до трех цифр.
+    """
+    first = piece[0]
+    if first.isspace():
+        # одиночный пробел входит в токен следующего слова
+        return 0 if piece == " " else 1
+    if first.isdigit():
+        return -(-len(piece) // 3)
+    if first.isalpha():
+        if piece.isascii():
+            return 1 + (len(piece) - 1) // 7
+        if _CYRILLIC.match(first):
+            return -(-len(piece) * 2 // 5)
+        return len(piece)  # иероглифы и другие алфавиты - около токена на символ
+    if piece.isascii():
+        return -(-len(piece) // 2)
+    return max(1, len(piece.encode()) // 2)  # эмодзи и прочие символы кодируются по байтам
+
+
+_cached_piece_tokens = lru_cache(maxsize=65536)(_piece_tokens)
+
+
+class PromptPlan(NamedTuple):
+    """
+    Запрос к модели, подогнанный под контекстное окно: контекст диалога, текст запроса,
+    оценка токенов запроса и признаки изменений.
+    """
+    history: List["ChatCompletionMessageParam"]
+    text: str
+    prompt_tokens: int
+    history_dropped: int
+    trimmed: bool
+
+
+class TokenEstimator:
+    """
+    Оценка количества токенов текста без токенизатора модели (словари tiktoken загружаются из сети).
+    Оценка используется до обращения к модели: чтобы отклонить, сократить или поставить в очередь
+    слишком длинный запрос и предсказать его стоимость; фактический расход по-прежнему берется из usage.
+
+    Оценки текстов кэшируются (LRU) по хэшу и длине текста: краткие содержания и реплики диалога
+    оцениваются при каждом запросе, а сами тексты в кэше не хранятся.
+
+    :param cache_size: Максимальное количество кэшированных оценок.
+    """
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, int] = OrderedDict()
+
+    def count(self, text: str) -> int:
+        """
+        Оценивает количество токенов текста.
+
+        :param text: Текст.
+        """
+        if not text:
+            return 0
+        key = (hash(text), len(text))
+        tokens = self._cache.get(key)
+        if tokens is not None:
+            self._cache.move_to_end(key)
+            return tokens
+
+        tokens = 0
+        for piece in _PIECES.findall(text):
+            tokens += _cached_piece_tokens(piece) if len(piece) <= _CACHED_PIECE_CHARS else _piece_tokens(piece)
+        self._cache[key] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: Sequence["ChatCompletionMessageParam"]) -> int:
+        """
+        Оценивает количество токенов сообщений Chat Completions (без служебных токенов начала ответа).
+
+        :param messages: Сообщения в формате Chat Completions.
+        """
+        tokens = 0
+        for message in messages:
+            content = message.get("content")
+            # бот отправляет только текст; части с изображениями не оцениваются
+            tokens += (self.count(content) if isinstance(content, str) else 0) + MESSAGE_OVERHEAD
+        return tokens
+
+    def trim(self, text: str, max_tokens: int) -> str:
+        """
+        Сокращает текст до max_tokens токенов, сохраняя начало и конец (обычно там постановка задачи
+        и вопрос) и заменяя середину отметкой TRIM_MARKER.
+
+        :param text: Текст.
+        :param max_tokens: Максимальное количество токенов.
+        """
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text
+        keep = len(text) * max(0, max_tokens - self.count(TRIM_MARKER)) // tokens
+        while keep > 0:
+            head = keep * 2 // 3
+            trimmed = text[:head] + TRIM_MARKER + text[len(text) - (keep - head):]
+            if self.count(trimmed) <= max_tokens:
+                return trimmed
+            keep = keep * 9 // 10
+        return ""
+
+    def fit_prompt(self, text: str, history: List["ChatCompletionMessageParam"], max_tokens: int) -> PromptPlan:
+        """
+        Подгоняет запрос с контекстом диалога под max_tokens токенов: сначала отбрасываются ранние
+        реплики контекста (краткое содержание остается), затем сокращается текст запроса.
+
+        :param text: Текст запроса.
+        :param history: Контекст диалога (сообщения перед запросом).
+        :param max_tokens: Бюджет токенов запроса.
+        """
+        history = list(history)
+        budget = max_tokens - REPLY_OVERHEAD - MESSAGE_OVERHEAD
+        text_tokens = self.count(text)
+        history_tokens = self.count_messages(history)
+        dropped = 0
+        while history and text_tokens + history_tokens > budget:
+            index = next((i for i, message in enumerate(history) if message["role"] != "system"), 0)
+            history_tokens -= self.count_messages([history.pop(index)])
+            dropped += 1
+
+        trimmed = text_tokens + history_tokens > budget
+        if trimmed:
+            text = self.trim(text, budget - history_tokens)
+            text_tokens = self.count(text)
+            PROMPTS_ADJUSTED.inc(action="trimmed")
+        if dropped:
+            PROMPTS_ADJUSTED.inc(action="history_dropped")
+        return PromptPlan(history, text, text_tokens + history_tokens + REPLY_OVERHEAD + MESSAGE_OVERHEAD,
+                          dropped, trimmed)
+
+
+def predict_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Предсказывает стоимость запроса к модели в долларах по ценам LLM_PROMPT_PRICE и LLM_COMPLETION_PRICE.
+
+    :param prompt_tokens: Токенов запроса.
+    :param completion_tokens: Ожидаемое количество токенов ответа.
+    """
+    return (prompt_tokens * config.LLM_PROMPT_PRICE + completion_tokens * config.LLM_COMPLETION_PRICE) / 1_000_000
+
+
+token_estimator = TokenEstimator(cache_size=config.TOKEN_ESTIMATE_CACHE_SIZE)
@@ -0,0 +1,181 @@
+# utils/token_quotas.py
+import asyncio
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config_data import config
+from database.requests import add_token_usage, get_token_usage
+from utils.loguru_logger import log
+
+GLOBAL_SCOPE = "global"
+
+CounterKey = Tuple[str, str]  # (владелец счетчика, период)
+
+
+class Budget(NamedTuple):
+    """
+    Лимит расхода токенов: владелец ("user" или "global"), период ("d" - день, "m" - месяц) и лимит.
+    """
+    owner: str
+    period: str
+    limit: int
+
+
+class QuotaExceededError(Exception):
+    """
+    Исключение, возникающее при исчерпании бюджета токенов.
+    """
+    def __init__(self, budget: Budget):
+        super().__init__(f"Token budget exceeded: {budget.owner}/{budget.period} ({budget.limit})")
+        self.budget = budget
+
+
+def user_scope(tg_id: int) -> str:
+    return f"user:{tg_id}"
+
+
+def period_key(period: str, now: Optional[datetime] = None) -> str:
+    """
+    Ключ текущего периода: "d:2024-06-01" для дня, "m:2024-06" для месяца.
+    """
+    now = now or datetime.now()
+    return f"d:{now:%Y-%m-%d}" if period == "d" else f"m:{now:%Y-%m}"
+
+
+class TokenQuotas:
+    """
+    Дневные и месячные бюджеты токенов LLM на пользователя и на весь бот.
+
+    Счетчики хранятся в памяти процесса: проверка перед запросом к модели не обращается к БД
+    (кроме первой проверки пользователя в процессе, когда его счетчики загружаются из БД).
+    Прирост расхода периодически записывается в таблицу token_usage атомарным увеличением,
+    после чего счетчики перечитываются, чтобы учитывать расход других процессов бота.
+
+    :param budgets: Лимиты расхода (лимит 0 - без ограничения).
+    :param flush_interval: Интервал записи расхода в БД в секундах.
+    """
+    def __init__(self, budgets: List[Budget], flush_interval: float):
+        self.budgets = [budget for budget in budgets if budget.limit > 0]
+        self.flush_interval = flush_interval
+        self._used: Dict[CounterKey, int] = {}  # расход с учетом еще не записанного в БД
+        self._pending: Dict[CounterKey, int] = {}  # прирост, еще не записанный в БД
+        self._loaded: Set[CounterKey] = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def _keys(self, tg_id: int) -> List[Tuple[Budget, CounterKey]]:
+        now = datetime.now()
+        return [(budget, (GLOBAL_SCOPE if budget.owner == "global" else user_scope(tg_id),
+                          period_key(budget.period, now)))
+                for budget in self.budgets]
+
+    async def _load(self, keys: List[CounterKey]) -> None:
+        missing = [key for key in keys if key not in self._loaded]
+        if not missing:
+            return
+        stored = await get_token_usage([scope for scope, _ in missing], [period for _, period in missing])
+        for key in missing:
+            self._used[key] = stored.get(key, 0) + self._pending.get(key, 0)
+            self._loaded.add(key)
+
+    async def usage(self, tg_id: int) -> List[Tuple[Budget, int]]:
+        """
+        Возвращает расход по каждому бюджету, применимому к пользователю.
+
+        :param tg_id: Telegram ID пользователя.
+        :return: Пары (бюджет, израсходовано токенов).
+        """
+        keys = self._keys(tg_id)
+        if any(key not in self._loaded for _, key in keys):
+            # загрузка не должна пересекаться с выгрузкой, иначе выгружаемый прирост не будет учтен
+            async with self._lock:
+                await self._load([key for _, key in keys])
+        return [(budget, self._used.get(key, 0)) for budget, key in keys]
+
+    async def check(self, tg_id: int, expected: int = 0) -> None:
+        """
+        Проверяет бюджеты перед запросом к модели.
+
+        :param tg_id: Telegram ID пользователя.
+        :param expected: Оценка расхода токенов запроса.
+        :raises QuotaExceededError: Если хотя бы один бюджет исчерпан или будет превышен запросом.
+        """
+        for budget, used in await self.usage(tg_id):
+            if used >= budget.limit or used + expected > budget.limit:
+                raise QuotaExceededError(budget)
+
+    def record(self, tg_id: int, tokens: int) -> None:
+        """
+        Учитывает израсходованные токены (в БД записываются при следующей выгрузке).
+
+        :param tg_id: Telegram ID пользователя.
+        :param tokens: Количество токенов.
+        """
+        if tokens <= 0:
+            return
+        now = datetime.now()
+        keys = {(user_scope(tg_id), period_key(period, now)) for period in ("d", "m")}
+        keys |= {(GLOBAL_SCOPE, period_key(period, now)) for period in ("d", "m")}
+        for key in keys:
+            self._pending[key] = self._pending.get(key, 0) + tokens
+            if key in self._loaded:
+                self._used[key] = self._used.get(key, 0) + tokens
+
+    async def flush(self) -> None:
+        """
+        Записывает накопленный расход в БД и перечитывает загруженные счетчики текущих периодов.
+        """
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            try:
+                await add_token_usage(pending)
+            except Exception:
+                # вернем прирост, чтобы записать его при следующей выгрузке
+                for key, tokens in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + tokens
+                raise
+
+            now = datetime.now()
+            current = {period_key("d", now), period_key("m", now)}
+            # счетчики прошедших периодов больше не нужны; текущие перечитываются при следующей проверке
+            self._loaded = set()
+            self._used = {key: tokens for key, tokens in self._used.items()
+                          if key[0] == GLOBAL_SCOPE and key[1] in current}
+            if self._used:
+                await self._load(list(self._used))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"Failed to flush token usage: {repr(e)}")
+
+    async def start(self) -> None:
+        """
+        Запускает периодическую выгрузку расхода в БД (вызывается при запуске диспетчера).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="token-quotas-flush")
+
+    async def stop(self) -> None:
+        """
+        Останавливает периодическую выгрузку и записывает оставшийся расход.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+token_quotas = TokenQuotas(
+    budgets=[
+        Budget("user", "d", config.TOKEN_QUOTA_USER_DAILY),
+        Budget("user", "m", config.TOKEN_QUOTA_USER_MONTHLY),
+        Budget("global", "d", config.TOKEN_QUOTA_GLOBAL_DAILY),
+        Budget("global", "m", config.TOKEN_QUOTA_GLOBAL_MONTHLY),
+    ],
+    flush_interval=config.TOKEN_QUOTA_FLUSH_INTERVAL,
+)
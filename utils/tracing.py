@@ -0,0 +1,238 @@
+# utils/tracing.py
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, Iterator, List, Optional, TypeVar
+
+from config_data import config
+from utils.loguru_logger import log
+
+if TYPE_CHECKING:
+    from loguru import Record
+
+F = TypeVar('F', bound=Callable[..., Coroutine[Any, Any, Any]])
+
+NO_TRACE = "-"
+
+
+class Span:
+    """
+    Отрезок трассировки: операция с началом, длительностью и атрибутами внутри трассы одного апдейта.
+
+    :param name: Название операции.
+    :param trace_id: ID трассы (общий для всех отрезков апдейта).
+    :param parent_id: ID родительского отрезка (None - корневой отрезок).
+    :param sampled: Выгружается ли трасса.
+    :param attributes: Атрибуты операции.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes", "status", "start",
+                 "duration", "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self.duration = 0.0
+        self._started = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        """
+        Добавляет атрибуты к отрезку.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_trace_id() -> str:
+    """
+    Возвращает ID трассы текущего апдейта или задачи ("-", если трассы нет).
+    """
+    span = _current_span.get()
+    return span.trace_id if span is not None else NO_TRACE
+
+
+class Tracer:
+    """
+    Легковесная трассировка обработки апдейтов: ID трассы передается через contextvars в промежуточное ПО,
+    обработчики, запросы к БД и внешним API, проставляется в каждую запись журнала, а завершенные отрезки
+    выгружаются пакетами в JSONL-файл (заменитель коллектора трасс).
+
+    :param path: Путь к файлу отрезков ("" - отрезки не выгружаются, ID трасс только проставляются в журнал).
+    :param sample_rate: Доля выгружаемых трасс (от 0 до 1).
+    :param flush_interval: Интервал записи накопленных отрезков в секундах.
+    :param max_buffer: Максимум отрезков в памяти между записями (лишние отбрасываются).
+    """
+    def __init__(self, path: str, sample_rate: float, flush_interval: float, max_buffer: int = 50_000):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.sample_rate = sample_rate if path else 0.0
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer: List[str] = []
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def _export(self, span: Span) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[Span]:
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span._started
+            if span.sampled:
+                self._export(span)
+
+    @contextmanager
+    def trace(self, name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Начинает новую трассу (обработка апдейта, выполнение фоновой задачи).
+
+        :param name: Название корневой операции.
+        :param trace_id: ID продолжаемой трассы (например, сохраненный при постановке задачи в очередь).
+        :param attributes: Атрибуты операции.
+        """
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        span = Span(name, trace_id or os.urandom(16).hex(), None, sampled, attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Выполняет блок как дочерний отрезок текущей трассы (вне трассы - без трассировки).
+
+        :param name: Название операции.
+        :param attributes: Атрибуты операции.
+        """
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            yield None
+            return
+        span = Span(name, parent.trace_id, parent.span_id, True, attributes)
+        with self._activate(span):
+            yield span
+
+    def record(self, name: str, duration: float, **attributes: Any) -> None:
+        """
+        Добавляет завершенный дочерний отрезок текущей трассы (для синхронных событий, например, SQL-запросов,
+        где контекст нельзя менять).
+
+        :param name: Название операции.
+        :param duration: Длительность в секундах.
+        :param attributes: Атрибуты операции.
+        """
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        span = Span(name, parent.trace_id, parent.span_id, True, attributes)
+        span.start -= duration
+        span.duration = duration
+        self._export(span)
+
+    def traced(self, name: Optional[str] = None) -> Callable[[F], F]:
+        """
+        Декоратор, выполняющий асинхронную функцию как дочерний отрезок текущей трассы.
+
+        :param name: Название операции (по умолчанию - имя функции).
+        """
+        def decorator(func: F) -> F:
+            span_name = name or func.__name__
+
+            @wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+    async def flush(self) -> None:
+        """
+        Записывает накопленные отрезки в файл.
+        """
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            log.error(f"Failed to write {len(lines)} trace spans to {self.path}: {repr(e)}")
+        if self.dropped:
+            log.warning(f"{self.dropped} trace spans dropped: buffer is full")
+            self.dropped = 0
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        """
+        Запускает периодическую запись отрезков (если выгрузка включена).
+        """
+        if self.path and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="tracing-flush")
+
+    async def stop(self) -> None:
+        """
+        Останавливает периодическую запись и записывает оставшиеся отрезки.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+def _stamp_trace_id(record: "Record") -> None:
+    record["extra"]["trace_id"] = current_trace_id()
+
+
+# ID трассы в каждой записи журнала (в том числе записанной в фоновом потоке: патчер выполняется при вызове)
+log.configure(patcher=_stamp_trace_id)
+
+tracer = Tracer(
+    path=config.TRACING_PATH,
+    sample_rate=config.TRACING_SAMPLE_RATE,
+    flush_interval=config.TRACING_FLUSH_INTERVAL,
+)
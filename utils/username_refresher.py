@@ -0,0 +1,109 @@
+# utils/username_refresher.py
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config_data import config
+from database.requests import get_users_to_refresh, save_refreshed_usernames
+from utils.rate_limiter import BaseRateLimiter
+from utils.storage_factory import create_rate_limiter
+from utils.loguru_logger import log
+
+TELEGRAM_API_KEY = "bot_api"  # единственное ведро общего ограничителя фоновых запросов к Bot API
+
+
+class UsernameRefresher:
+    """
+    Фоновая сверка имен пользователей из таблицы users с Telegram: обходит пользователей пакетами,
+    запрашивает getChat через общий ограничитель частоты, сохраняет изменившиеся имена пакетным UPDATE
+    и отмечает время сверки, чтобы каждый пользователь сверялся не чаще раза в max_age секунд.
+
+    :param limiter: Ограничитель частоты фоновых запросов к Bot API.
+    :param batch_size: Количество пользователей в пакете.
+    :param max_age: Минимальный интервал между сверками одного пользователя в секундах.
+    :param idle_interval: Пауза в секундах, когда сверять некого.
+    """
+    def __init__(self, limiter: BaseRateLimiter, batch_size: int, max_age: float, idle_interval: float):
+        self.limiter = limiter
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.idle_interval = idle_interval
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def _acquire(self) -> None:
+        while (retry_after := await self.limiter.consume(TELEGRAM_API_KEY)) > 0:
+            await asyncio.sleep(retry_after)
+
+    async def _fetch_username(self, bot: Bot, tg_id: int, current: Optional[str]) -> Optional[str]:
+        while True:
+            await self._acquire()
+            try:
+                chat = await bot.get_chat(tg_id)
+                return chat.username
+            except TelegramRetryAfter as e:
+                log.warning(f"Username refresh is throttled by Telegram for {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                # пользователь заблокировал бота или недоступен: оставляем сохраненное имя
+                log.debug(f"Can't refresh username for {tg_id}: {e.message}")
+                return current
+
+    async def refresh_batch(self, bot: Bot) -> int:
+        """
+        Сверяет один пакет пользователей.
+
+        :param bot: Экземпляр бота.
+        :return: Количество сверенных пользователей.
+        """
+        users = await get_users_to_refresh(datetime.now() - timedelta(seconds=self.max_age), self.batch_size)
+        changed: Dict[int, Optional[str]] = {}
+        refreshed: List[int] = []
+        for user_id, tg_id, username in users:
+            new_username = await self._fetch_username(bot, tg_id, username)
+            if new_username != username:
+                changed[user_id] = new_username
+            refreshed.append(user_id)
+        if refreshed:
+            await save_refreshed_usernames(changed, refreshed)
+        return len(refreshed)
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            try:
+                if await self.refresh_batch(bot) < self.batch_size:
+                    await asyncio.sleep(self.idle_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Error refreshing usernames: {repr(e)}")
+                await asyncio.sleep(min(self.idle_interval, 30.0))
+
+    def start(self, bot: Bot) -> None:
+        """
+        Запускает фоновую сверку.
+
+        :param bot: Экземпляр бота.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot), name="username-refresher")
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую сверку (сверенные, но не сохраненные имена текущего пакета будут сверены повторно).
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+username_refresher = UsernameRefresher(
+    limiter=create_rate_limiter("telegram_api", config.TELEGRAM_API_RATE, config.TELEGRAM_API_BURST),
+    batch_size=config.USERNAME_REFRESH_BATCH,
+    max_age=config.USERNAME_REFRESH_MAX_AGE,
+    idle_interval=config.USERNAME_REFRESH_IDLE,
+)
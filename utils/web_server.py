@@ -0,0 +1,77 @@
+# utils/web_server.py
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config_data import config
+from utils.loguru_logger import log
+from utils.metrics import add_metrics_route
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot) -> web.Application:
+    """
+    Создает aiohttp-приложение, принимающее апдейты Telegram по вебхуку.
+
+    :param dispatcher: Диспетчер бота.
+    :param bot: Экземпляр бота.
+    :return: aiohttp-приложение.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET,
+    ).register(app, path=config.WEBHOOK_PATH)
+    # события запуска/остановки диспетчера привязываются к жизненному циклу приложения
+    setup_application(app, dispatcher, bot=bot)
+    if config.METRICS_ENABLED:
+        add_metrics_route(app)
+    return app
+
+
+async def serve_app(app: web.Application, host: str = config.WEBHOOK_HOST,
+                    port: int = config.WEBHOOK_PORT) -> None:
+    """
+    Запускает aiohttp-приложение и обслуживает запросы до отмены задачи.
+
+    :param app: aiohttp-приложение.
+    :param host: Адрес, на котором слушает сервер.
+    :param port: Порт сервера.
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    log.info(f"HTTP server is listening on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        log.info("HTTP server stopped")
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    """
+    Регистрирует вебхук в Telegram и обслуживает входящие апдейты встроенным aiohttp-сервером.
+    TLS предполагается завершенным на обратном прокси: бот слушает обычный HTTP,
+    а Telegram обращается к публичному https-адресу WEBHOOK_BASE_URL.
+
+    :param dispatcher: Диспетчер бота.
+    :param bot: Экземпляр бота.
+    """
+    if not config.WEBHOOK_BASE_URL:
+        raise ValueError("WEBHOOK_BASE_URL must be set for DELIVERY_MODE=webhook")
+
+    app = create_webhook_app(dispatcher, bot)
+    webhook_url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=config.WEBHOOK_SECRET,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        drop_pending_updates=False,
+    )
+    log.info(f"Webhook is set to {webhook_url}")
+    await serve_app(app)
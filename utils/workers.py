@@ -0,0 +1,95 @@
+# utils/workers.py
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+from config_data import config
+from utils.loguru_logger import log
+
+T = TypeVar('T')
+
+
+class PoolOverloadedError(RuntimeError):
+    """
+    Исключение, возникающее, когда очередь пула переполнена и новая задача не может быть принята.
+    """
+
+
+class BoundedExecutor:
+    """
+    Ограниченный пул потоков или процессов для выполнения блокирующих задач вне цикла событий.
+
+    Одновременно в пул передается не более max_workers задач, остальные ждут своей очереди.
+    Если ожидающих задач больше max_pending, новые задачи отклоняются (backpressure).
+
+    :param max_workers: Количество рабочих потоков/процессов.
+    :param max_pending: Максимальное количество задач (выполняемых и ожидающих).
+    :param use_processes: Использовать пул процессов вместо пула потоков.
+    """
+    def __init__(self, max_workers: int, max_pending: int, use_processes: bool = True):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество задач, принятых пулом и еще не завершенных.
+        """
+        return self._pending
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                # spawn: дочерние процессы не наследуют потоки и соединения родителя
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='report-worker')
+            log.info(f"Worker pool started: workers={self.max_workers}, processes={self.use_processes}")
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Выполняет функцию в пуле и возвращает ее результат.
+
+        :param func: Функция для выполнения (для пула процессов - импортируемая функция модуля).
+        :param args: Аргументы функции.
+        :return: Результат выполнения функции.
+        :raises PoolOverloadedError: Если очередь пула переполнена.
+        """
+        if self._pending >= self.max_pending:
+            log.warning(f"Worker pool is overloaded: {self._pending} pending tasks")
+            raise PoolOverloadedError("Worker pool queue is full")
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), partial(func, *args))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        """
+        Останавливает пул, дожидаясь завершения уже переданных задач.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            log.info("Worker pool stopped")
+
+
+# Пул для формирования и сжатия отчетов /history, /high и /low
+report_executor = BoundedExecutor(max_workers=config.REPORT_POOL_WORKERS,
+                                  max_pending=config.REPORT_POOL_MAX_PENDING,
+                                  use_processes=config.REPORT_POOL_USE_PROCESSES)